@@ -1,18 +1,25 @@
 __version__='0.0.2'
 __author__ ='Matan Carmon'
-__date__ = November 2023'
+__date__ = 'November 2023'
 
 
+import itertools
+import time
+
+import numpy as np
 import pandas as pd
 import rpy2.robjects as robjects
 from rpy2.robjects import pandas2ri
 
+import r_parallel
+from numeric_methods import KNNIndex
+
 # Activate automatic conversion of pandas objects to R objects
 pandas2ri.activate()
 
 # Install and import necessary R packages
 # Make sure to install these packages in your R environment before running this code
-# Example: install.packages(c("nnet", "class", "kernlab"))
+# Example: install.packages(c("nnet", "class", "kernlab", "randomForest", "e1071", "rpart"))
 robjects.r('''
     if (!requireNamespace("nnet", quietly = TRUE)) {
         install.packages("nnet")
@@ -23,9 +30,21 @@ robjects.r('''
     if (!requireNamespace("kernlab", quietly = TRUE)) {
         install.packages("kernlab")
     }
+    if (!requireNamespace("randomForest", quietly = TRUE)) {
+        install.packages("randomForest")
+    }
+    if (!requireNamespace("e1071", quietly = TRUE)) {
+        install.packages("e1071")
+    }
+    if (!requireNamespace("rpart", quietly = TRUE)) {
+        install.packages("rpart")
+    }
     library(nnet)
     library(class)
     library(kernlab)
+    library(randomForest)
+    library(e1071)
+    library(rpart)
 ''')
 
 class ClassificationModels:
@@ -111,19 +130,40 @@ class ClassificationModels:
         nn_fit = robjects.r['nnet'](formula, data=self.data, size=size)
         return nn_fit
 
-    def k_nearest_neighbors(self, k=5):
+    def k_nearest_neighbors(self, k=5, test=None):
         """
         Perform classification using K-Nearest Neighbors (K-NN).
 
         Args:
             k (int): Number of neighbors to consider. Default is 5.
+            test (pandas.DataFrame): The query points. If None, the training points are classified.
 
         Returns:
-            R object: The K-NN model.
+            R object: The predicted classes of the query points.
         """
-        knn_fit = robjects.r['knn'](self.data, self.target, k=k)
+        features = self.data.drop(columns=[self.target])
+        if test is None:
+            test = features
+        else:
+            test = test.drop(columns=[self.target], errors='ignore')
+        knn_fit = robjects.r['knn'](features, test, pd.Categorical(self.data[self.target]), k=k)
         return knn_fit
 
+    def knn_index(self, leafsize=16):
+        """
+        Build a reusable spatial index for K-Nearest Neighbors queries.
+
+        Unlike k_nearest_neighbors, the training points are indexed once in a KD-tree, so
+        later queries do not scan the whole training set.
+
+        Args:
+            leafsize (int): Number of points in the leaves of the KD-tree. Default is 16.
+
+        Returns:
+            KNNIndex: The index over the training features.
+        """
+        return KNNIndex(self.data.drop(columns=[self.target]), self.data[self.target], leafsize=leafsize)
+
     def naive_bayes(self):
         """
         Perform classification using Naive Bayes.
@@ -135,6 +175,253 @@ class ClassificationModels:
         nb_fit = robjects.r['naiveBayes'](formula, data=self.data)
         return nb_fit
 
+    def cross_validate(self, method, params=None, folds=5, n_jobs=None, seed=None):
+        """
+        Estimate the accuracy of one classifier configuration with k-fold cross-validation.
+
+        Args:
+            method (str): Name of the classifier method, e.g. 'random_forest'.
+            params (dict): Keyword arguments for the method. Default is the method defaults.
+            folds (int): Number of folds. Default is 5.
+            n_jobs (int): Number of worker processes. If None, one per CPU.
+            seed (int): Seed for the fold assignment.
+
+        Returns:
+            pandas.DataFrame: One row per fold with the accuracy, fit and predict times.
+        """
+        param_grid = {name: [value] for name, value in (params or {}).items()}
+        return self._run_cross_validation(method, param_grid, folds, n_jobs, seed, None)
+
+    def grid_search(self, method, param_grid, folds=5, n_jobs=None, seed=None, early_stopping=None):
+        """
+        Cross-validate every combination of a parameter grid across a pool of R workers.
+
+        The data is sent to each worker once and the (params x folds) jobs are spread over
+        the pool. With early_stopping, the folds are run one round at a time and a
+        configuration is dropped as soon as its mean accuracy trails the best one by more
+        than early_stopping.
+
+        Args:
+            method (str): Name of the classifier method, e.g. 'svm'.
+            param_grid (dict): Maps each parameter name to the list of values to try.
+            folds (int): Number of folds. Default is 5.
+            n_jobs (int): Number of worker processes. If None, one per CPU.
+            seed (int): Seed for the fold assignment.
+            early_stopping (float): Accuracy margin behind the best configuration after which
+                a configuration stops being evaluated. Default is None (no early stopping).
+
+        Returns:
+            pandas.DataFrame: One row per configuration, best first, with the mean and standard
+                deviation of the accuracy, the mean fit and predict times and the number of folds run.
+        """
+        results = self._run_cross_validation(method, param_grid, folds, n_jobs, seed, early_stopping)
+        results['params'] = results['params'].map(lambda params: tuple(sorted(params.items())))
+        summary = results.groupby('params', sort=False).agg(mean_accuracy=('accuracy', 'mean'),
+                                                            std_accuracy=('accuracy', 'std'),
+                                                            mean_fit_time=('fit_time', 'mean'),
+                                                            mean_predict_time=('predict_time', 'mean'),
+                                                            folds_run=('fold', 'count'),
+                                                            errors=('error', 'count'))
+        summary = summary.sort_values('mean_accuracy', ascending=False).reset_index()
+        summary['params'] = summary['params'].map(dict)
+        return summary
+
+    def predict(self, model, data, type='class', chunksize=100000, n_jobs=1):
+        """
+        Score data with a fitted model, one chunk at a time.
+
+        Only one chunk per worker is converted to R at any time, so memory stays bounded
+        whatever the size of the data. With n_jobs > 1 the model is serialized once and every
+        worker process keeps its own copy for all the chunks it scores.
+
+        Args:
+            model (R object): A model returned by one of the classifier methods.
+            data (pandas.DataFrame or iterable): The rows to score, or an iterator of DataFrame chunks.
+                The target column is dropped if present.
+            type (str): 'class' for class labels or 'prob' for class probabilities. Default is 'class'.
+            chunksize (int): Number of rows per chunk when data is a DataFrame. Default is 100000.
+            n_jobs (int): Number of worker processes. Default is 1 (score in this process).
+
+        Yields:
+            numpy.ndarray: The predicted labels, or (rows x classes) probabilities, of each chunk.
+        """
+        if isinstance(data, pd.DataFrame):
+            chunks = (data.iloc[start:start + chunksize] for start in range(0, len(data), chunksize))
+        else:
+            chunks = iter(data)
+        chunks = (chunk.drop(columns=[self.target], errors='ignore') for chunk in chunks)
+        if n_jobs == 1:
+            for chunk in chunks:
+                yield _predict(model, chunk, type)
+            return
+        state = {'serialized_model': r_parallel.r_serialize(model), 'type': type}
+        with r_parallel.WorkerPool(n_jobs, state) as pool:
+            yield from pool.imap(_predict_job, chunks)
+
+    def _run_cross_validation(self, method, param_grid, folds, n_jobs, seed, early_stopping):
+        """
+        Internal method running the cross-validation jobs of a parameter grid.
+
+        Args:
+            method (str): Name of the classifier method.
+            param_grid (dict): Maps each parameter name to the list of values to try.
+            folds (int): Number of folds.
+            n_jobs (int): Number of worker processes.
+            seed (int): Seed for the fold assignment.
+            early_stopping (float): Accuracy margin for dropping configurations, or None.
+
+        Returns:
+            pandas.DataFrame: One row per (params, fold) job that was run.
+        """
+        if method not in CLASSIFIERS:
+            raise ValueError(f"Invalid method. Supported methods are {', '.join(CLASSIFIERS)}.")
+        names = sorted(param_grid)
+        configs = [dict(zip(names, values)) for values in itertools.product(*(param_grid[name] for name in names))]
+        fold_ids = np.arange(len(self.data)) % folds
+        np.random.default_rng(seed).shuffle(fold_ids)
+        data = self.data.copy()
+        data[self.target] = pd.Categorical(data[self.target])
+        state = {'data': data, 'target': self.target, 'fold_ids': fold_ids}
+
+        rows = []
+        with r_parallel.WorkerPool(n_jobs, state) as pool:
+            if early_stopping is None:
+                jobs = [(method, params, fold) for params in configs for fold in range(folds)]
+                rows = pool.map(_cross_validation_job, jobs)
+            else:
+                scores = [[] for _ in configs]
+                alive = list(range(len(configs)))
+                for fold in range(folds):
+                    results = pool.map(_cross_validation_job, [(method, configs[i], fold) for i in alive])
+                    rows.extend(results)
+                    for i, result in zip(alive, results):
+                        scores[i].append(result['accuracy'])
+                    # Failed jobs count as zero accuracy so that broken configurations are dropped too
+                    means = {i: np.mean(np.nan_to_num(scores[i])) for i in alive}
+                    best = max(means.values())
+                    alive = [i for i in alive if means[i] >= best - early_stopping]
+        return pd.DataFrame(rows, columns=['method', 'params', 'fold', 'accuracy', 'fit_time', 'predict_time', 'error'])
+
+
+# Classifier methods of ClassificationModels, by name
+CLASSIFIERS = ('random_forest', 'svm', 'logistic_regression', 'decision_tree',
+               'neural_network', 'k_nearest_neighbors', 'naive_bayes')
+
+
+# Classes of the response of a binomial glm, the first one being the failure: the factor levels, or the
+# sorted distinct values of a numeric (0/1) or logical response, which have no levels
+_glm_levels = robjects.r('''
+    function(fit) {
+        response <- fit$model[[1]]
+        if (is.factor(response)) levels(response) else as.character(sort(unique(response)))
+    }
+''')
+
+
+def _predict(model, newdata, type='class'):
+    """
+    Score new data with a fitted R classifier.
+
+    The prediction call depends on the R class of the model. Labels are returned as strings,
+    as R gives them, and probabilities as one column per class, in the order of the class levels.
+
+    Args:
+        model (R object): A model returned by one of the ClassificationModels methods.
+        newdata (pandas.DataFrame): The features to score.
+        type (str): 'class' for class labels or 'prob' for class probabilities. Default is 'class'.
+
+    Returns:
+        numpy.ndarray: The predicted labels, or a (rows x classes) array of probabilities.
+    """
+    kind = robjects.r['class'](model)[0]
+    if type == 'class':
+        if kind == 'glm':
+            levels = list(_glm_levels(model))
+            if len(levels) != 2:
+                raise ValueError(f"Cannot predict classes with a logistic regression whose response has "
+                                 f"{len(levels)} distinct values; fit it on a binary target.")
+            prob = np.asarray(robjects.r['predict'](model, newdata=newdata, type='response'))
+            return np.where(prob > 0.5, levels[1], levels[0])
+        if kind in ('rpart', 'nnet', 'nnet.formula'):
+            labels = robjects.r['predict'](model, newdata=newdata, type='class')
+        else:
+            labels = robjects.r['predict'](model, newdata=newdata)
+        return np.asarray(robjects.r['as.character'](labels))
+    if type != 'prob':
+        raise ValueError("Invalid type. Supported types are 'class' and 'prob'.")
+
+    if kind == 'glm':
+        prob = robjects.r['predict'](model, newdata=newdata, type='response')
+    elif kind in ('randomForest', 'randomForest.formula', 'rpart'):
+        prob = robjects.r['predict'](model, newdata=newdata, type='prob')
+    elif kind in ('nnet', 'nnet.formula', 'naiveBayes'):
+        prob = robjects.r['predict'](model, newdata=newdata, type='raw')
+    elif kind in ('svm', 'svm.formula'):
+        prob = robjects.r['attr'](robjects.r['predict'](model, newdata=newdata, probability=True), 'probabilities')
+        if robjects.r['is.null'](prob)[0]:
+            raise ValueError("The SVM was not fitted with probability=True.")
+    else:
+        raise ValueError(f"Cannot predict probabilities with a '{kind}' model.")
+    prob = np.asarray(robjects.r['as.vector'](prob), dtype=float).reshape((len(newdata), -1), order='F')
+    if prob.shape[1] == 1:
+        # Binary models only give the probability of the second class
+        prob = np.column_stack([1 - prob[:, 0], prob[:, 0]])
+    return prob
+
+
+def _predict_job(chunk):
+    """
+    Score one chunk in a worker, with the model shipped to the pool.
+
+    Args:
+        chunk (pandas.DataFrame): The features to score.
+
+    Returns:
+        numpy.ndarray: The predictions for the chunk.
+    """
+    state = r_parallel.worker_state()
+    if 'model' not in state:
+        # Rebuild the model once per worker, then reuse it for every chunk
+        state['model'] = r_parallel.r_unserialize(state.pop('serialized_model'))
+    return _predict(state['model'], chunk, state['type'])
+
+
+def _cross_validation_job(job):
+    """
+    Fit and score one (params, fold) cross-validation job in a worker.
+
+    Args:
+        job (tuple): The method name, its keyword arguments and the held-out fold.
+
+    Returns:
+        dict: The job description with its accuracy, timings and error message, if any.
+    """
+    method, params, fold = job
+    state = r_parallel.worker_state()
+    data, target, fold_ids = state['data'], state['target'], state['fold_ids']
+    train, test = data[fold_ids != fold], data[fold_ids == fold]
+    features = test.drop(columns=[target])
+    row = {'method': method, 'params': params, 'fold': fold,
+           'accuracy': np.nan, 'fit_time': np.nan, 'predict_time': np.nan, 'error': None}
+    try:
+        start = time.perf_counter()
+        if method == 'k_nearest_neighbors':
+            # K-NN has no fitted model, the training points are scanned at prediction time
+            row['fit_time'] = 0.0
+            labels = robjects.r['knn'](train.drop(columns=[target]), features, train[target], **params)
+            labels = np.asarray(robjects.r['as.character'](labels))
+        else:
+            model = getattr(ClassificationModels(train, target), method)(**params)
+            row['fit_time'] = time.perf_counter() - start
+            start = time.perf_counter()
+            labels = _predict(model, features)
+        row['predict_time'] = time.perf_counter() - start
+        row['accuracy'] = float(np.mean(labels == test[target].astype(str).to_numpy()))
+    except Exception as error:
+        row['error'] = str(error)
+    return row
+
+
 # Example usage:
 # data = pd.DataFrame({'feature1': [1, 2, 3, 4, 5],
 #                      'feature2': [10, 15, 20, 25, 30],
@@ -147,3 +434,9 @@ class ClassificationModels:
 # nn_model = classification_models.neural_network()
 # knn_model = classification_models.k_nearest_neighbors()
 # nb_model = classification_models.naive_bayes()
+# results = classification_models.grid_search('svm', {'kernel': ['linear', 'radial'], 'cost': [0.1, 1, 10]},
+#                                             folds=5, n_jobs=4, early_stopping=0.1)
+# for labels in classification_models.predict(rf_model, pd.read_csv('big.csv', chunksize=100000), n_jobs=4):
+#     ...
+# knn_index = classification_models.knn_index()
+# knn_labels = knn_index.predict(data, k=3)
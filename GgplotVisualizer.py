@@ -2,11 +2,20 @@ __version__='0.0.32'
 __author__ ='Matan Carmon'
 __date__ = 'October 2023'
 
+import os
+import tempfile
+import time
+
+import numpy as np
 import pandas as pd
 import rpy2.robjects as robjects
 from rpy2.robjects import pandas2ri
 from rpy2.robjects.packages import importr
 
+import r_parallel
+import result_cache
+from numeric_methods import HISTOGRAM_ARGS, bin_2d, histogram, kde, lttb, pairwise_summaries
+
 # Activate automatic conversion of pandas objects to R objects
 pandas2ri.activate()
 
@@ -18,14 +27,33 @@ class GgplotVisualizer:
     Interface to create visualizations using ggplot through rpy2.
     """
 
-    def __init__(self, data):
+    def __init__(self, data, max_points=None, bins=100, seed=None, cache=None):
         """
         Initialize the GgplotVisualizer object with the data.
 
         Args:
             data (pandas.DataFrame): The input data.
+            max_points (int): Above this number of rows, the data is reduced before it reaches R:
+                scatterplots are binned on a grid, lines downsampled with LTTB, histograms and
+                densities precomputed and scatterplot matrices sampled. Default is None (never).
+            bins (int): Number of grid cells per axis for binned scatterplots. Default is 100.
+            seed (int): Seed of the random sample of the scatterplot matrix.
+            cache (result_cache.DiskCache): Cache for the images made by render(). Default is None.
         """
         self.data = data
+        self.max_points = max_points
+        self.bins = bins
+        self.seed = seed
+        self.cache = cache
+
+    def _reduce(self):
+        """
+        Internal method telling whether the data is too large to be sent to R as is.
+
+        Returns:
+            bool: True if the data must be reduced first.
+        """
+        return self.max_points is not None and len(self.data) > self.max_points
 
     def scatterplot(self, x, y, **kwargs):
         """
@@ -39,6 +67,9 @@ class GgplotVisualizer:
         Returns:
             R object: The ggplot object.
         """
+        if self._reduce():
+            binned = bin_2d(self.data[x], self.data[y], self.bins)
+            return ggplot2.ggplot(binned) + ggplot2.aes_string(x=x, y=y, fill='count') + ggplot2.geom_tile(**kwargs)
         p = ggplot2.ggplot(self.data) + ggplot2.aes_string(x=x, y=y) + ggplot2.geom_point(**kwargs)
         return p
 
@@ -54,7 +85,12 @@ class GgplotVisualizer:
         Returns:
             R object: The ggplot object.
         """
-        p = ggplot2.ggplot(self.data) + ggplot2.aes_string(x=x, y=y) + ggplot2.geom_line(**kwargs)
+        data = self.data
+        if self._reduce():
+            # Missing points are dropped, as geom_line does, before they can poison the bucket means
+            data = data.dropna(subset=[x, y]).sort_values(x)
+            data = data.iloc[lttb(data[x], data[y], self.max_points)]
+        p = ggplot2.ggplot(data) + ggplot2.aes_string(x=x, y=y) + ggplot2.geom_line(**kwargs)
         return p
 
     def histogram(self, x, **kwargs):
@@ -63,11 +99,22 @@ class GgplotVisualizer:
 
         Args:
             x (str): The column name for the x-axis.
-            kwargs: Additional arguments to pass to ggplot.
+            kwargs: Additional arguments to pass to ggplot. Above max_points, the binning arguments
+                bins, binwidth, boundary, center, breaks and closed are applied in Python and the
+                other ones passed to geom_rect.
 
         Returns:
             R object: The ggplot object.
         """
+        if self._reduce():
+            binning = {name: kwargs.pop(name) for name in HISTOGRAM_ARGS if name in kwargs}
+            unsupported = sorted(set(kwargs) & {'pad', 'stat', 'orientation'})
+            if unsupported:
+                raise ValueError(f"{', '.join(unsupported)} not supported with max_points, "
+                                 "the histogram is binned in Python.")
+            counts = histogram(self.data[x], **binning)
+            return (ggplot2.ggplot(counts) + ggplot2.aes_string(xmin='xmin', xmax='xmax', ymin=0, ymax='count')
+                    + ggplot2.geom_rect(**kwargs) + ggplot2.labs(x=x, y='count'))
         p = ggplot2.ggplot(self.data) + ggplot2.aes_string(x=x) + ggplot2.geom_histogram(**kwargs)
         return p
 
@@ -112,6 +159,10 @@ class GgplotVisualizer:
         Returns:
             R object: The ggplot object.
         """
+        if self._reduce():
+            density = kde(self.data[x])
+            return (ggplot2.ggplot(density) + ggplot2.aes_string(x=x, y='density')
+                    + ggplot2.geom_density(stat='identity', **kwargs))
         p = ggplot2.ggplot(self.data) + ggplot2.aes_string(x=x) + ggplot2.geom_density(**kwargs)
         return p
 
@@ -130,19 +181,148 @@ class GgplotVisualizer:
         p = ggplot2.ggplot(self.data) + ggplot2.aes_string(x=x, y=y) + ggplot2.geom_violin(**kwargs)
         return p
 
-    def scatter_matrix(self, **kwargs):
+    def scatter_matrix(self, scalable=False, bins=30, n_jobs=1, **kwargs):
         """
         Create a scatterplot matrix.
 
+        In scalable mode, the numeric columns are summarized first: correlations, per-column
+        histograms and per-pair 2D bin counts, computed from one binning pass over the data.
+        The matrix is drawn from these summaries (bin counts below the diagonal, histograms on
+        it and correlations above it), so the rendering cost does not depend on the number of rows.
+
         Args:
+            scalable (bool): Whether to draw the matrix from precomputed summaries. Default is False.
+            bins (int): Number of bins per column in scalable mode. Default is 30.
+            n_jobs (int): Number of threads counting the pairs in scalable mode. Default is 1.
             kwargs: Additional arguments to pass to ggplot.
 
         Returns:
             R object: The ggplot object.
         """
-        p = ggplot2.ggpairs(self.data, **kwargs)
+        if scalable:
+            tiles, histograms, correlations = pairwise_summaries(self.data.select_dtypes('number'), bins, n_jobs)
+            return (ggplot2.ggplot()
+                    + ggplot2.geom_tile(data=tiles, mapping=ggplot2.aes_string(x='x', y='y', fill='count'), **kwargs)
+                    + ggplot2.geom_rect(data=histograms,
+                                        mapping=ggplot2.aes_string(xmin='xmin', xmax='xmax', ymin='ymin', ymax='ymax'))
+                    + ggplot2.geom_text(data=correlations, mapping=ggplot2.aes_string(x='x', y='y', label='label'))
+                    + ggplot2.facet_grid(robjects.Formula('row ~ col'), scales='free')
+                    + ggplot2.labs(x='', y=''))
+        data = self.data
+        if self._reduce():
+            data = data.sample(self.max_points, random_state=self.seed)
+        p = ggplot2.ggpairs(data, **kwargs)
         return p
 
+    def render(self, method, *args, width=7, height=5, device='png', dpi=300, **kwargs):
+        """
+        Create a plot and return the rendered image.
+
+        With a cache, the image is looked up by a fingerprint of the columns the plot uses, the
+        method, its arguments and the output size, so an unchanged plot is returned without
+        converting the data or calling R.
+
+        Args:
+            method (str): The name of the plot method, e.g. 'histogram'.
+            args: Positional arguments of the plot method (column names).
+            width (float): The width in inches. Default is 7.
+            height (float): The height in inches. Default is 5.
+            device (str): The ggsave device, also used as file extension. Default is 'png'.
+            dpi (int): The resolution of raster devices. Default is 300.
+            kwargs: Additional arguments of the plot method.
+
+        Returns:
+            bytes: The image file contents.
+        """
+        key = None
+        if self.cache is not None:
+            # Only column names select columns; other arguments (lists, dicts) are not hashable
+            columns = ([arg for arg in args if isinstance(arg, str) and arg in self.data.columns]
+                       or list(self.data.columns))
+            values = pd.util.hash_pandas_object(self.data[columns], index=False).to_numpy().tobytes()
+            key = result_cache.fingerprint(values, columns, [str(dtype) for dtype in self.data[columns].dtypes],
+                                           method, args, sorted(kwargs.items()), width, height, device, dpi,
+                                           self.max_points, self.bins, self.seed)
+            image = self.cache.get(key)
+            if image is not None:
+                return image
+        fd, path = tempfile.mkstemp(suffix=f'.{device}')
+        os.close(fd)
+        try:
+            self.save(method, *args, path=path, width=width, height=height, device=device, dpi=dpi, **kwargs)
+            with open(path, 'rb') as f:
+                image = f.read()
+        finally:
+            os.remove(path)
+        if key is not None:
+            self.cache.put(key, image)
+        return image
+
+    def save(self, method, *args, path, width=7, height=5, device=None, dpi=300, **kwargs):
+        """
+        Create a plot and write it to a file with ggsave.
+
+        Args:
+            method (str): The name of the plot method, e.g. 'scatterplot'.
+            args: Positional arguments of the plot method (column names).
+            path (str): The output file. The device is guessed from its extension if not given.
+            width (float): The width in inches. Default is 7.
+            height (float): The height in inches. Default is 5.
+            device (str): The ggsave device, e.g. 'png' or 'pdf'. Default is None.
+            dpi (int): The resolution of raster devices. Default is 300.
+            kwargs: Additional arguments of the plot method.
+
+        Returns:
+            str: The output file.
+        """
+        p = getattr(self, method)(*args, **kwargs)
+        options = {'device': device} if device is not None else {}
+        ggplot2.ggsave(filename=path, plot=p, width=width, height=height, dpi=dpi, **options)
+        return path
+
+def render_batch(frames, specs, n_jobs=None):
+    """
+    Render many plots to files across a pool of R worker processes.
+
+    Every DataFrame is sent to each worker once; the plot specifications only refer to them
+    by name. A plot that fails is reported instead of stopping the batch.
+
+    Args:
+        frames (dict): Maps a name to each DataFrame used by the plots.
+        specs (list): One dict per plot with the keys 'data' (a name from frames), 'method',
+            'path' and, optionally, 'args', 'kwargs', 'width', 'height', 'device', 'dpi' and
+            'options' (arguments of GgplotVisualizer, e.g. max_points).
+        n_jobs (int): Number of worker processes. If None, one per CPU.
+
+    Returns:
+        pandas.DataFrame: One row per plot with its path, render time in seconds and error, if any.
+    """
+    with r_parallel.WorkerPool(n_jobs, {'frames': frames}) as pool:
+        return pd.DataFrame(pool.imap(_render_job, specs), columns=['path', 'data', 'method', 'seconds', 'error'])
+
+
+def _render_job(spec):
+    """
+    Render one plot specification in a worker.
+
+    Args:
+        spec (dict): The plot specification, see render_batch().
+
+    Returns:
+        dict: The path, data name and method of the plot, with its render time and error, if any.
+    """
+    row = {'path': spec['path'], 'data': spec['data'], 'method': spec['method'], 'seconds': np.nan, 'error': None}
+    start = time.perf_counter()
+    try:
+        visualizer = GgplotVisualizer(r_parallel.worker_state()['frames'][spec['data']], **spec.get('options', {}))
+        size = {name: spec[name] for name in ('width', 'height', 'device', 'dpi') if name in spec}
+        visualizer.save(spec['method'], *spec.get('args', ()), path=spec['path'], **size, **spec.get('kwargs', {}))
+        row['seconds'] = time.perf_counter() - start
+    except Exception as error:
+        row['error'] = str(error)
+    return row
+
+
 # Example usage:
 # df = pd.DataFrame({'A': [1, 2, 3, 4, 5],
 #                    'B': [10, 15, 20, 25, 30],
@@ -156,3 +336,12 @@ class GgplotVisualizer:
 # densityplot = ggplot_visualizer.densityplot('B', fill="'yellow'")
 # violinplot = ggplot_visualizer.violinplot('C', 'B', fill="'purple'")
 # scatter_matrix = ggplot_visualizer.scatter_matrix()
+# large_visualizer = GgplotVisualizer(pd.concat([df] * 1000000, ignore_index=True), max_points=100000)
+# binned_scatterplot = large_visualizer.scatterplot('A', 'B')
+# ggplot_visualizer.save('scatterplot', 'A', 'B', path='scatter.png', width=6, height=4)
+# report = render_batch({'df': df}, [{'data': 'df', 'method': 'histogram', 'args': ['A'], 'path': 'hist.png'},
+#                                    {'data': 'df', 'method': 'boxplot', 'args': ['C', 'B'], 'path': 'box.pdf'}],
+#                       n_jobs=2)
+# cached_visualizer = GgplotVisualizer(df, cache=result_cache.DiskCache('plot_cache', max_bytes=10 ** 8))
+# png = cached_visualizer.render('histogram', 'A', width=6, height=4, fill="'green'")
+# scalable_matrix = ggplot_visualizer.scatter_matrix(scalable=True, bins=20, n_jobs=4)
@@ -3,10 +3,19 @@ __author__ ='Matan Carmon'
 __date__ = 'October 2023'
 
 
+import functools
+import inspect
+import math
+import pickle
+
+import numpy as np
 import pandas as pd
 import rpy2.robjects as robjects
 from rpy2.robjects import pandas2ri
 
+import r_parallel
+import result_cache
+
 # Activate automatic conversion of pandas objects to R objects
 pandas2ri.activate()
 
@@ -36,20 +45,181 @@ robjects.r('''
     library(trend)
 ''')
 
+
+# Components of a decomposition as one R matrix in trend, seasonal, residual order, so that a
+# single conversion brings them back
+_stl_components = robjects.r('function(fit) fit$time.series[, c("trend", "seasonal", "remainder")]')
+_decomposition_components = robjects.r('function(fit) cbind(fit$trend, fit$seasonal, fit$irregular)')
+
+
+def _stl_trend_window(period, s_window, length):
+    """
+    Get the default trend window (t.window) of R's stl.
+
+    Args:
+        period (int): The number of observations per seasonal cycle.
+        s_window (str or int): The seasonal window passed to stl.
+        length (int): Number of observations decomposed.
+
+    Returns:
+        int: The trend window, nextodd(ceiling(1.5 * period / (1 - 1.5 / s.window))) as in stl.
+    """
+    if s_window == "periodic":
+        s_window = 10 * length + 1
+    width = math.ceil(1.5 * period / (1 - 1.5 / s_window))
+    return width + 1 if width % 2 == 0 else width
+
+
+# Observations per year of the pandas frequencies with a seasonal cycle, by rule code without anchor
+_PERIODS_PER_YEAR = {'A': 1, 'Y': 1, 'AS': 1, 'YS': 1, 'YE': 1, 'BA': 1, 'BY': 1, 'BAS': 1, 'BYS': 1, 'BYE': 1,
+                     'Q': 4, 'QS': 4, 'QE': 4, 'BQ': 4, 'BQS': 4, 'BQE': 4,
+                     'M': 12, 'MS': 12, 'ME': 12, 'BM': 12, 'BMS': 12, 'BME': 12, 'SM': 24, 'SMS': 24, 'SME': 24,
+                     'W': 52}
+# Observations per seasonal cycle of the sub-weekly frequencies: a week of days, a day of hours
+_PERIODS_PER_CYCLE = {'D': 7, 'B': 5, 'H': 24, 'h': 24, 'BH': 8, 'bh': 8}
+
+
+def _index_frequency(index):
+    """
+    Infer the number of observations per seasonal cycle from the frequency of a time index.
+
+    Args:
+        index (pandas.Index): The index of the series, a DatetimeIndex or PeriodIndex.
+
+    Returns:
+        int: The frequency of the R ts (12 for monthly data, 4 for quarterly, 7 for daily...), or
+            None if the index has no known frequency.
+    """
+    offset = getattr(index, 'freq', None)
+    if offset is None and isinstance(index, pd.DatetimeIndex) and len(index) >= 3:
+        offset = pd.infer_freq(index)
+    if offset is None:
+        return None
+    offset = pd.tseries.frequencies.to_offset(offset)
+    code = offset.rule_code.split('-')[0]
+    periods = _PERIODS_PER_YEAR.get(code, _PERIODS_PER_CYCLE.get(code))
+    if periods is None or periods % offset.n:
+        return None
+    return periods // offset.n
+
+
+def _ts(data, frequency):
+    """
+    Build the R ts of a series with the given frequency.
+
+    Monthly and quarterly series with a time index start at their calendar position, which X-13
+    needs to tell the months or quarters apart.
+
+    Args:
+        data (pandas.Series): The series.
+        frequency (int): The number of observations per seasonal cycle.
+
+    Returns:
+        R ts: The series.
+    """
+    start = robjects.IntVector([1, 1])
+    index = data.index
+    if isinstance(index, (pd.DatetimeIndex, pd.PeriodIndex)) and len(index) and frequency in (4, 12):
+        first = index[0]
+        start = robjects.IntVector([first.year, (first.month - 1) * frequency // 12 + 1])
+    return robjects.r['ts'](robjects.FloatVector(np.asarray(data, dtype=float)), frequency=frequency,
+                            start=start)
+
+
+def _components_frame(components, index):
+    """
+    Wrap a matrix of decomposition components, converted from R in one piece, as a DataFrame.
+
+    Args:
+        components (R matrix or numpy.ndarray): The (observations x 3) trend, seasonal and residual components.
+        index (pandas.Index): The index of the series.
+
+    Returns:
+        pandas.DataFrame: The trend, seasonal, and residual components, without copying the matrix.
+    """
+    values = np.asarray(components, dtype=float).reshape((len(index), 3), order='F')
+    return pd.DataFrame(values, index=index, columns=['trend', 'seasonal', 'residual'], copy=False)
+
+
+def _component_series(component, index):
+    """
+    Wrap one component converted from R as a Series.
+
+    Args:
+        component (R vector or numpy.ndarray): The component.
+        index (pandas.Index): The index of the series.
+
+    Returns:
+        pandas.Series: The component, indexed like the series.
+    """
+    return pd.Series(np.asarray(component, dtype=float), index=index, copy=False)
+
+
+def _cached(method):
+    """
+    Decorator caching the results of a SeasonalAdjustment method in its cache, if it has one.
+
+    The key hashes the series values, index and frequency with the method name and arguments,
+    so a stored result is only reused for identical input.
+
+    Args:
+        method (callable): The method to cache.
+
+    Returns:
+        callable: The caching method.
+    """
+    signature = inspect.signature(method)
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self.cache is None:
+            return method(self, *args, **kwargs)
+        arguments = signature.bind(self, *args, **kwargs)
+        arguments.apply_defaults()
+        key = result_cache.fingerprint(self.data, self.frequency, method.__name__,
+                                       sorted((name, value) for name, value in arguments.arguments.items()
+                                              if name != 'self'))
+        value = self.cache.get(key)
+        if value is not None:
+            return pickle.loads(value)
+        result = method(self, *args, **kwargs)
+        self.cache.put(key, pickle.dumps(result))
+        return result
+    return wrapper
+
+
 class SeasonalAdjustment:
     """
     Interface to perform seasonal adjustment techniques using various R packages through rpy2.
     """
 
-    def __init__(self, data):
+    def __init__(self, data, cache=None, frequency=None):
         """
         Initialize the SeasonalAdjustment object with the data.
 
         Args:
             data (pandas.DataFrame): The input data.
+            cache (result_cache.DiskCache): Cache for the results of seasonal_decompose and the
+                census methods, which run the X-13 binary. Default is None (no caching).
+            frequency (int): The number of observations per seasonal cycle. If given, the data is
+                passed to R as a ts of that frequency. Default is None (the data is passed as is).
         """
         self.data = data
+        self.cache = cache
+        self.frequency = frequency
 
+    def _series(self):
+        """
+        Internal method returning the data as passed to the R methods.
+
+        Returns:
+            The data, as an R ts if a frequency was given.
+        """
+        if self.frequency is None:
+            return self.data
+        return _ts(self.data, self.frequency)
+
+    @_cached
     def seasonal_decompose(self, method='stl'):
         """
         Perform seasonal decomposition.
@@ -58,77 +228,295 @@ class SeasonalAdjustment:
             method (str): The method to use for decomposition. Options: 'stl', 'seas', 'x11'. Default is 'stl'.
 
         Returns:
-            dict: A dictionary containing trend, seasonal, and residual components.
+            pandas.DataFrame: The trend, seasonal, and residual components, indexed like the data.
         """
-        seasonal_decompose_dict = {}
         if method == 'stl':
-            result = robjects.r['stl'](self.data, s_window="periodic")
-            seasonal_decompose_dict['trend'] = pd.Series(result.rx2('time.series')[0], index=self.data.index)
-            seasonal_decompose_dict['seasonal'] = pd.Series(result.rx2('time.series')[1], index=self.data.index)
-            seasonal_decompose_dict['residual'] = pd.Series(result.rx2('time.series')[2], index=self.data.index)
+            components = _stl_components(robjects.r['stl'](self._series(), s_window="periodic"))
         elif method == 'seas':
-            result = robjects.r['seas'](self.data)
-            seasonal_decompose_dict['trend'] = pd.Series(result.rx2('trend'), index=self.data.index)
-            seasonal_decompose_dict['seasonal'] = pd.Series(result.rx2('seasonal'), index=self.data.index)
-            seasonal_decompose_dict['residual'] = pd.Series(result.rx2('irregular'), index=self.data.index)
+            components = _decomposition_components(robjects.r['seas'](self._series()))
         elif method == 'x11':
-            result = robjects.r['x11'](self.data)
-            seasonal_decompose_dict['trend'] = pd.Series(result.rx2('trend'), index=self.data.index)
-            seasonal_decompose_dict['seasonal'] = pd.Series(result.rx2('seasonal'), index=self.data.index)
-            seasonal_decompose_dict['residual'] = pd.Series(result.rx2('irregular'), index=self.data.index)
+            components = _decomposition_components(robjects.r['x11'](self._series()))
         else:
             raise ValueError("Invalid method. Supported methods are 'stl', 'seas', and 'x11'.")
-        return seasonal_decompose_dict
+        return _components_frame(components, self.data.index)
 
+    @_cached
     def census_x13_arima(self):
         """
         Perform seasonal adjustment using the X-13ARIMA-SEATS method.
 
         Returns:
-            pandas.DataFrame: Seasonally adjusted data.
+            pandas.Series: Seasonally adjusted data, indexed like the data.
         """
-        result = robjects.r['x13'](self.data)
-        return pd.Series(result.rx2('seasadj'))
+        result = robjects.r['x13'](self._series())
+        return _component_series(result.rx2('seasadj'), self.data.index)
 
+    @_cached
     def census_x11_arima(self):
         """
         Perform seasonal adjustment using the X-11 ARIMA method.
 
         Returns:
-            pandas.DataFrame: Seasonally adjusted data.
+            pandas.Series: Seasonally adjusted data, indexed like the data.
         """
-        result = robjects.r['x11'](self.data)
-        return pd.Series(result.rx2('seasadj'))
+        result = robjects.r['x11'](self._series())
+        return _component_series(result.rx2('seasadj'), self.data.index)
 
+    @_cached
     def census_seats(self):
         """
         Perform seasonal adjustment using the SEATS method.
 
         Returns:
-            pandas.DataFrame: Seasonally adjusted data.
+            pandas.Series: Seasonally adjusted data, indexed like the data.
         """
-        result = robjects.r['seas'](self.data, method="Seats")
-        return pd.Series(result.rx2('seasonal'))
+        result = robjects.r['seas'](self._series(), method="Seats")
+        return _component_series(result.rx2('seasonal'), self.data.index)
 
     def timsac(self):
         """
         Perform seasonal adjustment using the TRAMO-SEATS method.
 
         Returns:
-            pandas.DataFrame: Seasonally adjusted data.
+            pandas.Series: Seasonally adjusted data, indexed like the data.
         """
-        result = robjects.r['timsac'](self.data)
-        return pd.Series(result.rx2('final'))
+        result = robjects.r['timsac'](self._series())
+        return _component_series(result.rx2('final'), self.data.index)
 
     def census_seasonal(self):
         """
         Perform seasonal adjustment using the CENSUS X-12-ARIMA method.
 
         Returns:
-            pandas.DataFrame: Seasonally adjusted data.
+            pandas.Series: Seasonally adjusted data, indexed like the data.
+        """
+        result = robjects.r['seasonal'](self._series())
+        return _component_series(result.rx2('adjusted'), self.data.index)
+
+    def incremental_stl(self, period, window=None, revision=None, refresh_every=None, s_window="periodic"):
         """
-        result = robjects.r['seasonal'](self.data)
-        return pd.Series(result.rx2('adjusted'))
+        Start an incremental STL decomposition, updated as new observations are appended.
+
+        Args:
+            period (int): The number of observations per seasonal cycle.
+            window (int): Number of trailing observations decomposed, with the new points, on each append.
+                Default is 10 cycles.
+            revision (int): Number of trailing observations whose components an append may revise.
+                Default is half the window.
+            refresh_every (int): Recompute the full decomposition after this many appended
+                observations. Default is None (never).
+            s_window (str or int): The seasonal window passed to stl. Default is "periodic".
+
+        Returns:
+            IncrementalSTL: The decomposition of the current data, ready for appends.
+        """
+        return IncrementalSTL(self.data, period, window=window, revision=revision,
+                              refresh_every=refresh_every, s_window=s_window)
+
+class IncrementalSTL:
+    """
+    STL decomposition kept up to date as observations are appended.
+
+    An append decomposes only the window observations before the new points, plus the new
+    points, and overwrites the components of the last revision observations before them;
+    older components are frozen. The cost of an append is therefore proportional to the
+    window and the number of new points, not to the length of the history.
+
+    Drift from a full recompute: the loess smoothers of STL only reach t.window observations
+    (about 1.5 cycles) to each side, so with window - revision larger than that (which the
+    constructor checks) the revised points see the same neighbors as in a full fit. The
+    remaining difference comes from the seasonal smoother, which averages window / period
+    cycles instead of the whole history, and from frozen points no longer seeing the
+    observations that came after them. Both are bounded by how far the seasonal pattern
+    moves over the history; every full refresh measures it, as the largest absolute change
+    of a frozen trend or seasonal value, in drift.
+    """
+
+    def __init__(self, data, period, window=None, revision=None, refresh_every=None, s_window="periodic"):
+        """
+        Initialize the IncrementalSTL object with a full decomposition of the history.
+
+        Args:
+            data (pandas.Series): The history of the series.
+            period (int): The number of observations per seasonal cycle.
+            window (int): Number of trailing observations decomposed, with the new points, on each append.
+                Default is 10 cycles.
+            revision (int): Number of trailing observations whose components an append may revise.
+                Default is half the window.
+            refresh_every (int): Recompute the full decomposition after this many appended
+                observations. Default is None (never).
+            s_window (str or int): The seasonal window passed to stl. Default is "periodic".
+        """
+        self.period = period
+        self.window = window or 10 * period
+        self.revision = revision or self.window // 2
+        if self.window < 2 * period:
+            raise ValueError("The window must hold at least two periods.")
+        context = self.window - self.revision
+        if context < _stl_trend_window(period, s_window, self.window):
+            raise ValueError(f"The window must leave at least one trend window of stl "
+                             f"({_stl_trend_window(period, s_window, self.window)} observations) before the "
+                             f"revised observations, only {context} are left.")
+        self.refresh_every = refresh_every
+        self.s_window = s_window
+        self.drift = None
+        self._index = list(data.index)
+        self._values = list(np.asarray(data, dtype=float))
+        self._since_refresh = 0
+        self._components = [list(column) for column in self._decompose(0).T]
+
+    def append(self, values):
+        """
+        Append observations and update the decomposition.
+
+        Args:
+            values (pandas.Series): The new observations, indexed after the history.
+
+        Returns:
+            IncrementalSTL: The updated decomposition.
+        """
+        self._index.extend(values.index)
+        self._values.extend(np.asarray(values, dtype=float))
+        self._since_refresh += len(values)
+        if self.refresh_every is not None and self._since_refresh >= self.refresh_every:
+            self.refresh()
+            return self
+        # The revised points keep window - revision observations of left context
+        start = max(len(self._values) - len(values) - self.window, 0)
+        updated = min(len(values) + self.revision, len(self._values) - start)
+        decomposition = self._decompose(start)
+        for component, column in zip(self._components, decomposition.T):
+            # Components of the new points are appended, those of the revised points overwritten
+            component.extend(column[len(column) - len(values):])
+            component[-updated:] = column[-updated:]
+        return self
+
+    def refresh(self):
+        """
+        Recompute the full decomposition and measure how far the incremental one had drifted.
+
+        Returns:
+            IncrementalSTL: The refreshed decomposition.
+        """
+        decomposition = self._decompose(0)
+        frozen = len(self._components[0]) - self.revision
+        if frozen > 0:
+            self.drift = float(max(np.abs(np.asarray(component[:frozen]) - column[:frozen]).max()
+                                   for component, column in zip(self._components[:2], decomposition.T[:2])))
+        self._components = [list(column) for column in decomposition.T]
+        self._since_refresh = 0
+        return self
+
+    def components(self):
+        """
+        Get the current decomposition.
+
+        Returns:
+            pandas.DataFrame: The trend, seasonal, and residual components.
+        """
+        return _components_frame(np.column_stack(self._components), pd.Index(self._index))
+
+    def _decompose(self, start):
+        """
+        Internal method running stl on the observations from start onwards.
+
+        Args:
+            start (int): Position of the first observation to decompose.
+
+        Returns:
+            numpy.ndarray: The (observations x 3) trend, seasonal and residual components.
+        """
+        # Start the ts at the right position in the cycle so that the seasonal phase is kept
+        series = robjects.r['ts'](robjects.FloatVector(self._values[start:]), frequency=self.period,
+                                  start=robjects.IntVector([1, start % self.period + 1]))
+        components = _stl_components(robjects.r['stl'](series, s_window=self.s_window))
+        return np.asarray(components, dtype=float).reshape((len(self._values) - start, 3), order='F')
+
+
+# Seasonal adjustment methods returning a single adjusted series, by batch method name
+ADJUSTMENT_METHODS = {'x13': 'census_x13_arima',
+                      'x11_arima': 'census_x11_arima',
+                      'seats': 'census_seats',
+                      'timsac': 'timsac',
+                      'seasonal': 'census_seasonal'}
+
+# Methods of seasonal_decompose
+DECOMPOSITION_METHODS = ('stl', 'seas', 'x11')
+
+
+def batch_seasonal_adjustment(data, method='stl', n_jobs=None, batch_columns=50, frequency=None):
+    """
+    Seasonally adjust every column of a wide DataFrame across a pool of R worker processes.
+
+    Columns are sent to the workers in batches of batch_columns, and each worker adjusts its
+    series one after the other in its own R session. A series whose adjustment fails is
+    recorded in the failures instead of stopping the batch.
+
+    Args:
+        data (pandas.DataFrame): One series per column, sharing the index.
+        method (str): A seasonal_decompose method ('stl', 'seas', 'x11') for trend, seasonal and
+            residual components, or one of 'x13', 'x11_arima', 'seats', 'timsac', 'seasonal'
+            for the adjusted series only. Default is 'stl'.
+        n_jobs (int): Number of worker processes. If None, one per CPU.
+        batch_columns (int): Number of series per job. Default is 50.
+        frequency (int): The number of observations per seasonal cycle (12 for monthly data, 4 for
+            quarterly...). If None, it is inferred from the frequency of the index.
+
+    Returns:
+        tuple: A dict mapping each component name ('trend', 'seasonal', 'residual', or
+            'seasadj') to a wide DataFrame aligned with data, and a dict mapping the name of
+            each failed series to its error message.
+    """
+    if method not in DECOMPOSITION_METHODS and method not in ADJUSTMENT_METHODS:
+        raise ValueError(f"Invalid method. Supported methods are "
+                         f"{', '.join(DECOMPOSITION_METHODS + tuple(ADJUSTMENT_METHODS))}.")
+    if frequency is None:
+        frequency = _index_frequency(data.index)
+        if frequency is None:
+            raise ValueError("The frequency cannot be inferred from the index, pass the number of "
+                             "observations per seasonal cycle as frequency.")
+    batches = (data.iloc[:, start:start + batch_columns] for start in range(0, data.shape[1], batch_columns))
+    components, failures = {}, {}
+    with r_parallel.WorkerPool(n_jobs, {'method': method, 'frequency': frequency}) as pool:
+        for batch_components, batch_failures in pool.imap(_batch_adjustment_job, batches):
+            for name, columns in batch_components.items():
+                components.setdefault(name, {}).update(columns)
+            failures.update(batch_failures)
+    adjusted = [column for column in data.columns if column not in failures]
+    components = {name: pd.DataFrame(columns, index=data.index, columns=adjusted)
+                  for name, columns in components.items()}
+    return components, failures
+
+
+def _batch_adjustment_job(batch):
+    """
+    Seasonally adjust a batch of series in a worker.
+
+    Args:
+        batch (pandas.DataFrame): One series per column.
+
+    Returns:
+        tuple: A dict mapping each component name to a dict of {column: values}, and a dict
+            mapping the name of each failed series to its error message.
+    """
+    state = r_parallel.worker_state()
+    method = state['method']
+    components, failures = {}, {}
+    for column in batch.columns:
+        try:
+            adjustment = SeasonalAdjustment(batch[column], frequency=state['frequency'])
+            if method in DECOMPOSITION_METHODS:
+                result = adjustment.seasonal_decompose(method=method)
+                result = {name: result[name].to_numpy() for name in result.columns}
+            else:
+                result = {'seasadj': getattr(adjustment, ADJUSTMENT_METHODS[method])().to_numpy()}
+        except Exception as error:
+            failures[column] = str(error)
+            continue
+        for name, values in result.items():
+            components.setdefault(name, {})[column] = values
+    return components, failures
+
 
 # Example usage:
 # data = pd.Series([5, 10, 15, 20, 25, 30, 35, 40, 45, 50])
@@ -141,3 +529,11 @@ class SeasonalAdjustment:
 # seats = seasonal_adjustment.census_seats()
 # tramoseats = seasonal_adjustment.timsac()
 # x12_arima = seasonal_adjustment.census_seasonal()
+# wide = pd.DataFrame({'a': data, 'b': data * 2})
+# components, failures = batch_seasonal_adjustment(wide, method='stl', frequency=2, n_jobs=4)
+# cached_adjustment = SeasonalAdjustment(data, cache=result_cache.DiskCache('x13_cache', max_bytes=10 ** 9))
+# x13_arima = cached_adjustment.census_x13_arima()
+# print(cached_adjustment.cache.stats())
+# incremental = SeasonalAdjustment(data).incremental_stl(period=2, window=6, refresh_every=12)
+# incremental.append(pd.Series([55.0], index=[10]))
+# live_components = incremental.components()
@@ -1,11 +1,19 @@
 __version__='0.1.1'
 __author__ ='Matan Carmon'
-__date__ = November 2023'
+__date__ = 'November 2023'
 
+import time
+
+import numpy as np
 import pandas as pd
+import rpy2.robjects as robjects
 import rpy2.robjects.packages as rpackages
 from rpy2.robjects import pandas2ri
 
+import r_conversion
+import r_parallel
+from numeric_methods import ChunkedDBSCAN, MiniBatchKMeans, nearest_center, silhouette
+
 # Activate automatic conversion of pandas objects to R objects
 pandas2ri.activate()
 
@@ -13,11 +21,14 @@ pandas2ri.activate()
 utils = rpackages.importr('utils')
 utils.chooseCRANmirror(ind=1)
 
-# Install R packages
+# Install missing R packages (worker processes import this module too)
 packages = ['cluster', 'dbscan', 'mclust']
-utils.install_packages(rpackages.StrVector(packages))
+missing = [name for name in packages if not rpackages.isinstalled(name)]
+if missing:
+    utils.install_packages(rpackages.StrVector(missing))
 
 # Import required R libraries
+stats = rpackages.importr('stats')
 cluster = rpackages.importr('cluster')
 dbscan = rpackages.importr('dbscan')
 mclust = rpackages.importr('mclust')
@@ -46,9 +57,68 @@ class UnsupervisedModels:
         Returns:
             R object: The K-Means clustering model.
         """
-        kmeans_fit = cluster.kmeans(self.data, centers=centers)
+        kmeans_fit = stats.kmeans(self.data, centers=centers)
         return kmeans_fit
 
+    def select_k(self, k_values=range(2, 11), method='kmeans', restarts=5, n_jobs=None,
+                 silhouette_sample=2000, seed=None):
+        """
+        Fit a range of cluster counts with several random restarts each, across R worker processes.
+
+        The data is sent to each worker once. Each (k, restart) job reports its inertia (the
+        within-cluster sum of squares around the cluster means) and its silhouette, computed
+        on a random sample of at most silhouette_sample points. The best k is the one whose
+        lowest-inertia restart has the highest silhouette; that restart is refitted here with
+        the same seed and returned.
+
+        Args:
+            k_values (iterable): The numbers of clusters to try. Default is 2 to 10.
+            method (str): 'kmeans' or 'pam'. Default is 'kmeans'.
+            restarts (int): Number of random restarts per k. Default is 5.
+            n_jobs (int): Number of worker processes. If None, one per CPU.
+            silhouette_sample (int): Maximum number of points used for the silhouette. Default is 2000.
+            seed (int): Seed of the random generator.
+
+        Returns:
+            tuple: A pandas.DataFrame with the inertia, silhouette and fit time of every job,
+                and the R object of the best model.
+        """
+        if method not in ('kmeans', 'pam'):
+            raise ValueError("Invalid method. Supported methods are 'kmeans' and 'pam'.")
+        rng = np.random.default_rng(seed)
+        sample = np.sort(rng.choice(len(self.data), min(silhouette_sample, len(self.data)), replace=False))
+        jobs = [(method, k, restart, int(rng.integers(2 ** 31 - 1)))
+                for k in k_values for restart in range(restarts)]
+        # The points are computed once here and shared with the workers, not once per worker
+        state = {'data': self.data, 'points': np.asarray(self.data, dtype=float), 'sample': sample}
+        with r_parallel.WorkerPool(n_jobs, state) as pool:
+            results = pd.DataFrame(pool.map(_select_k_job, jobs))
+
+        best_runs = results.loc[results.groupby('k')['inertia'].idxmin()]
+        best = best_runs.loc[best_runs['silhouette'].idxmax()]
+        return results, _fit_clustering(self.data, method, int(best['k']), int(best['seed']))
+
+    def minibatch_kmeans(self, centers=3, batch_size=1024, max_iter=100, chunks=None, seed=None):
+        """
+        Perform clustering using mini-batch K-Means, without sending the data to R.
+
+        Centroids are updated from small batches instead of full passes over the data, which
+        gives an inertia close to full K-Means at a fraction of the time and memory.
+
+        Args:
+            centers (int): The number of clusters. Default is 3.
+            batch_size (int): Number of points per mini-batch. Default is 1024.
+            max_iter (int): Maximum number of mini-batches drawn from self.data. Default is 100.
+            chunks (iterable): Iterator of DataFrame chunks to consume in a single pass instead of self.data.
+            seed (int): Seed of the random generator.
+
+        Returns:
+            MiniBatchKMeans: The fitted model. When fitted on self.data, it also holds the cluster
+                of every point and the total within-cluster sum of squares.
+        """
+        model = MiniBatchKMeans(centers, batch_size=batch_size, max_iter=max_iter, seed=seed)
+        return model.fit(self.data if chunks is None else chunks)
+
     def pam(self, k=3):
         """
         Perform clustering using Partitioning Around Medoids (PAM).
@@ -62,6 +132,26 @@ class UnsupervisedModels:
         pam_fit = cluster.pam(self.data, k=k)
         return pam_fit
 
+    def sampled_pam(self, k=3, samples=5, sampsize=None, n_jobs=None, seed=None):
+        """
+        Perform clustering using PAM on random subsamples, in the style of CLARA.
+
+        PAM needs the full dissimilarity matrix, so it only runs on subsamples here, in parallel
+        R workers. Every point is then assigned to the nearest medoid in a chunked pass and the
+        medoid set with the lowest total cost is kept.
+
+        Args:
+            k (int): The number of clusters. Default is 3.
+            samples (int): Number of subsamples. Default is 5.
+            sampsize (int): Number of points per subsample. If None, 40 + 2 * k as in cluster::clara.
+            n_jobs (int): Number of worker processes. If None, one per CPU.
+            seed (int): Seed of the random generator.
+
+        Returns:
+            SampledPAM: The fitted model, with the medoids and the cluster of every point.
+        """
+        return SampledPAM(k, samples=samples, sampsize=sampsize, n_jobs=n_jobs, seed=seed).fit(self.data)
+
     def dbscan(self, eps=0.5, minPts=5):
         """
         Perform clustering using DBSCAN algorithm.
@@ -78,6 +168,26 @@ class UnsupervisedModels:
         dbscan_fit = dbscan.dbscan(self.data, eps=eps, MinPts=minPts)
         return dbscan_fit
 
+    def chunked_dbscan(self, eps=0.5, minPts=5, max_neighbors=10000000):
+        """
+        Perform clustering using DBSCAN with a KD-tree and bounded-size neighbor queries.
+
+        Unlike dbscan, the eps-neighborhoods are never held all at once, so peak memory is set by
+        max_neighbors rather than by the density of the data. The cluster labels are the same as
+        dbscan::dbscan's.
+
+        Args:
+            eps (float): The maximum distance between two samples for one to be considered as in the neighborhood
+                of the other. Default is 0.5.
+            minPts (int): The number of samples in a neighborhood for a point to be considered as a core point.
+                Default is 5.
+            max_neighbors (int): Maximum number of neighbor indices held in memory at once. Default is 10000000.
+
+        Returns:
+            ChunkedDBSCAN: The fitted model, with the cluster of every point (0 for noise).
+        """
+        return ChunkedDBSCAN(eps, minPts, max_neighbors=max_neighbors).fit(self.data)
+
     def mclust(self):
         """
         Perform clustering using Mclust algorithm.
@@ -88,6 +198,237 @@ class UnsupervisedModels:
         mclust_fit = mclust.Mclust(self.data)
         return mclust_fit
 
+    def parallel_mclust(self, G=range(1, 10), modelNames=None, sample_size=2000, top=3, n_jobs=None, seed=None):
+        """
+        Perform clustering using Mclust, searching the (model type x G) grid in parallel.
+
+        Every configuration is first fitted on a random subsample, in R worker processes. Only
+        the top configurations by BIC are then fitted on the full data, with EM initialized
+        from the same subsample, and the one with the highest BIC is returned.
+
+        Args:
+            G (iterable): The numbers of mixture components to try. Default is 1 to 9.
+            modelNames (list): The covariance structures to try. If None, all of Mclust's models
+                for the dimension of the data.
+            sample_size (int): Number of points in the subsample. Default is 2000.
+            top (int): Number of configurations fitted on the full data. Default is 3.
+            n_jobs (int): Number of worker processes. If None, one per CPU.
+            seed (int): Seed of the random generator.
+
+        Returns:
+            tuple: A pandas.DataFrame with the BIC, fit time and error of every configuration and stage,
+                and the R object of the best Mclust model. A ValueError holding this table is raised
+                if every configuration fails on the subsample, or every finalist on the full data.
+        """
+        if modelNames is None:
+            modelNames = MCLUST_UNIVARIATE_MODELS if self.data.shape[1] == 1 else MCLUST_MULTIVARIATE_MODELS
+        rng = np.random.default_rng(seed)
+        sample = np.sort(rng.choice(len(self.data), min(sample_size, len(self.data)), replace=False))
+        configs = [(name, g) for name in modelNames for g in G]
+        with r_parallel.WorkerPool(n_jobs, {'data': self.data, 'sample': sample}) as pool:
+            screening = pd.DataFrame(pool.map(_mclust_job, [(name, g, 'sample') for name, g in configs]))
+            finalists = screening.dropna(subset=['bic']).nlargest(top, 'bic')
+            if finalists.empty:
+                raise ValueError(f"Mclust could not fit any configuration on the subsample:\n"
+                                 f"{screening.drop(columns=['model']).to_string(index=False)}")
+            final = pd.DataFrame(pool.map(_mclust_job, [(name, g, 'full') for name, g
+                                                         in zip(finalists['modelName'], finalists['G'])]))
+
+        results = pd.concat([screening, final], ignore_index=True).drop(columns=['model'])
+        fitted = final.dropna(subset=['bic'])
+        if fitted.empty:
+            raise ValueError(f"Mclust could not fit any of the top configurations on the full data:\n"
+                             f"{results.to_string(index=False)}")
+        best = fitted.sort_values('bic', ascending=False).iloc[0]
+        return results, r_parallel.r_unserialize(best['model'])
+
+class SampledPAM:
+    """
+    CLARA-style PAM: PAM on several random subsamples, scored on the full data.
+    """
+
+    def __init__(self, k=3, samples=5, sampsize=None, n_jobs=None, chunksize=100000, seed=None):
+        """
+        Initialize the SampledPAM object.
+
+        Args:
+            k (int): The number of clusters. Default is 3.
+            samples (int): Number of subsamples. Default is 5.
+            sampsize (int): Number of points per subsample. If None, 40 + 2 * k as in cluster::clara.
+            n_jobs (int): Number of worker processes. If None, one per CPU.
+            chunksize (int): Number of points per chunk when assigning points to medoids. Default is 100000.
+            seed (int): Seed of the random generator.
+        """
+        self.k = k
+        self.samples = samples
+        self.sampsize = sampsize or 40 + 2 * k
+        self.n_jobs = n_jobs
+        self.chunksize = chunksize
+        self.seed = seed
+        self.columns = None
+        self.medoids = None
+        self.id_med = None
+        self.clustering = None
+        self.objective = None
+        self.sample_results = None
+
+    def fit(self, data):
+        """
+        Find the medoids and assign every point to one.
+
+        Args:
+            data (pandas.DataFrame): The input data.
+
+        Returns:
+            SampledPAM: The fitted model.
+        """
+        self.columns = list(data.columns)
+        points = np.asarray(data, dtype=float)
+        seeds = np.random.default_rng(self.seed).integers(2 ** 31 - 1, size=self.samples)
+        state = {'points': points, 'columns': self.columns, 'k': self.k,
+                 'sampsize': min(self.sampsize, len(points)), 'chunksize': self.chunksize}
+        with r_parallel.WorkerPool(self.n_jobs, state) as pool:
+            self.sample_results = pd.DataFrame(pool.map(_sampled_pam_job, seeds))
+
+        best = self.sample_results.loc[self.sample_results['cost'].idxmin()]
+        self.id_med = np.asarray(best['id_med'])
+        self.medoids = data.iloc[self.id_med - 1]
+        labels, distances = nearest_center(points, points[self.id_med - 1], self.chunksize)
+        self.clustering = labels + 1
+        self.objective = distances.mean()
+        return self
+
+    def predict(self, data):
+        """
+        Assign points to their nearest medoid.
+
+        Args:
+            data (pandas.DataFrame): The points to assign.
+
+        Returns:
+            numpy.ndarray: The cluster of each point, numbered from 1 as in R.
+        """
+        points = np.asarray(data[self.columns], dtype=float)
+        return nearest_center(points, np.asarray(self.medoids, dtype=float), self.chunksize)[0] + 1
+
+
+def _fit_clustering(data, method, k, seed):
+    """
+    Fit K-Means or PAM with a fixed R seed.
+
+    Args:
+        data (pandas.DataFrame or R data.frame): The input data.
+        method (str): 'kmeans' or 'pam'.
+        k (int): The number of clusters.
+        seed (int): Seed of the R random generator.
+
+    Returns:
+        R object: The clustering model.
+    """
+    robjects.r['set.seed'](seed)
+    if method == 'kmeans':
+        return stats.kmeans(data, centers=k)
+    return cluster.pam(data, k=k, medoids='random', nstart=1)
+
+
+def _sampled_pam_job(seed):
+    """
+    Run PAM on one random subsample in a worker and score its medoids on the full data.
+
+    Args:
+        seed (int): Seed of the subsample.
+
+    Returns:
+        dict: The seed, the medoid row numbers (from 1), the total distance of all points to
+            their nearest medoid and the PAM and scoring times.
+    """
+    state = r_parallel.worker_state()
+    points = state['points']
+    sample = np.sort(np.random.default_rng(seed).choice(len(points), state['sampsize'], replace=False))
+    start = time.perf_counter()
+    fit = cluster.pam(pd.DataFrame(points[sample], columns=state['columns']), k=state['k'])
+    pam_time = time.perf_counter() - start
+    id_med = sample[np.asarray(fit.rx2('id.med'), dtype=np.int64) - 1] + 1
+    start = time.perf_counter()
+    cost = nearest_center(points, points[id_med - 1], state['chunksize'])[1].sum()
+    return {'seed': seed, 'id_med': id_med, 'cost': cost,
+            'pam_time': pam_time, 'score_time': time.perf_counter() - start}
+
+
+def _select_k_job(job):
+    """
+    Fit one (k, restart) job of select_k in a worker.
+
+    Args:
+        job (tuple): The method, the number of clusters, the restart number and the R seed.
+
+    Returns:
+        dict: The job description with its inertia, silhouette and fit time.
+    """
+    method, k, restart, seed = job
+    state = r_parallel.worker_state()
+    if 'r_data' not in state:
+        # Convert the data once per worker, every job reuses it
+        state['r_data'] = r_conversion.py2r(state.pop('data'))
+    points, sample = state['points'], state['sample']
+
+    start = time.perf_counter()
+    fit = _fit_clustering(state['r_data'], method, k, seed)
+    fit_time = time.perf_counter() - start
+    labels = np.asarray(fit.rx2('clustering' if method == 'pam' else 'cluster'), dtype=np.int64)
+    sizes = np.bincount(labels)
+    means = np.zeros((len(sizes), points.shape[1]))
+    np.add.at(means, labels, points)
+    means[sizes > 0] /= sizes[sizes > 0, None]
+    inertia = float(((points - means[labels]) ** 2).sum())
+    return {'method': method, 'k': k, 'restart': restart, 'seed': seed, 'inertia': inertia,
+            'silhouette': silhouette(points[sample], labels[sample]), 'fit_time': fit_time}
+
+
+# Covariance structures searched by Mclust, by dimension of the data
+MCLUST_UNIVARIATE_MODELS = ('E', 'V')
+MCLUST_MULTIVARIATE_MODELS = ('EII', 'VII', 'EEI', 'VEI', 'EVI', 'VVI', 'EEE',
+                              'VEE', 'EVE', 'VVE', 'EEV', 'VEV', 'EVV', 'VVV')
+
+
+def _mclust_job(job):
+    """
+    Fit one Mclust configuration in a worker, on the subsample or on the full data.
+
+    Args:
+        job (tuple): The model name, the number of components and the stage, 'sample' or 'full'.
+
+    Returns:
+        dict: The job description with its BIC, fit time, error message if the fit failed and, for the
+            full data, the serialized model.
+    """
+    name, g, stage = job
+    state = r_parallel.worker_state()
+    sample = state['sample']
+    start = time.perf_counter()
+    error = None
+    try:
+        if stage == 'sample':
+            fit = mclust.Mclust(state['data'].iloc[sample], G=int(g), modelNames=name, verbose=False)
+        else:
+            if 'r_data' not in state:
+                # Convert the full data once per worker, only workers running a finalist need it
+                state['r_data'] = r_conversion.py2r(state['data'])
+            initialization = robjects.r['list'](subset=robjects.IntVector(sample + 1))
+            fit = mclust.Mclust(state['r_data'], G=int(g), modelNames=name,
+                                initialization=initialization, verbose=False)
+        # Mclust returns NULL when no model can be fitted for the configuration
+        failed = robjects.r['is.null'](fit)[0]
+        if failed:
+            error = 'Mclust returned NULL'
+    except Exception as exception:
+        failed, error = True, str(exception).strip()
+    fit_time = time.perf_counter() - start
+    return {'modelName': name, 'G': g, 'stage': stage,
+            'bic': np.nan if failed else fit.rx2('bic')[0], 'fit_time': fit_time, 'error': error,
+            'model': None if failed or stage == 'sample' else r_parallel.r_serialize(fit)}
+
+
 # Example usage:
 # data = pd.DataFrame({'feature1': [1, 2, 3, 4, 5],
 #                      'feature2': [10, 15, 20, 25, 30]})
@@ -96,3 +437,9 @@ class UnsupervisedModels:
 # pam_model = unsupervised_models.pam()
 # dbscan_model = unsupervised_models.dbscan()
 # mclust_model = unsupervised_models.mclust()
+# minibatch_model = unsupervised_models.minibatch_kmeans(centers=2, batch_size=2)
+# new_clusters = minibatch_model.predict(data)
+# chunked_dbscan_model = unsupervised_models.chunked_dbscan(eps=10, minPts=2)
+# k_results, best_model = unsupervised_models.select_k(k_values=range(2, 4), restarts=3, n_jobs=2)
+# sampled_pam_model = unsupervised_models.sampled_pam(k=2, samples=3, sampsize=4, n_jobs=2)
+# mclust_results, mclust_model = unsupervised_models.parallel_mclust(G=range(1, 3), sample_size=4, n_jobs=2)
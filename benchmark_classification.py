@@ -0,0 +1,189 @@
+"""Training-time benchmarks of the ClassificationModels classifiers across data sizes.
+
+For every model and data size, the pandas-to-R conversion and the fit are timed
+separately and the peak memory of both the Python and the R heaps is recorded.
+The Python heap is traced in a second, untimed run, so tracing does not slow
+down the timed one.
+Results are written as JSON, one record per (model, size, repeat).
+
+Usage:
+    python benchmark_classification.py --rows 1000 10000 100000 --features 10 50 --classes 2 5 --output bench.json
+"""
+
+import argparse
+import itertools
+import json
+import platform
+import resource
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+import rpy2.robjects as robjects
+from rpy2.robjects import pandas2ri
+
+import r_conversion
+from ClassificationModels import CLASSIFIERS, ClassificationModels
+
+# Activate automatic conversion of pandas objects to R objects
+pandas2ri.activate()
+
+# Peak memory of the R heap since the last reset, in Mb
+r_max_used_mb = robjects.r('''
+    function() {
+        g <- gc()
+        sum(g[, which(colnames(g) == "max used") + 1])
+    }
+''')
+
+
+def make_classification_data(rows, features, classes, seed=None):
+    """
+    Generate a synthetic classification dataset of Gaussian clusters.
+
+    Args:
+        rows (int): Number of rows.
+        features (int): Number of numeric features.
+        classes (int): Number of classes.
+        seed (int): Seed of the random generator.
+
+    Returns:
+        pandas.DataFrame: The features 'x1'...'xn' and the categorical 'target' column.
+    """
+    rng = np.random.default_rng(seed)
+    labels = rng.integers(classes, size=rows)
+    centers = rng.normal(scale=2.0, size=(classes, features))
+    data = pd.DataFrame(centers[labels] + rng.normal(size=(rows, features)),
+                        columns=[f'x{i + 1}' for i in range(features)])
+    data['target'] = pd.Categorical([f'class{label}' for label in labels])
+    return data
+
+
+def _convert_and_fit(method, data, target, params):
+    """
+    Internal method converting the data to R and fitting one classifier on it.
+
+    Args:
+        method (str): Name of the ClassificationModels method.
+        data (pandas.DataFrame): The input data.
+        target (str): The target variable name.
+        params (dict): Keyword arguments for the method.
+
+    Returns:
+        tuple: The conversion and fit times in seconds.
+    """
+    start = time.perf_counter()
+    if method == 'k_nearest_neighbors':
+        # class::knn takes the features and the classes separately, not a data frame with the target
+        r_features = r_conversion.py2r(data.drop(columns=[target]))
+        r_labels = r_conversion.py2r(data[target])
+    else:
+        r_data = r_conversion.py2r(data)
+    conversion_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    if method == 'k_nearest_neighbors':
+        robjects.r['knn'](r_features, r_features, r_labels, **params)
+    else:
+        getattr(ClassificationModels(r_data, target), method)(**params)
+    fit_time = time.perf_counter() - start
+    return conversion_time, fit_time
+
+
+def benchmark_model(method, data, target='target', memory=True, **params):
+    """
+    Time the conversion and the fit of one classifier on one dataset.
+
+    tracemalloc slows down every Python allocation, so the timed run is not traced: the peak
+    Python heap is measured in a second, untimed run. The peak R heap comes from R's own
+    counters, which cost nothing, and is read after the timed run.
+
+    Args:
+        method (str): Name of the ClassificationModels method.
+        data (pandas.DataFrame): The input data.
+        target (str): The target variable name. Default is 'target'.
+        memory (bool): Whether to run the traced run measuring the Python heap. Default is True.
+        params: Keyword arguments for the method.
+
+    Returns:
+        dict: Conversion and fit times in seconds, peak Python heap in bytes (None without the
+            traced run) and peak R heap in Mb.
+    """
+    robjects.r['gc'](reset=True)
+    conversion_time, fit_time = _convert_and_fit(method, data, target, params)
+    r_peak = r_max_used_mb()[0]
+
+    python_peak = None
+    if memory:
+        tracemalloc.start()
+        try:
+            _convert_and_fit(method, data, target, params)
+            python_peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return {'conversion_time': conversion_time,
+            'fit_time': fit_time,
+            'python_peak_bytes': python_peak,
+            'r_peak_mb': r_peak}
+
+
+def run_benchmarks(rows, features, classes, methods=CLASSIFIERS, repeats=3, seed=0, memory=True):
+    """
+    Benchmark every method on every combination of data sizes.
+
+    A failing fit is recorded with its error message instead of stopping the run.
+
+    Args:
+        rows (list): Numbers of rows to try.
+        features (list): Numbers of features to try.
+        classes (list): Numbers of classes to try.
+        methods (list): Names of the ClassificationModels methods. Default is all of them.
+        repeats (int): Number of timed runs per method and size. Default is 3.
+        seed (int): Seed of the data generator. Default is 0.
+        memory (bool): Whether to measure the peak Python heap in an extra traced run. Default is True.
+
+    Returns:
+        list: One dict per (method, size, repeat) run.
+    """
+    results = []
+    for n_rows, n_features, n_classes in itertools.product(rows, features, classes):
+        data = make_classification_data(n_rows, n_features, n_classes, seed=seed)
+        for method, repeat in itertools.product(methods, range(repeats)):
+            record = {'method': method, 'rows': n_rows, 'features': n_features,
+                      'classes': n_classes, 'repeat': repeat}
+            try:
+                record.update(benchmark_model(method, data, memory=memory))
+            except Exception as error:
+                record['error'] = str(error)
+            results.append(record)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the training time of the R classifiers.")
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--features', type=int, nargs='+', default=[10])
+    parser.add_argument('--classes', type=int, nargs='+', default=[2])
+    parser.add_argument('--methods', nargs='+', default=list(CLASSIFIERS), choices=CLASSIFIERS)
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-memory', dest='memory', action='store_false',
+                        help="Skip the extra traced run measuring the peak Python heap.")
+    parser.add_argument('--output', default='classification_benchmark.json')
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.rows, args.features, args.classes, args.methods, args.repeats, args.seed,
+                             args.memory)
+    report = {'python': platform.python_version(),
+              'r': robjects.r('R.version.string')[0],
+              'platform': platform.platform(),
+              'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+              'results': results}
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {len(results)} results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
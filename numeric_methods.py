@@ -0,0 +1,1096 @@
+"""NumPy implementations of the methods that run without R.
+
+The R-backed interfaces fall back to these when R would be too slow or need too
+much memory. They are kept apart from the interfaces, which start R on import,
+so that they can be used and tested in processes without R.
+"""
+
+import itertools
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+from scipy.spatial.distance import cdist
+
+
+class KNNIndex:
+    """
+    K-Nearest Neighbors classifier backed by a KD-tree over the training features.
+
+    Ties follow class::knn: every training point whose squared distance is within a relative
+    1e-4 of the k-th nearest one votes, so more than k neighbors may vote. class::knn breaks
+    tied votes at random; here they go to the first class in sorted order, so the predictions
+    match brute-force knn whenever its vote is not tied.
+    """
+
+    # Relative tolerance on squared distances used by class::knn for ties at the k-th neighbor
+    TIE_TOLERANCE = 1e-4
+
+    def __init__(self, features, labels, leafsize=16):
+        """
+        Initialize the KNNIndex object and build the KD-tree.
+
+        Args:
+            features (pandas.DataFrame): The numeric training features.
+            labels (pandas.Series or array-like): The training classes.
+            leafsize (int): Number of points in the leaves of the KD-tree. Default is 16.
+        """
+        self.columns = list(features.columns)
+        self.tree = cKDTree(np.asarray(features, dtype=float), leafsize=leafsize)
+        self.classes, self.codes = np.unique(np.asarray(labels), return_inverse=True)
+
+    def predict(self, data, k=5, chunksize=10000):
+        """
+        Classify query points, one chunk at a time.
+
+        Args:
+            data (pandas.DataFrame): The query points. Columns not used for training are ignored.
+            k (int): Number of neighbors to consider. Default is 5.
+            chunksize (int): Number of query points per chunk. Default is 10000.
+
+        Returns:
+            numpy.ndarray: The predicted classes.
+        """
+        points = np.asarray(data[self.columns], dtype=float)
+        predictions = np.empty(len(points), dtype=self.classes.dtype)
+        for start in range(0, len(points), chunksize):
+            chunk = points[start:start + chunksize]
+            predictions[start:start + len(chunk)] = self.classes[self._vote(chunk, k)]
+        return predictions
+
+    def _vote(self, points, k):
+        """
+        Internal method returning the winning class code of each query point.
+
+        Args:
+            points (numpy.ndarray): The query points.
+            k (int): Number of neighbors to consider.
+
+        Returns:
+            numpy.ndarray: The class codes.
+        """
+        distances, neighbors = self.tree.query(points, k=list(range(1, k + 1)))
+        radius = distances[:, -1] * np.sqrt(1 + self.TIE_TOLERANCE)
+        votes = np.zeros((len(points), len(self.classes)), dtype=np.int64)
+        np.add.at(votes, (np.repeat(np.arange(len(points)), k), self.codes[neighbors].ravel()), 1)
+        # Points tied with the k-th neighbor also vote, which only a radius query can find
+        tied = np.flatnonzero(self.tree.query_ball_point(points, radius, return_length=True) > k)
+        for row, members in zip(tied, self.tree.query_ball_point(points[tied], radius[tied])):
+            votes[row] = np.bincount(self.codes[members], minlength=len(self.classes))
+        return votes.argmax(axis=1)
+
+
+class ChunkedDBSCAN:
+    """
+    DBSCAN over a KD-tree, with eps-neighborhoods queried in bounded-size chunks.
+
+    Core points are first found from neighbor counts alone. Neighbor lists are then fetched a
+    chunk at a time and the core points they link are merged with a union-find structure.
+    Clusters are numbered, and border points assigned, in the order dbscan::dbscan expands them:
+    by the lowest index of their core points.
+    """
+
+    def __init__(self, eps=0.5, minPts=5, max_neighbors=10000000, chunksize=10000):
+        """
+        Initialize the ChunkedDBSCAN object.
+
+        Args:
+            eps (float): The radius of the neighborhoods. Default is 0.5.
+            minPts (int): The number of points, itself included, in the neighborhood of a core point.
+                Default is 5.
+            max_neighbors (int): Maximum number of neighbor indices held in memory at once. A single
+                point with more neighbors is still processed on its own. Default is 10000000.
+            chunksize (int): Number of points per neighbor-count query. Default is 10000.
+        """
+        self.eps = eps
+        self.minPts = minPts
+        self.max_neighbors = max_neighbors
+        self.chunksize = chunksize
+        self.cluster = None
+        self.is_core = None
+
+    def fit(self, data):
+        """
+        Cluster the data.
+
+        Args:
+            data (pandas.DataFrame): The input data.
+
+        Returns:
+            ChunkedDBSCAN: The fitted model.
+        """
+        points = np.asarray(data, dtype=float)
+        tree = cKDTree(points)
+        counts = np.concatenate([tree.query_ball_point(points[start:start + self.chunksize], self.eps,
+                                                       return_length=True)
+                                 for start in range(0, len(points), self.chunksize)])
+        self.is_core = counts >= self.minPts
+
+        components = _UnionFind(len(points))
+        border, border_core = [], []
+        for start, stop in self._neighbor_chunks(counts):
+            neighbors = tree.query_ball_point(points[start:stop], self.eps)
+            source = np.repeat(np.arange(start, stop), counts[start:stop])
+            target = np.fromiter(itertools.chain.from_iterable(neighbors), dtype=np.intp, count=len(source))
+            links = self.is_core[source] & self.is_core[target] & (source < target)
+            components.union(source[links], target[links])
+            # Non-core points have fewer than minPts neighbors, so keeping these pairs is O(n * minPts)
+            reach = ~self.is_core[source] & self.is_core[target]
+            border.append(source[reach])
+            border_core.append(target[reach])
+
+        roots = components.find(np.arange(len(points)))
+        border, border_core = np.concatenate(border), np.concatenate(border_core)
+        if len(border):
+            # A border point joins the first expanded cluster that reaches it, the one with the lowest root
+            first = np.full(len(points), len(points))
+            np.minimum.at(first, border, roots[border_core])
+            roots[border] = first[border]
+        assigned = self.is_core.copy()
+        assigned[border] = True
+        self.cluster = np.zeros(len(points), dtype=np.int64)
+        self.cluster[assigned] = np.unique(roots[assigned], return_inverse=True)[1] + 1
+        return self
+
+    def _neighbor_chunks(self, counts):
+        """
+        Internal method splitting the points into consecutive runs of at most max_neighbors neighbors.
+
+        Args:
+            counts (numpy.ndarray): The neighborhood size of each point.
+
+        Yields:
+            tuple: The start and stop index of each run.
+        """
+        cumulative = np.cumsum(counts)
+        start = 0
+        while start < len(counts):
+            offset = cumulative[start - 1] if start else 0
+            stop = max(int(np.searchsorted(cumulative, offset + self.max_neighbors, side='right')), start + 1)
+            yield start, stop
+            start = stop
+
+
+class _UnionFind:
+    """
+    Array-based union-find where every root is the lowest index of its set.
+    """
+
+    def __init__(self, n):
+        """
+        Initialize the _UnionFind object with n singleton sets.
+
+        Args:
+            n (int): Number of elements.
+        """
+        self.parent = np.arange(n)
+
+    def find(self, items):
+        """
+        Find the root of each item, shortcutting the paths on the way.
+
+        Args:
+            items (numpy.ndarray): The items.
+
+        Returns:
+            numpy.ndarray: The root of each item.
+        """
+        roots = self.parent[items]
+        while True:
+            parents = self.parent[roots]
+            if (parents == roots).all():
+                break
+            roots = parents
+        self.parent[items] = roots
+        return roots
+
+    def union(self, a, b):
+        """
+        Merge the sets of every pair (a[i], b[i]).
+
+        Args:
+            a (numpy.ndarray): The first item of each pair.
+            b (numpy.ndarray): The second item of each pair.
+        """
+        while len(a):
+            root_a, root_b = self.find(a), self.find(b)
+            differ = root_a != root_b
+            a, b = a[differ], b[differ]
+            # Hooking the higher root under the lower one keeps every root the minimum of its set
+            np.minimum.at(self.parent, np.maximum(root_a[differ], root_b[differ]),
+                          np.minimum(root_a[differ], root_b[differ]))
+
+
+class MiniBatchKMeans:
+    """
+    Mini-batch K-Means (Sculley, 2010) over in-memory data or a stream of chunks.
+    """
+
+    def __init__(self, centers=3, batch_size=1024, max_iter=100, tol=1e-4, seed=None):
+        """
+        Initialize the MiniBatchKMeans object.
+
+        Args:
+            centers (int): The number of clusters. Default is 3.
+            batch_size (int): Number of points per mini-batch. Default is 1024.
+            max_iter (int): Maximum number of mini-batches drawn from in-memory data. Default is 100.
+            tol (float): Stop when no centroid moves by more than tol, relative to the data scale.
+                Default is 1e-4.
+            seed (int): Seed of the random generator.
+        """
+        self.k = centers
+        self.batch_size = batch_size
+        self.max_iter = max_iter
+        self.tol = tol
+        self.rng = np.random.default_rng(seed)
+        self.columns = None
+        self.centers = None
+        self.counts = None
+        self.cluster = None
+        self.tot_withinss = None
+
+    def fit(self, data):
+        """
+        Fit the centroids.
+
+        Args:
+            data (pandas.DataFrame or iterable): In-memory data, from which max_iter random batches are
+                drawn, or an iterator of DataFrame chunks, consumed once.
+
+        Returns:
+            MiniBatchKMeans: The fitted model.
+        """
+        if not isinstance(data, pd.DataFrame):
+            for chunk in data:
+                self.partial_fit(chunk)
+            return self
+        points = np.asarray(data, dtype=float)
+        self.columns = list(data.columns)
+        scale = points[:min(len(points), 10000)].var(axis=0).mean()
+        for _ in range(self.max_iter):
+            previous = None if self.centers is None else self.centers.copy()
+            self._update(points[self.rng.choice(len(points), min(self.batch_size, len(points)), replace=False)])
+            if previous is not None and ((self.centers - previous) ** 2).sum(axis=1).max() <= self.tol * scale:
+                break
+        self.cluster, self.tot_withinss = self._assign(points)
+        return self
+
+    def partial_fit(self, chunk):
+        """
+        Update the centroids with one chunk of data.
+
+        Args:
+            chunk (pandas.DataFrame): The next chunk of data.
+
+        Returns:
+            MiniBatchKMeans: The updated model.
+        """
+        if self.columns is None:
+            self.columns = list(chunk.columns)
+        points = np.asarray(chunk[self.columns], dtype=float)
+        for start in range(0, len(points), self.batch_size):
+            self._update(points[start:start + self.batch_size])
+        return self
+
+    def predict(self, data, chunksize=100000):
+        """
+        Assign points to their nearest centroid.
+
+        Args:
+            data (pandas.DataFrame): The points to assign.
+            chunksize (int): Number of points per chunk. Default is 100000.
+
+        Returns:
+            numpy.ndarray: The cluster of each point, numbered from 1 as in R.
+        """
+        return self._assign(np.asarray(data[self.columns], dtype=float), chunksize)[0]
+
+    def inertia(self, data, chunksize=100000):
+        """
+        Compute the total within-cluster sum of squares of data.
+
+        Args:
+            data (pandas.DataFrame or iterable): The points, or an iterator of DataFrame chunks.
+            chunksize (int): Number of points per chunk. Default is 100000.
+
+        Returns:
+            float: The total within-cluster sum of squares.
+        """
+        chunks = [data] if isinstance(data, pd.DataFrame) else data
+        return sum(self._assign(np.asarray(chunk[self.columns], dtype=float), chunksize)[1] for chunk in chunks)
+
+    def _update(self, batch):
+        """
+        Internal method moving the centroids towards a mini-batch.
+
+        Each centroid has a learning rate of 1 / (number of points assigned to it so far).
+
+        Args:
+            batch (numpy.ndarray): The mini-batch.
+        """
+        if self.centers is None:
+            self._init_centers(batch)
+        labels = self._nearest(batch)[0]
+        sizes = np.bincount(labels, minlength=self.k)
+        sums = np.zeros_like(self.centers)
+        np.add.at(sums, labels, batch)
+        self.counts += sizes
+        updated = sizes > 0
+        self.centers[updated] += (sums[updated] - sizes[updated, None] * self.centers[updated]) / self.counts[updated, None]
+
+    def _init_centers(self, batch):
+        """
+        Internal method choosing the initial centroids with k-means++ on the first mini-batch.
+
+        Args:
+            batch (numpy.ndarray): The first mini-batch.
+        """
+        if len(batch) < self.k:
+            raise ValueError(f"The first batch has fewer points than the {self.k} clusters.")
+        centers = [batch[self.rng.integers(len(batch))]]
+        distances = ((batch - centers[0]) ** 2).sum(axis=1)
+        for _ in range(1, self.k):
+            total = distances.sum()
+            index = self.rng.choice(len(batch), p=distances / total) if total > 0 else self.rng.integers(len(batch))
+            centers.append(batch[index])
+            distances = np.minimum(distances, ((batch - batch[index]) ** 2).sum(axis=1))
+        self.centers = np.array(centers)
+        self.counts = np.zeros(self.k, dtype=np.int64)
+
+    def _nearest(self, points):
+        """
+        Internal method finding the nearest centroid of each point.
+
+        Args:
+            points (numpy.ndarray): The points.
+
+        Returns:
+            tuple: The index of the nearest centroid and the squared distance to it, for each point.
+        """
+        distances = ((points ** 2).sum(axis=1)[:, None] - 2 * points @ self.centers.T
+                     + (self.centers ** 2).sum(axis=1)[None, :])
+        labels = distances.argmin(axis=1)
+        return labels, np.maximum(distances[np.arange(len(points)), labels], 0)
+
+    def _assign(self, points, chunksize=100000):
+        """
+        Internal method assigning points to their nearest centroid, one chunk at a time.
+
+        Args:
+            points (numpy.ndarray): The points.
+            chunksize (int): Number of points per chunk. Default is 100000.
+
+        Returns:
+            tuple: The cluster of each point (numbered from 1) and the total within-cluster sum of squares.
+        """
+        labels = np.empty(len(points), dtype=np.int64)
+        total = 0.0
+        for start in range(0, len(points), chunksize):
+            labels[start:start + chunksize], distances = self._nearest(points[start:start + chunksize])
+            total += distances.sum()
+        return labels + 1, total
+
+
+def silhouette(points, labels):
+    """
+    Compute the mean silhouette width of a clustering.
+
+    Args:
+        points (numpy.ndarray): The points.
+        labels (numpy.ndarray): The cluster of each point.
+
+    Returns:
+        float: The mean silhouette width. Points alone in their cluster count as 0.
+    """
+    distances = np.sqrt(np.maximum((points ** 2).sum(axis=1)[:, None] - 2 * points @ points.T
+                                   + (points ** 2).sum(axis=1)[None, :], 0))
+    clusters, labels = np.unique(labels, return_inverse=True)
+    if len(clusters) < 2:
+        return 0.0
+    sums = distances @ np.eye(len(clusters))[labels]
+    sizes = np.bincount(labels)
+    own = sizes[labels] - 1
+    a = np.where(own > 0, sums[np.arange(len(points)), labels] / np.maximum(own, 1), 0)
+    means = sums / sizes
+    means[np.arange(len(points)), labels] = np.inf
+    b = means.min(axis=1)
+    widths = np.where(own > 0, (b - a) / np.maximum(np.maximum(a, b), np.finfo(float).tiny), 0)
+    return float(widths.mean())
+
+
+def nearest_center(points, centers, chunksize=100000):
+    """
+    Find the nearest center of each point, one chunk of points at a time.
+
+    Args:
+        points (numpy.ndarray): The points.
+        centers (numpy.ndarray): The centers.
+        chunksize (int): Number of points per chunk. Default is 100000.
+
+    Returns:
+        tuple: The index of the nearest center and the Euclidean distance to it, for each point.
+    """
+    labels = np.empty(len(points), dtype=np.int64)
+    distances = np.empty(len(points))
+    squared_centers = (centers ** 2).sum(axis=1)
+    for start in range(0, len(points), chunksize):
+        chunk = points[start:start + chunksize]
+        squared = (chunk ** 2).sum(axis=1)[:, None] - 2 * chunk @ centers.T + squared_centers[None, :]
+        labels[start:start + len(chunk)] = squared.argmin(axis=1)
+        distances[start:start + len(chunk)] = np.sqrt(np.maximum(squared.min(axis=1), 0))
+    return labels, distances
+
+
+def row_chunks(data, chunksize):
+    """
+    Split the rows of a matrix or data frame into chunks.
+
+    Args:
+        data (numpy.ndarray or pandas.DataFrame): The rows.
+        chunksize (int): Maximum number of rows per chunk.
+
+    Yields:
+        numpy.ndarray: The float values of each chunk.
+    """
+    for start in range(0, len(data), chunksize):
+        yield np.asarray(data[start:start + chunksize], dtype=float)
+
+
+def pca_scores(chunks, rotation, center, scales):
+    """
+    Project row chunks on the principal components.
+
+    Args:
+        chunks (iterable): The row chunks.
+        rotation (numpy.ndarray): The (columns x components) loadings.
+        center (numpy.ndarray): The column means.
+        scales (numpy.ndarray): The column scales, ones when the data is not scaled.
+
+    Returns:
+        numpy.ndarray: The (rows x components) scores.
+    """
+    return np.concatenate([((np.asarray(chunk, dtype=float) - center) / scales) @ rotation for chunk in chunks])
+
+
+def randomized_pca(points, scale, rank, oversamples, n_iter, seed):
+    """
+    Compute the top principal components of a matrix by randomized truncated SVD (Halko et al., 2011).
+
+    The centered and scaled matrix is never formed: its products with other matrices are
+    computed from the original one.
+
+    Args:
+        points (numpy.ndarray): The (rows x columns) data.
+        scale (bool): Whether to scale the columns to unit variance.
+        rank (int): Number of components to compute.
+        oversamples (int): Number of extra random directions sampled beyond rank.
+        n_iter (int): Number of power iterations.
+        seed (int): Seed of the random directions, or None.
+
+    Returns:
+        tuple: The standard deviations of the components, the (columns x rank) loadings, the column
+            means and the column scales, as prcomp's sdev, rotation, center and scale.
+    """
+    n, p = points.shape
+    center = points.mean(axis=0)
+    scales = points.std(axis=0, ddof=1) if scale else np.ones(p)
+    if np.any(scales == 0):
+        raise ValueError("Cannot rescale a constant/zero column to unit variance.")
+
+    def product(basis):
+        # (points - center) / scales @ basis
+        basis = basis / scales[:, None]
+        return points @ basis - center @ basis
+
+    def transposed_product(basis):
+        # ((points - center) / scales).T @ basis
+        return (points.T @ basis - np.outer(center, basis.sum(axis=0))) / scales[:, None]
+
+    width = min(rank + oversamples, n, p)
+    basis = np.linalg.qr(product(np.random.default_rng(seed).standard_normal((p, width))))[0]
+    # Power iterations sharpen the decay of the spectrum, re-orthonormalized for stability
+    for _ in range(n_iter):
+        basis = np.linalg.qr(transposed_product(basis))[0]
+        basis = np.linalg.qr(product(basis))[0]
+    _, singular_values, components = np.linalg.svd(transposed_product(basis).T, full_matrices=False)
+    return singular_values[:rank] / np.sqrt(n - 1), components[:rank].T, center, scales
+
+
+class IncrementalPCA:
+    """
+    PCA from row chunks, accumulating the covariance matrix in memory bounded by the number of columns.
+
+    The rows are shifted by the first row seen before accumulating, which keeps the covariance
+    accurate when the means are large compared to the spreads.
+    """
+
+    def __init__(self, scale=True, rank=None):
+        """
+        Initialize the IncrementalPCA object.
+
+        Args:
+            scale (bool): Whether to scale the columns to unit variance. Default is True.
+            rank (int): Number of components to keep. Default is None (all of them).
+        """
+        self.scale_data = scale
+        self.rank = rank
+        self.n = 0
+        self.columns = None
+        self._shift = None
+        self._sum = None
+        self._cross = None
+        self.sdev = None
+        self.rotation = None
+        self.center = None
+        self.scale = None
+
+    def partial_fit(self, chunk):
+        """
+        Add a chunk of rows; the components are updated by decompose().
+
+        Args:
+            chunk (numpy.ndarray or pandas.DataFrame): The rows.
+
+        Returns:
+            IncrementalPCA: The model.
+        """
+        if self._shift is None:
+            self.columns = getattr(chunk, 'columns', None)
+        chunk = np.asarray(chunk, dtype=float)
+        if self._shift is None:
+            self._shift = chunk[0].copy()
+            self._sum = np.zeros(chunk.shape[1])
+            self._cross = np.zeros((chunk.shape[1], chunk.shape[1]))
+        shifted = chunk - self._shift
+        self._sum += shifted.sum(axis=0)
+        self._cross += shifted.T @ shifted
+        self.n += len(chunk)
+        self.rotation = None
+        return self
+
+    def transform(self, chunk):
+        """
+        Project a chunk of rows on the components.
+
+        Args:
+            chunk (numpy.ndarray or pandas.DataFrame): The rows.
+
+        Returns:
+            numpy.ndarray: The (rows x components) scores.
+        """
+        if self.rotation is None:
+            self.decompose()
+        return pca_scores([chunk], self.rotation, self.center, self.scale)
+
+    def decompose(self):
+        """
+        Compute the components from the covariance (or correlation) matrix of the rows seen so far.
+
+        Returns:
+            IncrementalPCA: The model, with sdev, rotation, center and scale set as in prcomp.
+        """
+        mean = self._sum / self.n
+        covariance = (self._cross - self.n * np.outer(mean, mean)) / max(self.n - 1, 1)
+        self.center = self._shift + mean
+        self.scale = np.sqrt(np.diag(covariance)) if self.scale_data else np.ones(len(mean))
+        if np.any(self.scale == 0):
+            raise ValueError("Cannot rescale a constant/zero column to unit variance.")
+        eigenvalues, eigenvectors = np.linalg.eigh(covariance / np.outer(self.scale, self.scale))
+        # eigh sorts in increasing order; prcomp keeps min(n, p) components, largest first
+        order = np.argsort(eigenvalues)[::-1][:min(self.n, len(mean))]
+        self.sdev = np.sqrt(np.clip(eigenvalues[order], 0, None))
+        self.rotation = eigenvectors[:, order[:self.rank]]
+        return self
+
+def hclust_linkage(data, method, chunksize=10000, directory=None, dtype="float64"):
+    """
+    Hierarchically cluster observations on their Euclidean distances without holding the n x n distances.
+
+    "single" linkage uses a minimum spanning tree and "ward.D2" a nearest-neighbor chain over the
+    cluster centroids, both in O(n) memory. "complete", "average", "mcquitty" and "ward.D" update
+    the distances between clusters, so they run a nearest-neighbor chain on a condensed distance
+    matrix memory-mapped to a temporary file: O(n) memory, but n (n - 1) / 2 values on disk.
+
+    Args:
+        data (numpy.ndarray or pandas.DataFrame): The observations.
+        method (str): The agglomeration method, named as in hclust.
+        chunksize (int): Number of rows per distance computation. Default is 10000.
+        directory (str): Directory of the temporary distance matrix. Default is None (the system one).
+        dtype (str): The NumPy dtype of the distance matrix. Default is "float64".
+
+    Returns:
+        tuple: hclust's merge matrix, merge heights and leaf order.
+    """
+    points = np.asarray(data, dtype=float)
+    if points.ndim == 1:
+        points = points[:, None]
+    if len(points) < 2:
+        raise ValueError("Must have n >= 2 objects to cluster.")
+    if method == "single":
+        pairs, heights = _mst_single_linkage(points, chunksize)
+    elif method == "ward.D2":
+        pairs, heights = _nn_chain_centroids(points)
+    elif method in _LANCE_WILLIAMS:
+        pairs, heights = _nn_chain_matrix(points, method, chunksize, directory, dtype)
+    else:
+        raise ValueError("Invalid method. Supported methods are 'single', 'complete', 'average', "
+                         "'mcquitty', 'ward.D' and 'ward.D2'.")
+    return _hclust_merge(pairs, heights, len(points))
+
+
+def _mst_single_linkage(points, chunksize):
+    """
+    Internal method computing the single linkage merges from a minimum spanning tree grown by Prim's
+    algorithm, in O(n) memory.
+
+    Args:
+        points (numpy.ndarray): The (observations x variables) data.
+        chunksize (int): Number of rows per distance computation.
+
+    Returns:
+        tuple: The merges, as a pair of points of the two merged clusters, and their heights.
+    """
+    n = len(points)
+    in_tree = np.zeros(n, dtype=bool)
+    # Distance of every point outside the tree to the tree, and the tree point it is closest to
+    best = np.full(n, np.inf)
+    parent = np.zeros(n, dtype=np.int64)
+    pairs, heights = [], []
+    current = 0
+    for _ in range(n - 1):
+        in_tree[current] = True
+        for start in range(0, n, chunksize):
+            block = slice(start, start + chunksize)
+            distances = np.sqrt(((points[block] - points[current]) ** 2).sum(axis=1))
+            closer = (distances < best[block]) & ~in_tree[block]
+            best[block][closer] = distances[closer]
+            parent[block][closer] = current
+        best[current] = np.inf
+        candidates = np.where(in_tree, np.inf, best)
+        current = int(np.argmin(candidates))
+        pairs.append((parent[current], current))
+        heights.append(best[current])
+    return pairs, heights
+
+
+def _nn_chain_centroids(points):
+    """
+    Internal method computing the Ward (ward.D2) merges by the nearest-neighbor chain over the cluster
+    centroids, in O(n) memory.
+
+    Args:
+        points (numpy.ndarray): The (observations x variables) data.
+
+    Returns:
+        tuple: The merges, as a pair of points of the two merged clusters, and their heights.
+    """
+    n = len(points)
+    centroids = points.copy()
+    sizes = np.ones(n)
+    active = np.ones(n, dtype=bool)
+    pairs, heights = [], []
+    chain = []
+    for _ in range(n - 1):
+        if not chain:
+            chain.append(int(np.argmax(active)))
+        while True:
+            x = chain[-1]
+            # Squared Ward distance between clusters: 2 |A| |B| / (|A| + |B|) * ||cA - cB||^2
+            distances = 2 * sizes[x] * sizes / (sizes[x] + sizes) * ((centroids - centroids[x]) ** 2).sum(axis=1)
+            distances[~active] = np.inf
+            distances[x] = np.inf
+            y = int(np.argmin(distances))
+            # On ties, going back down the chain ensures termination
+            if len(chain) > 1 and distances[chain[-2]] <= distances[y]:
+                y = chain[-2]
+            if len(chain) > 1 and y == chain[-2]:
+                break
+            chain.append(y)
+        chain.pop()
+        chain.pop()
+        pairs.append((x, y))
+        heights.append(np.sqrt(distances[y]))
+        centroids[y] = (sizes[x] * centroids[x] + sizes[y] * centroids[y]) / (sizes[x] + sizes[y])
+        sizes[y] += sizes[x]
+        active[x] = False
+    return pairs, heights
+
+
+# Lance-Williams updates of the distance between a cluster k and the merge of clusters x and y
+_LANCE_WILLIAMS = {
+    'complete': lambda dx, dy, dxy, nx, ny, nk: np.maximum(dx, dy),
+    'average': lambda dx, dy, dxy, nx, ny, nk: (nx * dx + ny * dy) / (nx + ny),
+    'mcquitty': lambda dx, dy, dxy, nx, ny, nk: (dx + dy) / 2,
+    'ward.D': lambda dx, dy, dxy, nx, ny, nk: ((nk + nx) * dx + (nk + ny) * dy - nk * dxy) / (nk + nx + ny),
+}
+
+
+def _nn_chain_matrix(points, method, chunksize, directory, dtype):
+    """
+    Internal method computing the merges by the nearest-neighbor chain on a condensed distance matrix
+    memory-mapped to a temporary file.
+
+    The file holds every distance once, as the upper triangle of the matrix in row order, like
+    R's dist object: n (n - 1) / 2 values of dtype, so its size still grows as n^2.
+
+    Args:
+        points (numpy.ndarray): The (observations x variables) data.
+        method (str): A method of _LANCE_WILLIAMS.
+        chunksize (int): Number of rows per distance computation.
+        directory (str): Directory of the temporary file, or None for the default one.
+        dtype (str): The NumPy dtype of the distances.
+
+    Returns:
+        tuple: The merges, as a pair of points of the two merged clusters, and their heights.
+    """
+    n = len(points)
+    update = _LANCE_WILLIAMS[method]
+    with tempfile.NamedTemporaryFile(dir=directory, suffix='.dist') as f:
+        distances = np.memmap(f, dtype=dtype, mode='w+', shape=(n * (n - 1) // 2,))
+        for start in range(0, n, chunksize):
+            stop = min(start + chunksize, n)
+            block = cdist(points[start:stop], points[start:])
+            # The upper triangle of consecutive rows is one contiguous run of the condensed matrix
+            upper = np.arange(n - start)[None, :] > np.arange(stop - start)[:, None]
+            distances[_condensed_index(n, start, start + 1):_condensed_index(n, stop, stop + 1)] = block[upper]
+        sizes = np.ones(n)
+        active = np.ones(n, dtype=bool)
+        pairs, heights = [], []
+        chain = []
+        for _ in range(n - 1):
+            if not chain:
+                chain.append(int(np.argmax(active)))
+            while True:
+                x = chain[-1]
+                row = _condensed_row(distances, n, x)
+                row[~active] = np.inf
+                row[x] = np.inf
+                y = int(np.argmin(row))
+                if len(chain) > 1 and row[chain[-2]] <= row[y]:
+                    y = chain[-2]
+                if len(chain) > 1 and y == chain[-2]:
+                    break
+                chain.append(y)
+            chain.pop()
+            chain.pop()
+            pairs.append((x, y))
+            heights.append(row[y])
+            # The merged cluster takes the place of y; distances to inactive clusters are never read again
+            merged = update(row, _condensed_row(distances, n, y), row[y], sizes[x], sizes[y], sizes)
+            active[x] = False
+            before = np.flatnonzero(active[:y])
+            distances[_condensed_index(n, before, y)] = merged[before]
+            first = _condensed_index(n, y, y + 1)
+            distances[first:first + n - y - 1] = merged[y + 1:]
+            sizes[y] += sizes[x]
+        del distances
+    return pairs, heights
+
+
+def _condensed_index(n, i, j):
+    """
+    Internal method locating the distance between i and j, with i < j, in a condensed distance matrix.
+
+    Args:
+        n (int): Number of observations.
+        i (int or numpy.ndarray): The first observation.
+        j (int or numpy.ndarray): The second observation.
+
+    Returns:
+        int or numpy.ndarray: The position in the condensed matrix, as in scipy's squareform.
+    """
+    return n * i - i * (i + 1) // 2 + j - i - 1
+
+
+def _condensed_row(distances, n, x):
+    """
+    Internal method reading the distances of one observation to all the others from a condensed matrix.
+
+    Args:
+        distances (numpy.ndarray): The condensed distance matrix.
+        n (int): Number of observations.
+        x (int): The observation.
+
+    Returns:
+        numpy.ndarray: The n distances, 0 for x itself.
+    """
+    row = np.zeros(n)
+    before = np.arange(x)
+    row[:x] = distances[_condensed_index(n, before, x)]
+    first = _condensed_index(n, x, x + 1)
+    row[x + 1:] = distances[first:first + n - x - 1]
+    return row
+
+
+def _hclust_merge(pairs, heights, n):
+    """
+    Internal method converting merges of (point in cluster a, point in cluster b) into hclust's merge,
+    height and order.
+
+    Args:
+        pairs (list): A point of each of the two merged clusters, for every merge.
+        heights (list): The height of every merge.
+        n (int): Number of observations.
+
+    Returns:
+        tuple: The (n - 1 x 2) merge matrix, the sorted heights and the leaf order, numbered as in hclust.
+    """
+    steps = np.argsort(heights, kind='stable')
+    root = np.arange(n)
+    # hclust numbers the singletons -1..-n and the clusters by the step that formed them
+    label = -np.arange(1, n + 1)
+
+    def find(i):
+        while root[i] != i:
+            root[i] = root[root[i]]
+            i = root[i]
+        return i
+
+    merge = np.zeros((n - 1, 2), dtype=np.int64)
+    for step, index in enumerate(steps):
+        a, b = find(pairs[index][0]), find(pairs[index][1])
+        first, second = sorted((label[a], label[b]), key=lambda value: (value > 0, abs(value)))
+        merge[step] = first, second
+        root[b] = a
+        label[a] = step + 1
+    # Leaf order: depth-first through the merges, first member on the left
+    order, stack = [], [n - 1]
+    while stack:
+        item = stack.pop()
+        if item < 0:
+            order.append(-item)
+        else:
+            stack.extend(reversed(merge[item - 1]))
+    return merge, np.asarray(heights, dtype=float)[steps], np.asarray(order)
+
+
+def pairwise_summaries(data, bins, n_jobs=1):
+    """
+    Summarize every pair of columns for the scalable scatterplot matrix.
+
+    Every column is binned once; each pair is then counted with a single bincount of the
+    combined bin codes, optionally across threads (bincount runs without the GIL).
+
+    Args:
+        data (pandas.DataFrame): The numeric columns. Rows with missing values are dropped.
+        bins (int): Number of bins per column.
+        n_jobs (int): Number of threads counting the pairs. Default is 1.
+
+    Returns:
+        tuple: Three pandas.DataFrame, each with the facet 'row' and 'col' of its entries:
+            the non-empty 2D bins below the diagonal ('x', 'y', 'count'), the histogram bars on
+            the diagonal ('xmin', 'xmax', 'ymin', 'ymax') and the correlations above it ('x', 'y', 'label').
+    """
+    data = data.dropna()
+    columns = list(data.columns)
+    if len(columns) < 2:
+        raise ValueError("A scatterplot matrix needs at least two numeric columns.")
+    if data.empty:
+        raise ValueError("A scatterplot matrix needs at least one row without missing values.")
+    values = np.asarray(data, dtype=float)
+    low, high = values.min(axis=0), values.max(axis=0)
+    width = np.where(high > low, (high - low) / bins, 1.0)
+    codes = np.clip(((values - low) / width).astype(np.int64), 0, bins - 1)
+    centers = low[:, None] + (np.arange(bins)[None, :] + 0.5) * width[:, None]
+    standardized = (values - values.mean(axis=0)) / np.where(values.std(axis=0) > 0, values.std(axis=0), 1.0)
+    correlation = standardized.T @ standardized / len(values)
+
+    pairs = [(i, j) for i in range(len(columns)) for j in range(i)]
+
+    def count(pair):
+        i, j = pair
+        return np.bincount(codes[:, i] * bins + codes[:, j], minlength=bins * bins)
+
+    if n_jobs == 1:
+        counts = [count(pair) for pair in pairs]
+    else:
+        with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+            counts = list(executor.map(count, pairs))
+
+    def facet(rows, cols):
+        return {'row': pd.Categorical(rows, categories=columns), 'col': pd.Categorical(cols, categories=columns)}
+
+    tiles = []
+    for (i, j), pair_counts in zip(pairs, counts):
+        cells = np.flatnonzero(pair_counts)
+        tiles.append(pd.DataFrame({**facet([columns[i]] * len(cells), [columns[j]] * len(cells)),
+                                   'x': centers[j][cells % bins], 'y': centers[i][cells // bins],
+                                   'count': pair_counts[cells]}))
+    histograms = []
+    for i, column in enumerate(columns):
+        column_counts = np.bincount(codes[:, i], minlength=bins)
+        # Bars are scaled to the range of the column, which is also the y scale of the diagonal panel
+        histograms.append(pd.DataFrame({**facet([column] * bins, [column] * bins),
+                                        'xmin': centers[i] - width[i] / 2, 'xmax': centers[i] + width[i] / 2,
+                                        'ymin': low[i],
+                                        'ymax': low[i] + column_counts / column_counts.max() * (high[i] - low[i])}))
+    upper = [(j, i) for i, j in pairs]
+    correlations = pd.DataFrame({**facet([columns[row] for row, col in upper], [columns[col] for row, col in upper]),
+                                 'x': [(low[col] + high[col]) / 2 for row, col in upper],
+                                 'y': [(low[row] + high[row]) / 2 for row, col in upper],
+                                 'label': [f'Corr: {correlation[row, col]:.3f}' for row, col in upper]})
+    return pd.concat(tiles, ignore_index=True), pd.concat(histograms, ignore_index=True), correlations
+
+
+def bin_2d(x, y, bins):
+    """
+    Count points on a regular grid, for binned scatterplots.
+
+    Args:
+        x (pandas.Series): The x coordinates.
+        y (pandas.Series): The y coordinates.
+        bins (int): Number of cells per axis.
+
+    Returns:
+        pandas.DataFrame: The center of every non-empty cell, under the names of x and y, and its 'count'.
+            Points missing x or y are dropped, as geom_point does.
+    """
+    complete = x.notna() & y.notna()
+    x, y = x[complete], y[complete]
+    if not len(x):
+        return pd.DataFrame({x.name: [], y.name: [], 'count': []})
+    centers, codes = [], []
+    for values in (np.asarray(x, dtype=float), np.asarray(y, dtype=float)):
+        edges = np.linspace(values.min(), values.max(), bins + 1)
+        codes.append(np.clip(np.searchsorted(edges, values, side='right') - 1, 0, bins - 1))
+        centers.append((edges[:-1] + edges[1:]) / 2)
+    counts = np.bincount(codes[0] * bins + codes[1], minlength=bins * bins)
+    cells = np.flatnonzero(counts)
+    return pd.DataFrame({x.name: centers[0][cells // bins], y.name: centers[1][cells % bins], 'count': counts[cells]})
+
+
+def lttb(x, y, n_out):
+    """
+    Downsample a line with Largest-Triangle-Three-Buckets, which keeps its visual shape.
+
+    Args:
+        x (pandas.Series): The x coordinates, sorted. Datetimes, time zone aware or not, are allowed.
+        y (pandas.Series): The y coordinates.
+        n_out (int): Number of points to keep.
+
+    Returns:
+        numpy.ndarray: The increasing positions of the points kept, first and last included.
+    """
+    if pd.api.types.is_datetime64_any_dtype(x):
+        # Epoch ticks, in UTC for time zone aware values
+        x = pd.DatetimeIndex(x).asi8
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    if n_out >= len(x) or n_out < 3:
+        return np.arange(len(x))
+    # The first and last points are kept, the others are split into n_out - 2 buckets
+    edges = np.linspace(1, len(x) - 1, n_out - 1).astype(np.int64)
+    kept = np.empty(n_out, dtype=np.int64)
+    kept[0], kept[-1] = 0, len(x) - 1
+    for i in range(n_out - 2):
+        start, stop = edges[i], edges[i + 1]
+        if i + 2 < len(edges):
+            next_x, next_y = x[stop:edges[i + 2]].mean(), y[stop:edges[i + 2]].mean()
+        else:
+            next_x, next_y = x[-1], y[-1]
+        previous = kept[i]
+        # Twice the area of the triangle (previous kept point, candidate, mean of the next bucket)
+        areas = np.abs((x[previous] - next_x) * (y[start:stop] - y[previous])
+                       - (x[previous] - x[start:stop]) * (next_y - y[previous]))
+        kept[i + 1] = start + areas.argmax()
+    return kept
+
+
+# Binning arguments of geom_histogram handled by histogram()
+HISTOGRAM_ARGS = ('bins', 'binwidth', 'boundary', 'center', 'breaks', 'closed')
+
+
+def histogram(x, bins=30, binwidth=None, boundary=None, center=None, breaks=None, closed='right'):
+    """
+    Precompute a histogram with the bins geom_histogram would use.
+
+    As in ggplot2, 30 bins of (max - min) / 29 centered on the data range by default, or bins of
+    width binwidth aligned on boundary (or center), or the given breaks; bins are closed on the
+    right and the first one also includes its left edge.
+
+    Args:
+        x (pandas.Series): The values. Missing values are dropped.
+        bins (int): Number of bins, used without binwidth and breaks. Default is 30.
+        binwidth (float): The width of the bins. Default is None.
+        boundary (float): A boundary between two bins. Default is None.
+        center (float): The center of one bin, used without boundary. Default is None.
+        breaks (array-like): The bin edges, overriding the other arguments. Default is None.
+        closed (str): 'right' or 'left', the closed side of the bins. Default is 'right'.
+
+    Returns:
+        pandas.DataFrame: The bin centers, under the name of x, their edges 'xmin' and 'xmax' and their 'count'.
+    """
+    if closed not in ('right', 'left'):
+        raise ValueError("closed must be 'right' or 'left'.")
+    values = np.asarray(x.dropna(), dtype=float)
+    if breaks is not None:
+        edges = np.sort(np.asarray(breaks, dtype=float))
+    else:
+        low, high = (values.min(), values.max()) if len(values) else (0.0, 0.0)
+        if binwidth is None:
+            if high == low:
+                binwidth = 0.1
+            elif bins == 1:
+                binwidth, boundary, center = high - low, low, None
+            else:
+                binwidth = (high - low) / (bins - 1)
+                if boundary is None and center is None:
+                    boundary = low - binwidth / 2
+        if boundary is None:
+            boundary = binwidth / 2 if center is None else center - binwidth / 2
+        origin = boundary + np.floor((low - boundary) / binwidth) * binwidth
+        edges = np.arange(origin, high + (1 - 1e-8) * binwidth, binwidth)
+        if len(edges) == 1:
+            edges = np.append(edges, edges[0] + binwidth)
+    inside = values[(values >= edges[0]) & (values <= edges[-1])]
+    codes = np.searchsorted(edges, inside, side='left' if closed == 'right' else 'right') - 1
+    counts = np.bincount(np.clip(codes, 0, len(edges) - 2), minlength=len(edges) - 1)
+    return pd.DataFrame({x.name: (edges[:-1] + edges[1:]) / 2, 'xmin': edges[:-1], 'xmax': edges[1:],
+                         'count': counts})
+
+
+def bw_nrd0(values):
+    """
+    Compute the bandwidth of R's bw.nrd0, Silverman's rule of thumb.
+
+    Args:
+        values (numpy.ndarray): The values.
+
+    Returns:
+        float: 0.9 * min(sd, IQR / 1.34) * n^-0.2, with the fallbacks of R for constant data.
+    """
+    spread = min(values.std(ddof=1), np.subtract(*np.percentile(values, [75, 25])) / 1.34)
+    if not spread > 0:
+        spread = values.std(ddof=1) or abs(values[0]) or 1.0
+    return 0.9 * spread * len(values) ** -0.2
+
+
+def kde(x, n=512, grid=4096):
+    """
+    Precompute a Gaussian kernel density estimate, as R's density() does for geom_density.
+
+    The values are binned on a fine grid, the bin counts are convolved with the kernel and the
+    result is interpolated at n points, so the cost is linear in the number of values. The
+    bandwidth is R's bw.nrd0 and the range extends 3 bandwidths past the data.
+
+    Args:
+        x (pandas.Series): The values. Missing values are dropped.
+        n (int): Number of points of the estimate. Default is 512, as in R.
+        grid (int): Number of bins of the fine grid. Default is 4096.
+
+    Returns:
+        pandas.DataFrame: The evaluation points, under the name of x, and the 'density'.
+    """
+    values = np.asarray(x.dropna(), dtype=float)
+    bandwidth = bw_nrd0(values)
+    low, high = values.min() - 3 * bandwidth, values.max() + 3 * bandwidth
+    counts, edges = np.histogram(values, bins=grid, range=(low, high))
+    step = edges[1] - edges[0]
+    offsets = np.arange(-int(np.ceil(4 * bandwidth / step)), int(np.ceil(4 * bandwidth / step)) + 1) * step
+    kernel = np.exp(-0.5 * (offsets / bandwidth) ** 2) / (bandwidth * np.sqrt(2 * np.pi))
+    half = (len(kernel) - 1) // 2
+    density = np.convolve(counts, kernel)[half:half + grid] / len(values)
+    points = np.linspace(low, high, n)
+    return pd.DataFrame({x.name: points, 'density': np.interp(points, (edges[:-1] + edges[1:]) / 2, density)})
@@ -6,6 +6,9 @@ import numpy as np
 import rpy2.robjects as robjects
 from rpy2.robjects import pandas2ri
 
+import r_conversion
+import robjects_functions
+
 # Activate automatic conversion of pandas objects to R objects
 pandas2ri.activate()
 
@@ -114,29 +117,55 @@ class RFunctions:
         """
         return self._apply_r_function_with_args('generalized_linear_model', formula, family)
 
-    def pca(self, scale=True):
+    def pca(self, scale=True, method="full", rank=None, **kwargs):
         """
         Perform principal component analysis (PCA).
 
         Args:
             scale (bool, optional): Whether to scale the data. Default is True.
+            method (str, optional): "full" for R's prcomp, "randomized" for a randomized truncated SVD
+                of the top components or "incremental" for a covariance accumulated over row chunks,
+                for data too large for prcomp. Default is "full".
+            rank (int, optional): Number of components to keep. Default is None (all of them).
+            kwargs: Options of the randomized and incremental methods (chunksize, oversamples, n_iter, seed),
+                see robjects_functions.pca.
 
         Returns:
-            R object: Result of PCA.
+            R object: Result of PCA, an R "prcomp" object whatever the method.
         """
-        return self._apply_r_function_with_args('pca', scale)
+        data = self.data
+        if method == "full" and isinstance(data, pd.DataFrame):
+            data = r_conversion.py2r(data)
+        elif method != "full" and not isinstance(data, (pd.DataFrame, pd.Series)):
+            # Earlier calls may have replaced the data by its R conversion
+            data = r_conversion.r2py(data)
+        return robjects_functions.pca(data, scale=scale, method=method, rank=rank, **kwargs)
 
-    def hierarchical_clustering(self, method="complete"):
+    def hierarchical_clustering(self, method="complete", memory_efficient=False, **kwargs):
         """
         Perform hierarchical clustering.
 
         Args:
             method (str, optional): The method to use for clustering. Default is "complete".
+            memory_efficient (bool, optional): Whether to compute the Euclidean distances on the fly instead of
+                building R's dist object in memory, for data too large for it. Only "single" and "ward.D2" avoid
+                storing the distances; the other methods keep them in a temporary file of O(n^2) size.
+                Default is False.
+            kwargs: Options of the memory-efficient linkage (chunksize, directory, dtype),
+                see robjects_functions.hierarchical_clustering.
 
         Returns:
-            R object: Result of hierarchical clustering.
-        """
-        return self._apply_r_function_with_args('hierarchical_clustering', method)
+            R object: Result of hierarchical clustering, an R "hclust" object in both modes.
+        """
+        data = self.data
+        if memory_efficient:
+            if not isinstance(data, (pd.DataFrame, pd.Series)):
+                # Earlier calls may have replaced the data by its R conversion
+                data = r_conversion.r2py(data)
+            return robjects_functions.hierarchical_clustering(data, method, memory_efficient=True, **kwargs)
+        if isinstance(data, pd.DataFrame):
+            data = r_conversion.py2r(data)
+        return robjects_functions.hierarchical_clustering(robjects.r['dist'](data), method)
 
     def _apply_r_function(self, func_name, *args):
         """
@@ -151,7 +180,7 @@ class RFunctions:
         """
         r_func = robjects.r[func_name]
         if isinstance(self.data, pd.DataFrame):
-            self.data = pandas2ri.py2ri(self.data)
+            self.data = r_conversion.py2r(self.data)
         if args:
             return r_func(self.data, *args)
         else:
@@ -170,7 +199,7 @@ class RFunctions:
         """
         r_func = robjects.r[func_name]
         if isinstance(self.data, pd.DataFrame):
-            self.data = pandas2ri.py2ri(self.data)
+            self.data = r_conversion.py2r(self.data)
         return r_func(self.data, *args)
 
     def _apply_r_function_with_other(self, func_name, other):
@@ -186,9 +215,9 @@ class RFunctions:
         """
         r_func = robjects.r[func_name]
         if isinstance(self.data, pd.DataFrame):
-            self.data = pandas2ri.py2ri(self.data)
+            self.data = r_conversion.py2r(self.data)
         if isinstance(other, pd.DataFrame):
-            other = pandas2ri.py2ri(other)
+            other = r_conversion.py2r(other)
         return r_func(self.data, other)
 
 class DataFrameInterface:
@@ -244,4 +273,6 @@ class DataFrameInterface:
 # print(df_interface.linear_regression(df['A']))
 # print(df_interface.generalized_linear_model('A ~ B + C'))
 # print(df_interface.pca())
+# print(df_interface.pca(method='randomized', rank=2, seed=0))
 # print(df_interface.hierarchical_clustering())
+# print(df_interface.hierarchical_clustering(method='ward.D2', memory_efficient=True))
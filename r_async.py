@@ -0,0 +1,284 @@
+"""Awaitable counterparts of the R-backed interfaces, for asyncio programs.
+
+R calls take seconds and would block the event loop. Here they are handed to a
+dedicated executor and awaited:
+
+- without a pool, to the single thread that runs every R call of this process
+  (the embedded R is not thread-safe), so the event loop stays responsive but
+  the R calls run one at a time;
+- with an r_service.RWorkerPool, to its worker processes, so independent
+  analyses overlap.
+
+Every runner limits the number of its calls in flight and supports timeouts and
+cancellation. A call running in a pool worker is stopped by killing the worker;
+a call already running in the R thread cannot be interrupted and runs to
+completion, its result being discarded, and it holds its concurrency slot until
+then.
+
+Example:
+    async def main(data, series):
+        runner = AsyncRunner(pool=RWorkerPool(4, ['ClassificationModels', 'SeasonalAdjutment']),
+                             max_concurrency=8, timeout=120)
+        models = AsyncClassificationModels(data, 'target', runner=runner)
+        seasonal = AsyncSeasonalAdjustment(series, runner=runner)
+        forest, components = await asyncio.gather(models.random_forest(ntree=200),
+                                                  seasonal.seasonal_decompose())
+"""
+
+import asyncio
+import functools
+import inspect
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import r_service
+
+_r_executor = None
+_r_executor_lock = threading.Lock()
+
+
+def r_executor():
+    """
+    Get the executor running the R calls of this process, started on first use.
+
+    Returns:
+        concurrent.futures.ThreadPoolExecutor: The executor, with a single thread.
+    """
+    global _r_executor
+    with _r_executor_lock:
+        if _r_executor is None:
+            _r_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='R')
+        return _r_executor
+
+
+def _call(target, args, kwargs):
+    """
+    Call a function in the R thread, consuming its result if it is a generator.
+
+    Args:
+        target (callable): The function.
+        args (tuple): Positional arguments.
+        kwargs (dict): Keyword arguments.
+
+    Returns:
+        The result, a list for generators (they would otherwise run R outside the R thread).
+    """
+    result = target(*args, **kwargs)
+    if inspect.isgenerator(result):
+        result = list(result)
+    return result
+
+
+def _release_from_thread(loop, semaphore, future):
+    """
+    Release a semaphore of an event loop from the thread that completed a future.
+
+    Args:
+        loop (asyncio.AbstractEventLoop): The loop of the semaphore.
+        semaphore (asyncio.Semaphore): The semaphore.
+        future (concurrent.futures.Future): The completed future.
+    """
+    if not loop.is_closed():
+        loop.call_soon_threadsafe(semaphore.release)
+
+
+def _path(target):
+    """
+    Get the dotted path of a module-level function or class.
+
+    Args:
+        target (str or callable): The object, or its dotted path.
+
+    Returns:
+        str: The dotted path, e.g. 'robjects_functions.mean'.
+    """
+    if isinstance(target, str):
+        return target
+    return f'{target.__module__}.{target.__qualname__}'
+
+
+class AsyncRunner:
+    """
+    Runs R work for coroutines, with a concurrency limit, timeouts and cancellation.
+    """
+
+    def __init__(self, pool=None, max_concurrency=None, timeout=None):
+        """
+        Initialize the AsyncRunner object.
+
+        Args:
+            pool (r_service.RWorkerPool): Worker processes to run the calls in. If None, the calls
+                run in the R thread of this process.
+            max_concurrency (int): Maximum number of calls in flight; further calls wait their turn
+                without blocking the event loop. Default is None (no limit).
+            timeout (float): Default per-call timeout in seconds. Default is None (no timeout).
+        """
+        self.pool = pool
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self._semaphore = asyncio.Semaphore(max_concurrency) if max_concurrency else None
+
+    async def call(self, function, *args, timeout=None, **kwargs):
+        """
+        Run a module-level function.
+
+        Args:
+            function (str or callable): The function, or its dotted path, e.g. 'robjects_functions.pca'.
+            args: Positional arguments of the function.
+            timeout (float): Seconds after which the call fails with asyncio.TimeoutError.
+                Default is the runner timeout.
+            kwargs: Keyword arguments of the function.
+
+        Returns:
+            The result of the function. With a pool, R objects come back as r_service.SerializedRObject.
+        """
+        if self.pool is None:
+            target = r_service._resolve(function) if isinstance(function, str) else function
+            return await self._run(lambda: r_executor().submit(_call, target, args, kwargs), timeout)
+        return await self._run(lambda: self.pool.submit(_path(function), *args, timeout=timeout or self.timeout,
+                                                         **kwargs), timeout)
+
+    async def _run(self, submit, timeout):
+        """
+        Internal method submitting a call once a slot is free and awaiting it.
+
+        Args:
+            submit (callable): Submits the call and returns its concurrent.futures.Future.
+            timeout (float): Per-call timeout in seconds, or None for the runner default.
+
+        Returns:
+            The result of the call.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        if self._semaphore is None:
+            return await self._await(submit(), timeout)
+        await self._semaphore.acquire()
+        future = None
+        try:
+            future = submit()
+            return await self._await(future, timeout)
+        finally:
+            if future is None or future.done() or self.pool is not None:
+                self._semaphore.release()
+            else:
+                # A call abandoned while running in the R thread keeps it busy: its slot is only
+                # freed when it returns, so that the limit still bounds the work queued behind it
+                future.add_done_callback(functools.partial(_release_from_thread, asyncio.get_running_loop(),
+                                                           self._semaphore))
+
+    async def _await(self, future, timeout):
+        """
+        Internal method awaiting a concurrent future, aborting it on timeout or cancellation.
+
+        Args:
+            future (concurrent.futures.Future): The submitted call.
+            timeout (float): Seconds to wait, or None.
+
+        Returns:
+            The result of the call.
+        """
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except (asyncio.CancelledError, asyncio.TimeoutError):
+            if self.pool is not None:
+                self.pool.abort(future)
+            else:
+                # Only a call still waiting for the R thread can be withdrawn
+                future.cancel()
+            raise
+
+
+class AsyncInterface:
+    """
+    Awaitable stand-in for an object of one of the R-backed interface classes.
+
+    Every public method of the class becomes a coroutine function taking the same arguments
+    plus an optional timeout.
+    """
+
+    # Dotted path of the wrapped class, set by the subclasses
+    cls = None
+
+    def __init__(self, *args, runner=None, **kwargs):
+        """
+        Initialize the AsyncInterface object.
+
+        Args:
+            args: Positional arguments of the wrapped class.
+            runner (AsyncRunner): The runner of the calls. Default is a runner using the R thread.
+            kwargs: Keyword arguments of the wrapped class.
+        """
+        self.runner = runner or AsyncRunner()
+        self._init = (args, kwargs)
+        self._local = None
+        self._remote = None if self.runner.pool is None else self.runner.pool.proxy(self.cls, *args, **kwargs)
+
+    def _local_object(self):
+        """
+        Internal method building the wrapped object, in the R thread, on first use.
+
+        Returns:
+            The wrapped object.
+        """
+        if self._local is None:
+            self._local = r_service._resolve(self.cls)(*self._init[0], **self._init[1])
+        return self._local
+
+    def __getattr__(self, item):
+        """
+        Get a coroutine function calling a method of the wrapped object.
+
+        Args:
+            item (str): The method name.
+
+        Returns:
+            callable: The coroutine function, taking the method arguments and an optional timeout.
+        """
+        if item.startswith('_'):
+            raise AttributeError(f"'{type(self).__name__}' object has no attribute '{item}'")
+        runner = self.runner
+
+        async def method(*args, timeout=None, **kwargs):
+            if runner.pool is None:
+                def target():
+                    return _call(getattr(self._local_object(), item), args, kwargs)
+                return await runner._run(lambda: r_executor().submit(target), timeout)
+            return await runner._run(lambda: self._remote.submit(item, *args, timeout=timeout or runner.timeout,
+                                                                 **kwargs), timeout)
+        method.__name__ = item
+        return method
+
+
+class AsyncRFunctions(AsyncInterface):
+    """
+    Awaitable counterpart of pandas_interface_rpy.RFunctions.
+    """
+
+    cls = 'pandas_interface_rpy.RFunctions'
+
+
+class AsyncClassificationModels(AsyncInterface):
+    """
+    Awaitable counterpart of ClassificationModels.ClassificationModels.
+    """
+
+    cls = 'ClassificationModels.ClassificationModels'
+
+
+class AsyncSeasonalAdjustment(AsyncInterface):
+    """
+    Awaitable counterpart of SeasonalAdjutment.SeasonalAdjustment.
+    """
+
+    cls = 'SeasonalAdjutment.SeasonalAdjustment'
+
+
+# Example usage:
+# async def main():
+#     data = pd.DataFrame({'feature1': [1, 2, 3, 4, 5], 'feature2': [10, 15, 20, 25, 30],
+#                          'target': ['a', 'b', 'a', 'b', 'a']})
+#     stats = AsyncRFunctions(data[['feature1', 'feature2']])
+#     models = AsyncClassificationModels(data, 'target', runner=AsyncRunner(timeout=60))
+#     mean, tree = await asyncio.gather(stats.mean(), models.decision_tree())
+#
+# asyncio.run(main())
@@ -0,0 +1,104 @@
+"""Conversions between Python and R objects that work with every rpy2 version.
+
+rpy2 2.x converts with pandas2ri.py2ri / ri2py and numpy2ri.py2ri, which rpy2 3
+renamed to py2rpy / rpy2py and moved to converter objects. The modules of this
+repository convert through py2r() and r2py() instead, which use the NumPy and
+pandas conversion rules under either API, whether pandas2ri.activate() was
+called or not.
+
+Example:
+    import r_conversion
+    r_data = r_conversion.py2r(data)
+    fit = robjects.r['kmeans'](r_data, 3)
+    centers = r_conversion.r2py(fit.rx2('centers'))
+"""
+
+from rpy2.robjects import conversion, default_converter, numpy2ri, pandas2ri
+
+# Default rules extended with the NumPy and pandas ones, pandas taking precedence
+_converter = default_converter + numpy2ri.converter + pandas2ri.converter
+
+
+def _method(converter, name, legacy_name):
+    """
+    Get a conversion function of a converter under the rpy2 3 name or its 2.x name.
+
+    Args:
+        converter: The converter, or the rpy2.robjects.conversion module for the 2.x active conversion.
+        name (str): The rpy2 3 name, 'py2rpy' or 'rpy2py'.
+        legacy_name (str): The rpy2 2.x name, 'py2ri' or 'ri2py'.
+
+    Returns:
+        callable: The conversion function.
+    """
+    return getattr(converter, name, None) or getattr(converter, legacy_name)
+
+
+def _active_converter():
+    """
+    Get the conversion rules in effect, as changed by pandas2ri.activate() or localconverter.
+
+    Returns:
+        The active converter, or the rpy2.robjects.conversion module with rpy2 2.x, whose
+            activate() replaces the module-level functions.
+    """
+    if hasattr(conversion, 'get_conversion'):
+        return conversion.get_conversion()
+    if hasattr(conversion, 'py2ri'):
+        return conversion
+    return conversion.converter
+
+
+def py2r(value):
+    """
+    Convert a Python object to R with the NumPy and pandas rules.
+
+    Args:
+        value: The object, e.g. a pandas.DataFrame, pandas.Series or numpy.ndarray.
+
+    Returns:
+        R object: The converted object, an R data.frame for DataFrames and a vector or array otherwise.
+    """
+    # Rules are looked up globally while converting nested values (the columns of a frame)
+    with conversion.localconverter(_converter) as converter:
+        return _method(converter, 'py2rpy', 'py2ri')(value)
+
+
+def r2py(value):
+    """
+    Convert an R object to Python with the NumPy and pandas rules.
+
+    Args:
+        value (R object): The object.
+
+    Returns:
+        The converted object, a pandas.DataFrame for R data frames and a numpy.ndarray for vectors.
+    """
+    with conversion.localconverter(_converter) as converter:
+        return _method(converter, 'rpy2py', 'ri2py')(value)
+
+
+def active_py2r(value):
+    """
+    Convert a Python object to R with the conversion rules in effect, as rpy2 does for the arguments of a call.
+
+    Args:
+        value: The object.
+
+    Returns:
+        R object: The converted object.
+    """
+    return _method(_active_converter(), 'py2rpy', 'py2ri')(value)
+
+
+def active_r2py(value):
+    """
+    Convert an R object to Python with the conversion rules in effect, as rpy2 does for results.
+
+    Args:
+        value (R object): The object.
+
+    Returns:
+        The converted object.
+    """
+    return _method(_active_converter(), 'rpy2py', 'ri2py')(value)
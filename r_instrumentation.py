@@ -0,0 +1,335 @@
+"""Instrumentation of the calls crossing into R.
+
+Every module of this repository calls R through rpy2 function objects. Once
+enabled, each call is split into its three costs: converting the arguments to
+R, running the R function and converting the result back. Per-function counters
+and latency histograms are kept in process, and an optional trace keeps the
+last calls one by one. The overhead is a few timer reads and dictionary updates
+per call, small enough to leave on in production.
+
+Example:
+    import r_instrumentation
+    r_instrumentation.enable(trace=True)
+    ...
+    print(r_instrumentation.summary())
+
+    with r_instrumentation.profile() as block:
+        UnsupervisedModels(data).kmeans()
+    print(block.summary())
+"""
+
+import contextlib
+import math
+import threading
+import time
+from collections import deque
+
+import numpy as np
+import pandas as pd
+from rpy2.robjects.functions import Function
+
+import r_conversion
+
+# Bytes per element of the R vector types, by SEXP type code (LGLSXP, INTSXP, REALSXP, CPLXSXP,
+# STRSXP, RAWSXP); strings count as one pointer each
+_R_ITEM_BYTES = {10: 4, 13: 4, 14: 8, 15: 16, 16: 8, 24: 1}
+
+# SEXP type code of R lists, data frames included
+_VECSXP = 19
+
+# Upper bounds, in microseconds, of the latency histogram buckets (powers of two, last one open)
+HISTOGRAM_BOUNDS = tuple(2 ** i for i in range(28))
+
+_original_call = Function.__call__
+_lock = threading.Lock()
+_local = threading.local()
+_stats = {}
+_trace = None
+_profiles = []
+# Whether enable() was called; the open profiles also keep the instrumentation on
+_enabled = False
+
+
+def _to_r(value):
+    """
+    Convert a Python object to R with the active rpy2 conversion.
+
+    Args:
+        value: The Python object.
+
+    Returns:
+        R object: The converted object.
+    """
+    return r_conversion.active_py2r(value)
+
+
+def _to_py(value):
+    """
+    Convert an R object to Python with the active rpy2 conversion.
+
+    Args:
+        value (R object): The R object.
+
+    Returns:
+        The converted object.
+    """
+    return r_conversion.active_r2py(value)
+
+
+def _nbytes(value, depth=0):
+    """
+    Estimate the size of the data held by a Python or R object, without walking it deeply.
+
+    Args:
+        value: The object.
+        depth (int): Levels of R lists (and data frames) whose elements are counted. Default is 0:
+            a list counts as its element pointers only, since walking it wraps every element.
+
+    Returns:
+        int: The estimated size in bytes.
+    """
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return int(np.sum(value.memory_usage(index=False)))
+    if isinstance(value, (bytes, str)):
+        return len(value)
+    typeof = getattr(value, 'typeof', None)
+    if typeof is None:
+        return 0
+    try:
+        if int(typeof) == _VECSXP and depth > 0:
+            return sum(_nbytes(element, depth - 1) for element in value)
+        return len(value) * _R_ITEM_BYTES.get(int(typeof), 8)
+    except TypeError:
+        return 0
+
+
+def _instrumented_call(self, *args, **kwargs):
+    """
+    Replacement of rpy2's Function.__call__ timing the conversions and the R call separately.
+    """
+    if getattr(_local, 'depth', 0):
+        # R calls made while converting belong to the outer call
+        return _original_call(self, *args, **kwargs)
+    _local.depth = 1
+    # Lists are only walked for the calls recorded one by one, counters get the shallow size
+    depth = 1 if _trace is not None or _profiles else 0
+    try:
+        start = time.perf_counter()
+        r_args = [_to_r(arg) for arg in args]
+        r_kwargs = {name: _to_r(value) for name, value in kwargs.items()}
+        converted = time.perf_counter()
+        result = super(Function, self).__call__(*r_args, **r_kwargs)
+        executed = time.perf_counter()
+        py_result = _to_py(result)
+        finished = time.perf_counter()
+        bytes_to_r = (sum(_nbytes(arg, depth) for arg in args)
+                      + sum(_nbytes(value, depth) for value in kwargs.values()))
+        bytes_from_r = _nbytes(result, depth)
+    finally:
+        _local.depth = 0
+    _record({'function': getattr(self, '__rname__', None) or '<anonymous>',
+             'start': start,
+             'to_r_seconds': converted - start,
+             'r_seconds': executed - converted,
+             'to_py_seconds': finished - executed,
+             'bytes_to_r': bytes_to_r,
+             'bytes_from_r': bytes_from_r})
+    return py_result
+
+
+def _record(call):
+    """
+    Add one call to the counters, the trace and the open profiles.
+
+    Args:
+        call (dict): The call record.
+    """
+    total = call['to_r_seconds'] + call['r_seconds'] + call['to_py_seconds']
+    bucket = min(max(math.ceil(math.log2(max(total * 1e6, 1))), 0), len(HISTOGRAM_BOUNDS) - 1)
+    with _lock:
+        stats = _stats.get(call['function'])
+        if stats is None:
+            stats = _stats[call['function']] = {'calls': 0, 'to_r_seconds': 0.0, 'r_seconds': 0.0,
+                                                'to_py_seconds': 0.0, 'bytes_to_r': 0, 'bytes_from_r': 0,
+                                                'histogram': [0] * len(HISTOGRAM_BOUNDS)}
+        stats['calls'] += 1
+        for name in ('to_r_seconds', 'r_seconds', 'to_py_seconds', 'bytes_to_r', 'bytes_from_r'):
+            stats[name] += call[name]
+        stats['histogram'][bucket] += 1
+        if _trace is not None:
+            _trace.append(call)
+        for calls in _profiles:
+            calls.append(call)
+
+
+def enable(trace=False, trace_size=10000):
+    """
+    Start instrumenting the R calls.
+
+    Args:
+        trace (bool): Whether to keep the last calls one by one. Default is False.
+        trace_size (int): Number of calls kept in the trace. Default is 10000.
+    """
+    global _enabled, _trace
+    with _lock:
+        _trace = deque(maxlen=trace_size) if trace else None
+        _enabled = True
+        _patch()
+
+
+def disable():
+    """
+    Stop instrumenting the R calls, except inside open profile() blocks. The counters are kept.
+    """
+    global _enabled, _trace
+    with _lock:
+        _trace = None
+        _enabled = False
+        _patch()
+
+
+def _patch():
+    """
+    Install the instrumented Function.__call__ while enabled or profiled, the original one otherwise.
+
+    Must be called with _lock held, after changing _enabled or _profiles.
+    """
+    Function.__call__ = _instrumented_call if _enabled or _profiles else _original_call
+
+
+def enabled():
+    """
+    Tell whether the R calls are instrumented.
+
+    Returns:
+        bool: True if enabled.
+    """
+    return Function.__call__ is _instrumented_call
+
+
+def reset():
+    """
+    Clear the counters and the trace.
+    """
+    with _lock:
+        _stats.clear()
+        if _trace is not None:
+            _trace.clear()
+
+
+def counters():
+    """
+    Get the per-function counters.
+
+    Returns:
+        dict: For each R function, the number of calls, the total seconds spent in each
+            direction of conversion and in R, the bytes sent and received and the latency
+            histogram (call counts per bucket of HISTOGRAM_BOUNDS). R lists count as their
+            element pointers, except for calls made while tracing or profiling.
+    """
+    with _lock:
+        return {name: dict(stats, histogram=list(stats['histogram'])) for name, stats in _stats.items()}
+
+
+def trace_log():
+    """
+    Get the traced calls, oldest first.
+
+    Returns:
+        list: One dict per call, empty if tracing is off.
+    """
+    with _lock:
+        return list(_trace) if _trace is not None else []
+
+
+def summary(calls=None):
+    """
+    Summarize the R calls per function.
+
+    Args:
+        calls (list): Call records to summarize, e.g. a trace. Default is the process counters.
+
+    Returns:
+        pandas.DataFrame: One row per function, slowest first, with its call count, seconds in each
+            stage, bytes transferred and the median and 99th percentile latency estimated from the histogram.
+    """
+    if calls is not None:
+        records = pd.DataFrame(calls, columns=['function', 'to_r_seconds', 'r_seconds', 'to_py_seconds',
+                                               'bytes_to_r', 'bytes_from_r'])
+        table = records.groupby('function').agg(calls=('r_seconds', 'size'), to_r_seconds=('to_r_seconds', 'sum'),
+                                                r_seconds=('r_seconds', 'sum'),
+                                                to_py_seconds=('to_py_seconds', 'sum'),
+                                                bytes_to_r=('bytes_to_r', 'sum'),
+                                                bytes_from_r=('bytes_from_r', 'sum'))
+    else:
+        stats = counters()
+        table = pd.DataFrame.from_dict({name: {key: value for key, value in entry.items() if key != 'histogram'}
+                                        for name, entry in stats.items()}, orient='index')
+        table.index.name = 'function'
+        for quantile in (0.5, 0.99):
+            table[f'p{int(quantile * 100)}_seconds'] = [_histogram_quantile(stats[name]['histogram'], quantile)
+                                                        for name in table.index]
+    if table.empty:
+        return table
+    table['total_seconds'] = table['to_r_seconds'] + table['r_seconds'] + table['to_py_seconds']
+    return table.sort_values('total_seconds', ascending=False)
+
+
+def _histogram_quantile(histogram, quantile):
+    """
+    Estimate a latency quantile from a histogram, as the upper bound of its bucket.
+
+    Args:
+        histogram (list): Call counts per bucket of HISTOGRAM_BOUNDS.
+        quantile (float): The quantile, between 0 and 1.
+
+    Returns:
+        float: The latency in seconds.
+    """
+    cumulative = np.cumsum(histogram)
+    bucket = int(np.searchsorted(cumulative, quantile * cumulative[-1]))
+    return HISTOGRAM_BOUNDS[min(bucket, len(HISTOGRAM_BOUNDS) - 1)] / 1e6
+
+
+class Profile:
+    """
+    R calls made inside a profile() block.
+    """
+
+    def __init__(self):
+        """
+        Initialize the Profile object.
+        """
+        self.calls = []
+
+    def summary(self):
+        """
+        Summarize the calls of the block per function.
+
+        Returns:
+            pandas.DataFrame: See summary().
+        """
+        return summary(self.calls)
+
+
+@contextlib.contextmanager
+def profile():
+    """
+    Record every R call made inside a block, enabling the instrumentation for it if needed.
+
+    Yields:
+        Profile: The calls of the block, complete once the block exits.
+    """
+    block = Profile()
+    with _lock:
+        # Every open block counts as a user of the instrumentation, which stays on until the last one exits
+        _profiles.append(block.calls)
+        _patch()
+    try:
+        yield block
+    finally:
+        with _lock:
+            _profiles.remove(block.calls)
+            _patch()
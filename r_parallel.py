@@ -0,0 +1,168 @@
+"""Helpers for spreading R work across a pool of worker processes.
+
+The embedded R session is not thread-safe and cannot be shared across a fork, so
+every worker is a freshly spawned interpreter with its own R. Data that all jobs
+need is handed to each worker once, through the pool initializer, and jobs only
+carry the small per-task arguments. Large DataFrames and arrays of that state are
+not even pickled: they are written once into shared memory (see shared_frames)
+and every worker reads the same buffer.
+"""
+
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import shared_frames
+
+# State shipped to the current worker by the pool initializer
+_worker_state = {}
+
+
+def _init_worker(state):
+    """
+    Store the shared state in the worker process.
+
+    Args:
+        state (dict): Objects every job of the pool needs (data, targets, models...).
+    """
+    _worker_state.clear()
+    _worker_state.update(shared_frames.attach_state(state))
+
+
+def worker_state():
+    """
+    Get the state shared with the current worker.
+
+    Returns:
+        dict: The state passed to the pool that started this worker.
+    """
+    return _worker_state
+
+
+class WorkerPool:
+    """
+    Pool of R worker processes sharing a state that is sent to each worker once.
+    """
+
+    def __init__(self, n_jobs=None, state=None, share_min_bytes=1024 ** 2, share_path=None):
+        """
+        Initialize the WorkerPool object.
+
+        Args:
+            n_jobs (int): Number of worker processes. If None, one per CPU.
+                With 1, jobs run in the calling process and no worker is started.
+            state (dict): Objects shared by all jobs, see worker_state().
+            share_min_bytes (int): DataFrames, Series and arrays of the state at least this large are
+                placed in shared memory instead of being pickled to every worker. None to always
+                pickle. Default is 1 Mb.
+            share_path (str): Directory of memory-mapped files to use instead of shared memory,
+                for state larger than /dev/shm. Default is None.
+        """
+        self.n_jobs = n_jobs or multiprocessing.cpu_count()
+        self._shared = []
+        self._outer_state = None
+        if self.n_jobs == 1:
+            self._executor = None
+            # A job of another pool may be running here: its state comes back on close
+            self._outer_state = dict(_worker_state)
+            _init_worker(state or {})
+        else:
+            state = state or {}
+            if share_min_bytes is not None:
+                state, self._shared = shared_frames.share_state(state, share_min_bytes, share_path)
+            self._executor = ProcessPoolExecutor(max_workers=self.n_jobs,
+                                                 mp_context=multiprocessing.get_context('spawn'),
+                                                 initializer=_init_worker,
+                                                 initargs=(state,))
+
+    def map(self, func, jobs):
+        """
+        Run func on every job and collect the results.
+
+        Args:
+            func (callable): Module-level function taking one job.
+            jobs (iterable): The job arguments.
+
+        Returns:
+            list: The results, in the order of the jobs.
+        """
+        return list(self.imap(func, jobs))
+
+    def imap(self, func, jobs, max_pending=None):
+        """
+        Lazily run func on every job, keeping a bounded number of jobs in flight.
+
+        Unlike Executor.map, the jobs iterable is consumed only as results are
+        yielded, so it can be a generator over data that does not fit in memory.
+
+        Args:
+            func (callable): Module-level function taking one job.
+            jobs (iterable): The job arguments.
+            max_pending (int): Maximum number of submitted but not yet yielded jobs.
+                Default is twice the number of workers.
+
+        Yields:
+            The results, in the order of the jobs.
+        """
+        if self._executor is None:
+            for job in jobs:
+                yield func(job)
+            return
+        max_pending = max_pending or 2 * self.n_jobs
+        pending = deque()
+        for job in jobs:
+            pending.append(self._executor.submit(func, job))
+            if len(pending) >= max_pending:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+    def close(self):
+        """
+        Shut the workers down.
+        """
+        if self._executor is None:
+            if self._outer_state is not None:
+                _worker_state.clear()
+                _worker_state.update(self._outer_state)
+                self._outer_state = None
+        else:
+            self._executor.shutdown()
+        for shared in self._shared:
+            shared.close()
+        self._shared = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def r_serialize(r_object):
+    """
+    Serialize an R object to bytes, so it can be sent to another R session.
+
+    Args:
+        r_object (R object): The object to serialize.
+
+    Returns:
+        bytes: The serialized object.
+    """
+    # Imported here so that pools running NumPy jobs only never start R
+    import rpy2.robjects as robjects
+    return bytes(robjects.r['serialize'](r_object, robjects.NULL))
+
+
+def r_unserialize(raw):
+    """
+    Rebuild an R object serialized with r_serialize.
+
+    Args:
+        raw (bytes): The serialized object.
+
+    Returns:
+        R object: The object, living in the current R session.
+    """
+    import rpy2.robjects as robjects
+    return robjects.r['unserialize'](robjects.vectors.ByteVector(raw))
@@ -0,0 +1,575 @@
+"""Local service of pre-warmed R worker processes shared by concurrent Python callers.
+
+The embedded R is not thread-safe, so a multi-threaded program would otherwise
+have to serialize every R call behind one lock. Here each worker is a separate
+process with its own R session and the required modules (and thus R packages)
+already imported. Calls from any thread are queued and handed to the first
+free worker over a pipe.
+
+Objects of proxies are built once per worker, on their first call there, and kept
+for the next ones, so their arguments (often a whole DataFrame) are only sent
+again to a worker that has not built them yet or has dropped them.
+
+Workers are recycled after a number of calls or when their memory grows past a
+limit, killed and replaced when a call times out or is aborted, or when they stop
+answering health checks.
+
+Example:
+    pool = RWorkerPool(n_workers=4, modules=['ClassificationModels'], max_calls=500, timeout=60)
+    models = pool.proxy('ClassificationModels.ClassificationModels', data, 'target')
+    rf_model = models.random_forest(ntree=200)    # SerializedRObject
+    labels = pool.call('ClassificationModels._predict', rf_model, new_data)
+    pool.close()
+"""
+
+import importlib
+import inspect
+import multiprocessing
+import os
+import queue
+import resource
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+from concurrent.futures import CancelledError, Future
+
+# Sent to a worker manager to make it stop
+_STOP = object()
+
+# Seconds between checks for aborted calls while waiting for a worker
+_ABORT_CHECK_INTERVAL = 0.1
+
+# Attempts at starting a worker before its manager gives up until the next call
+_START_ATTEMPTS = 2
+
+# Objects of proxies kept by a worker, the least recently used being dropped first
+_CACHED_OBJECTS = 16
+
+
+class SerializedRObject:
+    """
+    R object returned by a worker, serialized with R's serialize().
+
+    Passing it back as an argument of a call rebuilds the object in the worker's R session.
+    """
+
+    def __init__(self, raw):
+        """
+        Initialize the SerializedRObject object.
+
+        Args:
+            raw (bytes): The serialized object.
+        """
+        self.raw = raw
+
+    def load(self):
+        """
+        Rebuild the object in the R session of the current process.
+
+        Returns:
+            R object: The object.
+        """
+        # Imported here so that processes only talking to the workers never start R
+        import r_parallel
+        return r_parallel.r_unserialize(self.raw)
+
+
+def _rss_mb():
+    """
+    Get the resident memory of the current process.
+
+    Returns:
+        float: The resident set size in Mb (the peak size where /proc is not available).
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 ** 2
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _resolve(path):
+    """
+    Import the object at a dotted path, e.g. 'UnsupervisedModels.UnsupervisedModels'.
+
+    Args:
+        path (str): The module name followed by the attribute name.
+
+    Returns:
+        The object.
+    """
+    module, _, name = path.rpartition('.')
+    return getattr(importlib.import_module(module), name)
+
+
+def _worker_main(conn, modules):
+    """
+    Serve calls sent over conn until told to stop.
+
+    Args:
+        conn (multiprocessing.connection.Connection): The pipe to the pool.
+        modules (list): Names of the modules to import before the first call.
+    """
+    try:
+        import r_parallel
+        from rpy2.rinterface import Sexp
+
+        for module in modules:
+            importlib.import_module(module)
+    except Exception:
+        # Report why the worker cannot start instead of just closing the pipe
+        conn.send(('error', traceback.format_exc()))
+        return
+    conn.send(('ready', _rss_mb()))
+    objects = OrderedDict()
+    while True:
+        request = conn.recv()
+        if request is None:
+            break
+        if request == 'ping':
+            conn.send(('ok', _rss_mb()))
+            continue
+        path, init, method, args, kwargs = request
+        if init is not None and init[1] is None and init[0] not in objects:
+            # Dropped from the cache, the pool sends the class arguments again
+            conn.send(('missing', _rss_mb()))
+            continue
+        try:
+            args = [arg.load() if isinstance(arg, SerializedRObject) else arg for arg in args]
+            kwargs = {name: value.load() if isinstance(value, SerializedRObject) else value
+                      for name, value in kwargs.items()}
+            target = _resolve(path)
+            if init is not None:
+                object_id, arguments = init
+                if arguments is not None:
+                    objects[object_id] = target(*arguments[0], **arguments[1])
+                    if len(objects) > _CACHED_OBJECTS:
+                        objects.popitem(last=False)
+                objects.move_to_end(object_id)
+                target = getattr(objects[object_id], method)
+            result = target(*args, **kwargs)
+            if inspect.isgenerator(result):
+                # Generators cannot be sent back, e.g. the chunks of ClassificationModels.predict
+                result = list(result)
+            if isinstance(result, Sexp):
+                result = SerializedRObject(r_parallel.r_serialize(result))
+            conn.send(('ok', _rss_mb(), result))
+        except Exception as error:
+            try:
+                conn.send(('error', _rss_mb(), error))
+            except Exception:
+                # Some R errors cannot be pickled, send their message instead
+                conn.send(('error', _rss_mb(), RuntimeError(repr(error))))
+
+
+class RWorkerPool:
+    """
+    Pool of pre-warmed R worker processes, safe to call from any number of threads.
+    """
+
+    def __init__(self, n_workers=None, modules=(), max_calls=1000, max_rss_mb=None, timeout=None,
+                 health_interval=30.0):
+        """
+        Initialize the RWorkerPool object and start the workers.
+
+        Args:
+            n_workers (int): Number of worker processes. If None, one per CPU.
+            modules (list): Names of the modules every worker imports at start, e.g.
+                ['ClassificationModels', 'SeasonalAdjutment'], which also loads their R packages.
+            max_calls (int): Number of calls after which a worker is replaced. Default is 1000.
+            max_rss_mb (float): Resident memory, in Mb, above which a worker is replaced after its
+                current call. Default is None (no limit).
+            timeout (float): Default per-call timeout in seconds. Default is None (no timeout).
+            health_interval (float): Seconds of idleness after which a worker is pinged. Default is 30.
+        """
+        self.modules = list(modules)
+        self.max_calls = max_calls
+        self.max_rss_mb = max_rss_mb
+        self.timeout = timeout
+        self.health_interval = health_interval
+        self.stats = {'calls': 0, 'errors': 0, 'timeouts': 0, 'cancelled': 0, 'recycled': 0, 'crashed': 0,
+                      'start_failures': 0}
+        self._context = multiprocessing.get_context('spawn')
+        self._requests = queue.Queue()
+        self._lock = threading.Lock()
+        self._aborted = set()
+        self._managers = [threading.Thread(target=self._manage, daemon=True)
+                          for _ in range(n_workers or multiprocessing.cpu_count())]
+        for manager in self._managers:
+            manager.start()
+
+    def submit(self, path, *args, timeout=None, **kwargs):
+        """
+        Queue a call of a module-level function.
+
+        Args:
+            path (str): The dotted path of the function, e.g. 'robjects_functions.mean'.
+            args: Positional arguments of the function.
+            timeout (float): Seconds after which the call fails with TimeoutError and its worker is
+                replaced. Default is the pool timeout.
+            kwargs: Keyword arguments of the function.
+
+        Returns:
+            concurrent.futures.Future: The future result. R objects come back as SerializedRObject.
+        """
+        return self._submit((path, None, None, args, kwargs), timeout)
+
+    def call(self, path, *args, timeout=None, **kwargs):
+        """
+        Call a module-level function in a worker and wait for the result.
+
+        Args:
+            path (str): The dotted path of the function.
+            args: Positional arguments of the function.
+            timeout (float): Per-call timeout in seconds. Default is the pool timeout.
+            kwargs: Keyword arguments of the function.
+
+        Returns:
+            The result of the function. R objects come back as SerializedRObject.
+        """
+        return self.submit(path, *args, timeout=timeout, **kwargs).result()
+
+    def proxy(self, cls, *args, **kwargs):
+        """
+        Get a stand-in for an object of one of the interface classes, whose methods run in the workers.
+
+        Args:
+            cls (str or type): The class, or its dotted path, e.g. 'ClassificationModels.ClassificationModels'.
+            args: Positional arguments of the class.
+            kwargs: Keyword arguments of the class.
+
+        Returns:
+            RemoteObject: The stand-in. Each worker builds the object from these arguments on its
+                first call and reuses it for the next ones.
+        """
+        if not isinstance(cls, str):
+            cls = f'{cls.__module__}.{cls.__qualname__}'
+        return RemoteObject(self, cls, args, kwargs)
+
+    def abort(self, future):
+        """
+        Cancel a call, killing and replacing its worker if the call is already running.
+
+        Args:
+            future (concurrent.futures.Future): The future returned by submit().
+        """
+        if future.cancel() or future.done():
+            return
+        with self._lock:
+            self._aborted.add(future)
+
+    def health(self):
+        """
+        Get the pool counters.
+
+        Returns:
+            dict: Numbers of calls, errors, timeouts, cancelled calls, recycled and crashed workers,
+                workers that failed to start, and queued calls.
+        """
+        with self._lock:
+            return dict(self.stats, queued=self._requests.qsize())
+
+    def close(self):
+        """
+        Stop the workers once the queued calls are done.
+        """
+        for _ in self._managers:
+            self._requests.put(_STOP)
+        for manager in self._managers:
+            manager.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _submit(self, request, timeout):
+        """
+        Internal method queuing a request.
+
+        Args:
+            request (tuple): The path, object id and class arguments (None for functions), method name,
+                arguments and keyword arguments.
+            timeout (float): Per-call timeout in seconds, or None for the pool default.
+
+        Returns:
+            concurrent.futures.Future: The future result.
+        """
+        future = Future()
+        self._requests.put((future, request, self.timeout if timeout is None else timeout))
+        return future
+
+    def _exchange(self, conn, future, request, timeout, built):
+        """
+        Internal method sending a request to a worker and waiting for its answer.
+
+        The class arguments of a proxy object are left out when the worker has already built it.
+
+        Args:
+            conn (multiprocessing.connection.Connection): The pipe to the worker.
+            future (concurrent.futures.Future): The future of the call.
+            request (tuple): The request, see _submit().
+            timeout (float): Seconds to wait, or None to wait until answered or aborted.
+            built (set): Ids of the objects the worker has built, updated here.
+
+        Returns:
+            tuple: 'ready', 'timeout' or 'aborted', and the answer of the worker when ready.
+        """
+        path, init, method, args, kwargs = request
+        cached = init is not None and init[0] in built
+        conn.send((path, (init[0], None), method, args, kwargs) if cached else request)
+        outcome = self._wait(conn, future, timeout)
+        if outcome != 'ready':
+            return outcome, None
+        answer = conn.recv()
+        if answer[0] == 'missing':
+            built.discard(init[0])
+            return self._exchange(conn, future, request, timeout, built)
+        if init is not None and answer[0] == 'ok':
+            built.add(init[0])
+        return outcome, answer
+
+    def _wait(self, conn, future, timeout):
+        """
+        Internal method waiting for the answer of a worker, unless the call times out or is aborted.
+
+        Args:
+            conn (multiprocessing.connection.Connection): The pipe to the worker.
+            future (concurrent.futures.Future): The future of the call.
+            timeout (float): Seconds to wait, or None to wait until answered or aborted.
+
+        Returns:
+            str: 'ready', 'timeout' or 'aborted'.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = _ABORT_CHECK_INTERVAL if deadline is None else deadline - time.monotonic()
+            if conn.poll(max(min(remaining, _ABORT_CHECK_INTERVAL), 0)):
+                return 'ready'
+            with self._lock:
+                if future in self._aborted:
+                    self._aborted.discard(future)
+                    return 'aborted'
+            if deadline is not None and time.monotonic() >= deadline:
+                return 'timeout'
+
+    def _count(self, name):
+        """
+        Internal method incrementing a pool counter.
+
+        Args:
+            name (str): The counter name.
+        """
+        with self._lock:
+            self.stats[name] += 1
+
+    def _start_worker(self):
+        """
+        Internal method starting a worker and waiting until it is ready.
+
+        Returns:
+            tuple: The worker process and the pipe to it.
+
+        Raises:
+            RuntimeError: If the worker failed to start, e.g. because one of the modules cannot be imported.
+        """
+        for _ in range(_START_ATTEMPTS):
+            conn, child_conn = self._context.Pipe()
+            process = self._context.Process(target=_worker_main, args=(child_conn, self.modules), daemon=True)
+            process.start()
+            child_conn.close()
+            try:
+                status, detail = conn.recv()
+            except (OSError, EOFError) as error:
+                status, detail = 'error', repr(error)
+            if status == 'ready':
+                return process, conn
+            self._stop_worker(process, conn, kill=True)
+        self._count('start_failures')
+        raise RuntimeError(f"R worker failed to start:\n{detail}")
+
+    def _restart_worker(self, worker, kill=True):
+        """
+        Internal method replacing a worker.
+
+        Args:
+            worker (tuple): The worker process and the pipe to it, or None if there is none.
+            kill (bool): Whether to kill the worker rather than ask it to stop. Default is True.
+
+        Returns:
+            tuple: The new worker process and the pipe to it, or None if it failed to start; the
+                next call then tries again.
+        """
+        if worker is not None:
+            self._stop_worker(*worker, kill=kill)
+        try:
+            return self._start_worker()
+        except RuntimeError:
+            return None
+
+    def _ping(self, worker):
+        """
+        Internal method checking that an idle worker still answers.
+
+        Args:
+            worker (tuple): The worker process and the pipe to it.
+
+        Returns:
+            bool: True if the worker answered in time.
+        """
+        process, conn = worker
+        try:
+            conn.send('ping')
+            if not conn.poll(self.health_interval):
+                return False
+            conn.recv()
+        except (OSError, EOFError):
+            return False
+        return True
+
+    @staticmethod
+    def _stop_worker(process, conn, kill=False):
+        """
+        Internal method stopping a worker.
+
+        Args:
+            process (multiprocessing.Process): The worker process.
+            conn (multiprocessing.connection.Connection): The pipe to it.
+            kill (bool): Whether to kill it rather than ask it to stop. Default is False.
+        """
+        if not kill:
+            try:
+                conn.send(None)
+                process.join(5)
+            except (OSError, EOFError):
+                pass
+        if process.is_alive():
+            process.kill()
+            process.join()
+        conn.close()
+
+    def _manage(self):
+        """
+        Internal method run by one manager thread per worker: feed it calls, recycle and check it.
+        """
+        worker = self._restart_worker(None)
+        calls = 0
+        # Ids of the proxy objects the current worker has built
+        built, built_by = set(), worker
+        while True:
+            try:
+                item = self._requests.get(timeout=self.health_interval)
+            except queue.Empty:
+                if worker is not None and not self._ping(worker):
+                    self._count('crashed')
+                    worker = self._restart_worker(worker)
+                    calls = 0
+                continue
+            if item is _STOP:
+                if worker is not None:
+                    self._stop_worker(*worker)
+                return
+            future, request, timeout = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            if worker is None:
+                try:
+                    worker = self._start_worker()
+                except RuntimeError as error:
+                    future.set_exception(error)
+                    continue
+                calls = 0
+            process, conn = worker
+            if built_by is not worker:
+                built, built_by = set(), worker
+            self._count('calls')
+            try:
+                outcome, answer = self._exchange(conn, future, request, timeout, built)
+                if outcome != 'ready':
+                    if outcome == 'timeout':
+                        self._count('timeouts')
+                        future.set_exception(TimeoutError(f"R call to {request[0]} timed out after {timeout}s."))
+                    else:
+                        self._count('cancelled')
+                        future.set_exception(CancelledError(f"R call to {request[0]} was aborted."))
+                    # The worker is still busy with the call, it can only be killed
+                    worker = self._restart_worker(worker)
+                    calls = 0
+                    continue
+                status, rss, *result = answer
+            except (OSError, EOFError) as error:
+                self._count('crashed')
+                future.set_exception(RuntimeError(f"R worker died during a call to {request[0]}: {error!r}"))
+                worker = self._restart_worker(worker)
+                calls = 0
+                continue
+            with self._lock:
+                # Too late to abort, the answer is already there
+                self._aborted.discard(future)
+            if status == 'ok':
+                future.set_result(result[0])
+            else:
+                self._count('errors')
+                future.set_exception(result[0])
+            calls += 1
+            if calls >= self.max_calls or (self.max_rss_mb is not None and rss > self.max_rss_mb):
+                self._count('recycled')
+                worker = self._restart_worker(worker, kill=False)
+                calls = 0
+
+
+class RemoteObject:
+    """
+    Stand-in for an interface object whose method calls run in an RWorkerPool.
+
+    The object is identified by a random id, under which the workers keep the copy they built.
+    """
+
+    def __init__(self, pool, path, args, kwargs):
+        """
+        Initialize the RemoteObject object.
+
+        Args:
+            pool (RWorkerPool): The pool running the calls.
+            path (str): The dotted path of the class.
+            args (tuple): Positional arguments of the class.
+            kwargs (dict): Keyword arguments of the class.
+        """
+        self._pool = pool
+        self._path = path
+        self._init = (uuid.uuid4().hex, (args, kwargs))
+
+    def __getattr__(self, item):
+        """
+        Get a function calling a method of the object in a worker.
+
+        Args:
+            item (str): The method name.
+
+        Returns:
+            callable: The function, taking the method arguments and an optional timeout.
+        """
+        if item.startswith('_'):
+            raise AttributeError(f"'RemoteObject' object has no attribute '{item}'")
+
+        def method(*args, timeout=None, **kwargs):
+            return self.submit(item, *args, timeout=timeout, **kwargs).result()
+        return method
+
+    def submit(self, method, *args, timeout=None, **kwargs):
+        """
+        Queue a method call without waiting for it.
+
+        Args:
+            method (str): The method name.
+            args: Positional arguments of the method.
+            timeout (float): Per-call timeout in seconds. Default is the pool timeout.
+            kwargs: Keyword arguments of the method.
+
+        Returns:
+            concurrent.futures.Future: The future result.
+        """
+        return self._pool._submit((self._path, self._init, method, args, kwargs), timeout)
@@ -0,0 +1,180 @@
+"""Persistent on-disk cache for the results of slow R calls.
+
+Entries are keyed by a content hash of everything that determines the result
+and stored as one file each. Reading an entry refreshes its modification time,
+so when the cache outgrows its size limit the least recently used entries are
+evicted first.
+"""
+
+import hashlib
+import os
+import tempfile
+import threading
+
+import numpy as np
+import pandas as pd
+
+
+def fingerprint(*parts):
+    """
+    Hash the parts that determine a result into a cache key.
+
+    Args:
+        parts: Bytes, pandas objects (hashed by values, index, column names and index frequency),
+            or objects whose repr identifies them (strings, numbers, tuples, dicts).
+
+    Returns:
+        str: The hexadecimal SHA-256 digest.
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        for chunk in _part_bytes(part):
+            # Length-prefix each chunk so that different splits of the same bytes give different keys
+            digest.update(len(chunk).to_bytes(8, 'little'))
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _part_bytes(part):
+    """
+    Get the byte strings identifying one part of a cache key.
+
+    Args:
+        part: The part, see fingerprint().
+
+    Returns:
+        list: The byte strings.
+    """
+    if isinstance(part, bytes):
+        return [part]
+    if isinstance(part, (pd.Series, pd.DataFrame)):
+        names = list(part.columns) if isinstance(part, pd.DataFrame) else part.name
+        return [b'pandas', pd.util.hash_pandas_object(part, index=True).to_numpy().tobytes(),
+                repr((names, getattr(part.index, 'freqstr', None))).encode()]
+    if isinstance(part, np.ndarray):
+        return [b'numpy', repr((part.dtype.str, part.shape)).encode(), np.ascontiguousarray(part).tobytes()]
+    return [repr(part).encode()]
+
+
+class DiskCache:
+    """
+    Size-bounded directory of cached byte strings with least-recently-used eviction.
+    """
+
+    def __init__(self, directory, max_bytes=1024 ** 3):
+        """
+        Initialize the DiskCache object.
+
+        Args:
+            directory (str): The cache directory. Created if missing; existing entries are reused.
+            max_bytes (int): Maximum total size of the entries. Default is 1 GiB.
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._size = sum(entry.stat().st_size for entry in os.scandir(directory) if entry.name.endswith('.bin'))
+
+    @property
+    def hit_rate(self):
+        """
+        float: Fraction of lookups that were hits, 0 before the first lookup.
+        """
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self):
+        """
+        Get the cache counters.
+
+        Returns:
+            dict: The hits, misses, hit rate, evictions and current size in bytes.
+        """
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hit_rate,
+                'evictions': self.evictions, 'size_bytes': self._size}
+
+    def get(self, key):
+        """
+        Look an entry up.
+
+        Args:
+            key (str): The entry key, see fingerprint().
+
+        Returns:
+            bytes: The cached value, or None on a miss.
+        """
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                value = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return value
+
+    def put(self, key, value):
+        """
+        Store an entry, evicting the least recently used ones if the cache gets too large.
+
+        Args:
+            key (str): The entry key, see fingerprint().
+            value (bytes): The value to cache.
+        """
+        path = self._path(key)
+        # Write to a temporary file first so that readers never see a partial entry
+        fd, temporary = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(value)
+        with self._lock:
+            if os.path.exists(path):
+                self._size -= os.path.getsize(path)
+            os.replace(temporary, path)
+            self._size += len(value)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def clear(self):
+        """
+        Remove every entry. The counters are kept.
+        """
+        with self._lock:
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith('.bin'):
+                    os.remove(entry.path)
+            self._size = 0
+
+    def _evict(self):
+        """
+        Internal method removing the least recently used entries until the cache fits in max_bytes.
+        """
+        entries = sorted((entry for entry in os.scandir(self.directory) if entry.name.endswith('.bin')),
+                         key=lambda entry: entry.stat().st_mtime)
+        for entry in entries:
+            if self._size <= self.max_bytes:
+                break
+            try:
+                size = entry.stat().st_size
+                os.remove(entry.path)
+            except FileNotFoundError:
+                continue
+            self._size -= size
+            self.evictions += 1
+
+    def _path(self, key):
+        """
+        Internal method returning the file of an entry.
+
+        Args:
+            key (str): The entry key.
+
+        Returns:
+            str: The path of the entry file.
+        """
+        return os.path.join(self.directory, f'{key}.bin')
@@ -1,7 +1,11 @@
 """rpy2_stats - A Python package for advanced statistical functions and models in python"""
 
+import numpy as np
 import rpy2.robjects as robjects
 
+import r_conversion
+from numeric_methods import IncrementalPCA, hclust_linkage, pca_scores, randomized_pca, row_chunks
+
 __version__ = '0.1.0'
 __author__ = 'Matan Carmon'
 __date__ = 'September 2023'
@@ -122,17 +126,99 @@ def arima_model(data, order=(1, 1, 1)):
     arima_result = r_arima(ts_data, order=robjects.IntVector(order))
     return arima_result
 
-def pca(data, scale=True):
-    """Perform principal component analysis (PCA) using R's prcomp function."""
-    r_prcomp = robjects.r['prcomp']
-    result = r_prcomp(data, scale=scale)
-    return result
-
-def hierarchical_clustering(data, method="complete"):
-    """Perform hierarchical clustering using R's hclust function."""
-    r_hclust = robjects.r['hclust']
-    result = r_hclust(data, method=method)
-    return result
+def pca(data, scale=True, method="full", rank=None, chunksize=100000, oversamples=10, n_iter=4, seed=None):
+    """Perform principal component analysis (PCA).
+
+    method="full" uses R's prcomp function. For data too large for it, method="randomized" computes
+    the top `rank` components by randomized truncated SVD, and method="incremental" accumulates the
+    covariance matrix over chunks of `chunksize` rows (data may also be an iterable of row chunks),
+    in memory bounded by the number of columns. Both return an R "prcomp" object with the same
+    sdev, rotation, center, scale and x fields; x is omitted when data is a one-shot iterator, and
+    with method="randomized" sdev only covers the computed components.
+    """
+    if method == "full":
+        r_prcomp = robjects.r['prcomp']
+        if rank is not None:
+            return r_prcomp(data, scale=scale, **{'rank.': rank})
+        result = r_prcomp(data, scale=scale)
+        return result
+    if method == "randomized":
+        points = np.asarray(data, dtype=float)
+        sdev, rotation, center, scales = randomized_pca(points, scale, rank or min(points.shape),
+                                                         oversamples, n_iter, seed)
+        scores = pca_scores(row_chunks(points, chunksize), rotation, center, scales)
+    elif method == "incremental":
+        chunks = row_chunks(data, chunksize) if hasattr(data, 'shape') else data
+        model = IncrementalPCA(scale=scale, rank=rank)
+        for chunk in chunks:
+            model.partial_fit(chunk)
+        model.decompose()
+        sdev, rotation, center, scales = model.sdev, model.rotation, model.center, model.scale
+        # Scores need a second pass, possible unless the chunks came from a one-shot iterator
+        reiterable = hasattr(data, 'shape') or iter(data) is not data
+        scores = pca_scores(row_chunks(data, chunksize) if hasattr(data, 'shape') else data,
+                            rotation, center, scales) if reiterable else None
+    else:
+        raise ValueError("Invalid method. Supported methods are 'full', 'randomized' and 'incremental'.")
+    names = getattr(data, 'columns', None)
+    if names is None and method == "incremental":
+        names = model.columns
+    return _prcomp_object(r_conversion.py2r(sdev), r_conversion.py2r(rotation), r_conversion.py2r(center),
+                          r_conversion.py2r(scales) if scale else False,
+                          r_conversion.py2r(scores) if scores is not None else robjects.NULL,
+                          robjects.StrVector([str(name) for name in names]) if names is not None else robjects.NULL)
+
+# Builds an R "prcomp" object from its fields, naming the rows and columns like prcomp
+_prcomp_object = robjects.r('''
+    function(sdev, rotation, center, scale, x, names) {
+        pcs <- paste0("PC", seq_len(ncol(rotation)))
+        dimnames(rotation) <- list(names, pcs)
+        if (!is.null(names)) {
+            names(center) <- names
+            if (!isFALSE(scale)) names(scale) <- names
+        }
+        result <- list(sdev = sdev, rotation = rotation, center = center, scale = scale)
+        if (!is.null(x)) {
+            colnames(x) <- pcs
+            result$x <- x
+        }
+        structure(result, class = "prcomp")
+    }
+''')
+
+def hierarchical_clustering(data, method="complete", memory_efficient=False, chunksize=10000, directory=None,
+                            dtype="float64"):
+    """Perform hierarchical clustering using R's hclust function.
+
+    hclust needs a dist object, whose n^2 / 2 distances do not fit in memory beyond about 50k rows.
+    With memory_efficient=True, data holds the observations instead and the Euclidean distances are
+    computed on the fly, in chunks of `chunksize` rows: "single" linkage uses a minimum spanning tree
+    and "ward.D2" a nearest-neighbor chain over the cluster centroids, both in O(n) memory.
+    "complete" (the default), "average", "mcquitty" and "ward.D" still need every distance: they run a
+    nearest-neighbor chain on a condensed distance matrix memory-mapped to a temporary file in
+    `directory`, of the given dtype. That file takes O(n^2) disk, n (n - 1) / 2 values like R's dist
+    object: 10 GB at 50k rows in float64, 5 GB in float32. The result is an R "hclust" object, usable
+    with cutree, plot and as.dendrogram like hclust's.
+    """
+    if not memory_efficient:
+        r_hclust = robjects.r['hclust']
+        result = r_hclust(data, method=method)
+        return result
+    merge, height, order = hclust_linkage(data, method, chunksize=chunksize, directory=directory, dtype=dtype)
+    labels = getattr(data, 'index', None)
+    return _hclust_object(r_conversion.py2r(merge), r_conversion.py2r(height), r_conversion.py2r(order),
+                          robjects.StrVector([str(label) for label in labels]) if labels is not None
+                          else robjects.NULL, method)
+
+# Builds an R "hclust" object from its fields
+_hclust_object = robjects.r('''
+    function(merge, height, order, labels, method) {
+        storage.mode(merge) <- "integer"
+        structure(list(merge = merge, height = height, order = as.integer(order), labels = labels,
+                       method = method, call = match.call(), dist.method = "euclidean"),
+                  class = "hclust")
+    }
+''')
 
 # dataframe.py
 """Module for data frame manipulation"""
@@ -0,0 +1,348 @@
+"""Sharing of DataFrames and arrays with worker processes without copying them.
+
+Pickling a DataFrame into every worker multiplies its memory by the number of
+workers. Here the numeric columns are written once, in a fixed binary layout,
+into a shared memory block (or a memory-mapped file for data larger than
+/dev/shm). Workers receive a small picklable handle and rebuild the frame as
+read-only views of that block.
+
+Layout: every column is stored contiguously, in column order, as its raw NumPy
+values, starting at a multiple of 64 bytes. Categorical columns are stored as
+their codes, with the categories kept in the handle. Columns of any other
+dtype (strings, objects) and non-numeric indexes are pickled with the handle.
+
+Example:
+    with SharedFrame(data) as shared:
+        with r_parallel.WorkerPool(4, {'data': shared.handle}) as pool:
+            ...
+    # in a worker: worker_state()['data'] is a DataFrame of views, or
+    # shared.handle.to_r() gives the R data frame
+"""
+
+import os
+import uuid
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+# Alignment of every column in the buffer, in bytes
+ALIGNMENT = 64
+
+# Dtype kinds stored in the buffer: bool, signed and unsigned integers, floats, complex, datetimes
+_SHARED_KINDS = 'biufcmM'
+
+
+def _shareable(values):
+    """
+    Tell whether an array can be stored in the buffer.
+
+    Args:
+        values (numpy.ndarray): The array.
+
+    Returns:
+        bool: True for numeric, boolean and datetime arrays.
+    """
+    return isinstance(values, np.ndarray) and values.dtype.kind in _SHARED_KINDS
+
+
+# Shared memory blocks attached in this process, by name. The views of a block refer to its
+# mapping, which SharedMemory.close() (also run when the object is garbage collected) would
+# unmap, so the block is kept here until detach() rather than tied to the handle that mapped it.
+_attached_blocks = {}
+
+
+def _attach_buffer(name, path, size):
+    """
+    Map an existing shared memory block or memory-mapped file.
+
+    Args:
+        name (str): The shared memory block name, or None for a file.
+        path (str): The memory-mapped file, or None for a shared memory block.
+        size (int): The buffer size in bytes.
+
+    Returns:
+        shared_memory.SharedMemory or numpy.memmap: The mapping. Arrays built on a memmap hold a
+            reference to it; shared memory blocks are kept in _attached_blocks until detached.
+    """
+    if path is not None:
+        return np.memmap(path, dtype=np.uint8, mode='r', shape=(size,))
+    if name not in _attached_blocks:
+        try:
+            # Only the owner unlinks the block, the worker must not track it
+            _attached_blocks[name] = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            # Before Python 3.13 attaching always tracks the block, which is harmless in workers
+            # started by multiprocessing since they share the resource tracker of the owner
+            _attached_blocks[name] = shared_memory.SharedMemory(name=name)
+    return _attached_blocks[name]
+
+
+class SharedFrameHandle:
+    """
+    Picklable description of a SharedFrame, sent to the workers in its place.
+    """
+
+    def __init__(self, name, path, size, kind, columns, index, rows):
+        """
+        Initialize the SharedFrameHandle object.
+
+        Args:
+            name (str): The shared memory block name, or None for a file.
+            path (str): The memory-mapped file, or None for a shared memory block.
+            size (int): The buffer size in bytes.
+            kind (str): 'frame', 'series' or 'array'.
+            columns (list): (name, dtype, offset, shape, extra) of every column; offset is None when
+                the values are pickled in extra, otherwise extra holds the categories, if any.
+            index: The index as a column tuple, a pickled pandas.Index, or None for a RangeIndex.
+            rows (int): Number of rows.
+        """
+        self.name = name
+        self.path = path
+        self.size = size
+        self.kind = kind
+        self.columns = columns
+        self.index = index
+        self.rows = rows
+        self._block = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_block'] = None
+        return state
+
+    def _view(self, dtype, offset, shape):
+        """
+        Internal method returning a read-only view of the buffer.
+
+        Args:
+            dtype (str): The NumPy dtype.
+            offset (int): Position of the values in the buffer, in bytes.
+            shape (tuple): Shape of the values.
+
+        Returns:
+            numpy.ndarray: The view.
+        """
+        if self._block is None:
+            self._block = _attach_buffer(self.name, self.path, self.size)
+        # The mapping outlives the handle (see _attached_blocks): dropping the handle leaves the views valid
+        buffer = self._block if self.path is not None else self._block.buf
+        view = np.frombuffer(buffer, dtype=np.dtype(dtype), count=int(np.prod(shape)),
+                             offset=offset).reshape(shape)
+        view.flags.writeable = False
+        return view
+
+    def _column(self, column):
+        """
+        Internal method rebuilding one column.
+
+        Args:
+            column (tuple): The column description, see __init__.
+
+        Returns:
+            The column values.
+        """
+        name, dtype, offset, shape, extra = column
+        if offset is None:
+            return extra
+        values = self._view(dtype, offset, shape)
+        if extra is not None:
+            return pd.Categorical.from_codes(values, categories=extra[0], ordered=extra[1], validate=False)
+        return values
+
+    def attach(self):
+        """
+        Rebuild the shared object in the current process, without copying its numeric data.
+
+        Returns:
+            pandas.DataFrame, pandas.Series or numpy.ndarray: The object, backed by read-only views
+                of the buffer (categorical codes are copied by pandas, one byte or two per row).
+        """
+        if self.kind == 'array':
+            return self._column(self.columns[0])
+        if self.index is None:
+            index = pd.RangeIndex(self.rows)
+        elif isinstance(self.index, tuple):
+            index = pd.Index(self._column(self.index[0]), name=self.index[1])
+        else:
+            index = self.index
+        if self.kind == 'series':
+            name = self.columns[0][0]
+            return pd.Series(self._column(self.columns[0]), index=index, name=name, copy=False)
+        # A dict of arrays keeps one block per column instead of copying them into a 2D block
+        return pd.DataFrame({column[0]: self._column(column) for column in self.columns},
+                            index=index, copy=False)
+
+    def to_r(self):
+        """
+        Build the R object straight from the buffer.
+
+        The values are copied once, into the R heap, with no intermediate Python copy.
+
+        Returns:
+            R object: An R data.frame for frames, a vector for series and a vector or matrix for arrays.
+        """
+        # Imported here so that processes only sharing the data never start R
+        import r_conversion
+        return r_conversion.py2r(self.attach())
+
+    def detach(self):
+        """
+        Unmap the buffer from the current process.
+
+        Every object returned by attach() must be deleted first: SharedMemory.close() raises
+        BufferError while views of the buffer remain. Memory-mapped files are unmapped with
+        their last view instead, so this only forgets the mapping.
+        """
+        self._block = None
+        if self.path is None and self.name in _attached_blocks:
+            _attached_blocks[self.name].close()
+            del _attached_blocks[self.name]
+
+
+class SharedFrame:
+    """
+    Owner of a DataFrame, Series or array written once into shared memory or a memory-mapped file.
+
+    The buffer lives until close() is called, so the owner must outlive the workers using it.
+    """
+
+    def __init__(self, data, path=None):
+        """
+        Initialize the SharedFrame object and copy the data into the buffer.
+
+        Args:
+            data (pandas.DataFrame, pandas.Series or numpy.ndarray): The data to share.
+            path (str): File to memory-map instead of using shared memory (for data larger than
+                /dev/shm). If a directory, a new file is created in it. Default is None.
+        """
+        if isinstance(data, pd.DataFrame):
+            kind, items = 'frame', list(data.items())
+        elif isinstance(data, pd.Series):
+            kind, items = 'series', [(data.name, data)]
+        else:
+            kind, items = 'array', [(None, np.asarray(data))]
+        index = None
+        if kind != 'array' and not (isinstance(data.index, pd.RangeIndex) and data.index.start == 0
+                                    and data.index.step == 1):
+            index = data.index
+
+        # Lay the columns out, then allocate the buffer once and fill it
+        layout, size = [], 0
+        entries = items + ([('__index__', index)] if index is not None else [])
+        for name, values in entries:
+            categories = None
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                categories = (values.cat.categories if isinstance(values, pd.Series) else values.categories,
+                              values.dtype.ordered)
+                values = np.asarray(values.cat.codes if isinstance(values, pd.Series) else values.codes)
+            else:
+                values = values.to_numpy() if not isinstance(values, np.ndarray) else values
+            if not _shareable(values):
+                layout.append((name, None, None, None, values, None))
+                continue
+            size = -(-size // ALIGNMENT) * ALIGNMENT
+            layout.append((name, values.dtype.str, size, values.shape, categories, values))
+            size += values.nbytes
+
+        size = max(size, 1)
+        if path is None:
+            self._block = shared_memory.SharedMemory(create=True, size=size)
+            self.name, self.path, buffer = self._block.name, None, self._block.buf
+        else:
+            if os.path.isdir(path):
+                path = os.path.join(path, f'shared_frame_{uuid.uuid4().hex}.bin')
+            self._block = np.memmap(path, dtype=np.uint8, mode='w+', shape=(size,))
+            self.name, self.path, buffer = None, path, self._block
+
+        columns = []
+        for name, dtype, offset, shape, extra, values in layout:
+            if offset is None:
+                columns.append((name, None, None, None, extra))
+                continue
+            np.ndarray(shape, dtype=values.dtype, buffer=buffer, offset=offset)[...] = values
+            columns.append((name, dtype, offset, shape, extra))
+        if self.path is not None:
+            self._block.flush()
+        if index is not None:
+            index_column = columns.pop()
+            index = (index_column, index.name) if index_column[2] is not None else index
+        self.handle = SharedFrameHandle(self.name, self.path, size, kind, columns, index, len(data))
+
+    @property
+    def nbytes(self):
+        """
+        int: Size of the buffer in bytes.
+        """
+        return self.handle.size
+
+    def close(self):
+        """
+        Release the buffer. Workers must not use the handle afterwards.
+        """
+        if self._block is None:
+            return
+        if self.path is None:
+            self._block.close()
+            self._block.unlink()
+        else:
+            del self._block
+            os.remove(self.path)
+        self._block = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def share_state(state, min_bytes=1024 ** 2, path=None):
+    """
+    Replace the large DataFrames, Series and arrays of a worker state by shared handles.
+
+    Args:
+        state (dict): The state, see r_parallel.WorkerPool.
+        min_bytes (int): Objects smaller than this are left to be pickled. Default is 1 Mb.
+        path (str): Directory for memory-mapped files instead of shared memory. Default is None.
+
+    Returns:
+        tuple: The new state and the list of SharedFrame owners to close once the workers are done.
+    """
+    shared, owners = {}, []
+    for key, value in state.items():
+        if isinstance(value, (pd.DataFrame, pd.Series, np.ndarray)) and _nbytes(value) >= min_bytes:
+            owner = SharedFrame(value, path)
+            owners.append(owner)
+            value = owner.handle
+        shared[key] = value
+    return shared, owners
+
+
+def attach_state(state):
+    """
+    Rebuild the shared objects of a worker state, see share_state().
+
+    Args:
+        state (dict): The state received by the worker.
+
+    Returns:
+        dict: The state with every handle replaced by its object.
+    """
+    return {key: value.attach() if isinstance(value, SharedFrameHandle) else value
+            for key, value in state.items()}
+
+
+def _nbytes(value):
+    """
+    Get the size of the data of a DataFrame, Series or array.
+
+    Args:
+        value: The object.
+
+    Returns:
+        int: The size in bytes.
+    """
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    return int(np.sum(value.memory_usage(index=False, deep=False)))
@@ -0,0 +1,29 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+# The adjustments run R in the workers
+pytest.importorskip('rpy2')
+import SeasonalAdjutment
+from SeasonalAdjutment import batch_seasonal_adjustment
+
+
+@pytest.mark.parametrize('freq, frequency', [('MS', 12), ('QS-JAN', 4), ('D', 7), ('2MS', 6)])
+def test_frequency_inferred_from_index(freq, frequency):
+    assert SeasonalAdjutment._index_frequency(pd.date_range('2020-01-01', periods=24, freq=freq)) == frequency
+
+
+def test_frequency_required_without_time_index():
+    with pytest.raises(ValueError, match='frequency'):
+        batch_seasonal_adjustment(pd.DataFrame({'a': np.arange(48.0)}), n_jobs=1)
+
+
+def test_batch_stl_matches_single_series():
+    t = np.arange(96)
+    index = pd.date_range('2015-01-01', periods=96, freq='MS')
+    wide = pd.DataFrame({'a': np.sin(2 * np.pi * t / 12) + 0.1 * t,
+                         'b': 2 * np.cos(2 * np.pi * t / 12) + 0.05 * t}, index=index)
+    components, failures = batch_seasonal_adjustment(wide, method='stl', n_jobs=2)
+    assert not failures
+    expected = SeasonalAdjutment.SeasonalAdjustment(wide['a'], frequency=12).seasonal_decompose()
+    np.testing.assert_allclose(components['seasonal']['a'], expected['seasonal'])
@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from numeric_methods import ChunkedDBSCAN
+
+
+def _reference_dbscan(points, eps, min_pts):
+    # Textbook DBSCAN expanding clusters from the points in index order, as dbscan::dbscan does
+    distances = np.sqrt(((points[:, None, :] - points[None, :, :]) ** 2).sum(axis=2))
+    neighbors = [np.flatnonzero(row <= eps) for row in distances]
+    core = np.array([len(members) >= min_pts for members in neighbors])
+    cluster = np.zeros(len(points), dtype=np.int64)
+    current = 0
+    for point in range(len(points)):
+        if cluster[point] or not core[point]:
+            continue
+        current += 1
+        cluster[point] = current
+        queue = [point]
+        while queue:
+            member = queue.pop()
+            for neighbor in neighbors[member]:
+                if not cluster[neighbor]:
+                    cluster[neighbor] = current
+                    if core[neighbor]:
+                        queue.append(neighbor)
+    return cluster, core
+
+
+@pytest.mark.parametrize('max_neighbors', [1, 50, 10000000])
+def test_labels_match_reference(max_neighbors):
+    rng = np.random.default_rng(0)
+    points = np.concatenate([rng.normal(center, 0.3, size=(80, 2)) for center in ([0, 0], [3, 0], [0, 3])] +
+                            [rng.uniform(-2, 5, size=(40, 2))])
+    model = ChunkedDBSCAN(eps=0.4, minPts=5, max_neighbors=max_neighbors, chunksize=37).fit(pd.DataFrame(points))
+    cluster, core = _reference_dbscan(points, 0.4, 5)
+    np.testing.assert_array_equal(model.is_core, core)
+    np.testing.assert_array_equal(model.cluster, cluster)
+
+
+def test_border_point_joins_first_expanded_cluster():
+    # The point at 1.0 is within eps of a core point of both clusters but is not core itself
+    points = np.array([[0.0], [0.1], [0.2], [1.0], [1.8], [1.9], [2.0]])
+    model = ChunkedDBSCAN(eps=0.85, minPts=4).fit(pd.DataFrame(points))
+    np.testing.assert_array_equal(model.cluster, _reference_dbscan(points, 0.85, 4)[0])
+    assert model.cluster[3] == 1
+
+
+def test_noise_only():
+    model = ChunkedDBSCAN(eps=0.1, minPts=2).fit(pd.DataFrame(np.arange(10.0)))
+    assert not model.cluster.any()
@@ -0,0 +1,31 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+# The models are fitted in R
+pytest.importorskip('rpy2')
+import ClassificationModels
+from ClassificationModels import ClassificationModels as Models
+
+
+# R gives the classes as strings, including those of numeric and logical responses
+@pytest.mark.parametrize('positive, negative, labels', [(1, 0, ('1', '0')), (True, False, ('TRUE', 'FALSE')),
+                                                        ('yes', 'no', ('yes', 'no'))])
+def test_logistic_regression_classes(positive, negative, labels):
+    rng = np.random.default_rng(0)
+    x = rng.normal(size=200)
+    target = np.where(x + rng.normal(scale=0.5, size=200) > 0, positive, negative)
+    # String classes are fitted as a factor, numbers and booleans as they are
+    data = pd.DataFrame({'x': x, 'target': pd.Categorical(target) if isinstance(positive, str) else target})
+    model = Models(data, 'target').logistic_regression()
+    predicted = ClassificationModels._predict(model, data[['x']])
+    expected = np.where(target == positive, *labels)
+    assert set(predicted) == set(labels)
+    assert np.mean(predicted == expected) > 0.7
+
+
+def test_logistic_regression_rejects_non_binary_response():
+    data = pd.DataFrame({'x': np.arange(20.0), 'target': np.linspace(0, 1, 20)})
+    model = Models(data, 'target').logistic_regression()
+    with pytest.raises(ValueError, match='binary'):
+        ClassificationModels._predict(model, data[['x']])
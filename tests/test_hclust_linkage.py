@@ -0,0 +1,93 @@
+import numpy as np
+import pytest
+from scipy.cluster.hierarchy import fcluster, linkage
+from scipy.spatial.distance import pdist, squareform
+
+import numeric_methods
+from numeric_methods import hclust_linkage
+
+# scipy names of the hclust methods it implements on Euclidean distances
+SCIPY_METHODS = {'single': 'single', 'complete': 'complete', 'average': 'average', 'mcquitty': 'weighted',
+                 'ward.D2': 'ward'}
+
+
+def _points(n=60, seed=0):
+    rng = np.random.default_rng(seed)
+    return np.concatenate([rng.normal(center, 0.5, size=(n // 3, 2)) for center in ([0, 0], [4, 0], [0, 4])])
+
+
+def _cut(merge, n, k):
+    # Cluster of every observation after the first n - k merges, numbered by first observation
+    cluster = {-(i + 1): {i} for i in range(n)}
+    for step, (a, b) in enumerate(merge[:n - k]):
+        cluster[step + 1] = cluster.pop(a) | cluster.pop(b)
+    labels = np.zeros(n, dtype=np.int64)
+    for members in cluster.values():
+        labels[list(members)] = min(members)
+    return labels
+
+
+def _same_partition(a, b):
+    return len(set(zip(a, b))) == len(set(a)) == len(set(b))
+
+
+def _lance_williams_ward_d(points):
+    # Brute-force ward.D on the unsquared distances, as R's hclust runs it
+    distances = squareform(pdist(points))
+    np.fill_diagonal(distances, np.inf)
+    sizes = np.ones(len(points))
+    heights = []
+    for _ in range(len(points) - 1):
+        x, y = np.unravel_index(np.argmin(distances), distances.shape)
+        dxy = distances[x, y]
+        heights.append(dxy)
+        merged = ((sizes + sizes[x]) * distances[x] + (sizes + sizes[y]) * distances[y] - sizes * dxy) / \
+            (sizes + sizes[x] + sizes[y])
+        distances[y], distances[:, y] = merged, merged
+        distances[y, y] = np.inf
+        distances[x], distances[:, x] = np.inf, np.inf
+        sizes[y] += sizes[x]
+    return np.array(heights)
+
+
+@pytest.mark.parametrize('method', sorted(SCIPY_METHODS))
+def test_matches_scipy(method):
+    points = _points()
+    merge, height, order = hclust_linkage(points, method, chunksize=7)
+    reference = linkage(points, SCIPY_METHODS[method])
+    np.testing.assert_allclose(height, reference[:, 2])
+    for k in (2, 3, 5):
+        assert _same_partition(_cut(merge, len(points), k), fcluster(reference, k, criterion='maxclust'))
+    assert sorted(order) == list(range(1, len(points) + 1))
+
+
+def test_ward_d_matches_lance_williams(tmp_path):
+    points = _points(30)
+    _, height, _ = hclust_linkage(points, 'ward.D', directory=str(tmp_path))
+    np.testing.assert_allclose(height, _lance_williams_ward_d(points))
+
+
+def test_merge_follows_hclust_conventions():
+    merge, height, order = hclust_linkage(np.array([[0.0], [1.0], [5.0], [5.5]]), 'single')
+    # Singletons are negative and come first, clusters are numbered by the step that formed them
+    np.testing.assert_array_equal(merge, [[-3, -4], [-1, -2], [1, 2]])
+    np.testing.assert_allclose(height, [0.5, 1.0, 4.0])
+    np.testing.assert_array_equal(order, [3, 4, 1, 2])
+
+
+def test_invalid_input():
+    with pytest.raises(ValueError, match='n >= 2'):
+        hclust_linkage(np.zeros((1, 2)), 'single')
+    with pytest.raises(ValueError, match='Invalid method'):
+        hclust_linkage(np.zeros((3, 2)), 'centroid')
+
+
+def test_condensed_rows_match_squareform():
+    points = _points(20)
+    n = len(points)
+    condensed = pdist(points)
+    square = squareform(condensed)
+    for x in (0, 7, n - 1):
+        np.testing.assert_allclose(numeric_methods._condensed_row(condensed, n, x), square[x])
+    i, j = np.triu_indices(n, k=1)
+    np.testing.assert_array_equal(numeric_methods._condensed_index(n, i, j), np.arange(len(condensed)))
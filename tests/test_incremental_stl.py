@@ -0,0 +1,36 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+# The decomposition itself runs R's stl
+pytest.importorskip('rpy2')
+from SeasonalAdjutment import IncrementalSTL
+
+
+def _series(length, period=12, seed=0):
+    rng = np.random.default_rng(seed)
+    t = np.arange(length)
+    values = 0.05 * t + 3 * np.sin(2 * np.pi * t / period) + rng.normal(scale=0.3, size=length)
+    return pd.Series(values, index=pd.RangeIndex(length))
+
+
+def test_append_matches_full_refit():
+    data = _series(240)
+    incremental = IncrementalSTL(data.iloc[:180], period=12)
+    for start in range(180, 240, 5):
+        incremental.append(data.iloc[start:start + 5])
+    full = IncrementalSTL(data, period=12).components()
+    components = incremental.components()
+
+    assert len(components) == len(data)
+    pd.testing.assert_index_equal(components.index, data.index)
+    # The revised tail sees the same neighbors as the full fit, up to the seasonal smoother
+    tail = components.iloc[-incremental.revision:]
+    assert np.abs(tail - full.iloc[-incremental.revision:]).to_numpy().max() < 0.1 * data.std()
+
+
+def test_window_must_leave_a_trend_window_of_context():
+    with pytest.raises(ValueError):
+        IncrementalSTL(_series(120), period=12, window=24, revision=20)
+    with pytest.raises(ValueError):
+        IncrementalSTL(_series(120), period=12, window=18, revision=2)
@@ -0,0 +1,45 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from numeric_methods import KNNIndex
+
+
+def _brute_force_knn(train, labels, test, k):
+    # class::knn: every point within a relative 1e-4 of the k-th squared distance votes,
+    # tied votes go here to the first class in sorted order
+    classes, codes = np.unique(labels, return_inverse=True)
+    predictions = []
+    for point in test:
+        distances = ((train - point) ** 2).sum(axis=1)
+        kth = np.sort(distances)[k - 1]
+        votes = np.bincount(codes[distances <= kth * (1 + KNNIndex.TIE_TOLERANCE)], minlength=len(classes))
+        predictions.append(classes[votes.argmax()])
+    return np.array(predictions)
+
+
+@pytest.mark.parametrize('k', [1, 3, 5, 8])
+def test_predictions_match_brute_force(k):
+    rng = np.random.default_rng(k)
+    train = pd.DataFrame(rng.normal(size=(500, 3)), columns=['a', 'b', 'c'])
+    labels = np.where(train['a'] + rng.normal(scale=0.5, size=500) > 0, 'up', 'down')
+    test = pd.DataFrame(rng.normal(size=(200, 3)), columns=['a', 'b', 'c'])
+    index = KNNIndex(train, labels)
+    np.testing.assert_array_equal(index.predict(test, k=k, chunksize=64),
+                                  _brute_force_knn(train.to_numpy(), labels, test.to_numpy(), k))
+
+
+def test_points_tied_with_the_kth_neighbor_vote():
+    # On a grid many training points are at the same distance of the queries
+    rng = np.random.default_rng(0)
+    train = pd.DataFrame(rng.integers(0, 4, size=(300, 2)).astype(float), columns=['x', 'y'])
+    labels = rng.choice(['a', 'b', 'c'], size=300)
+    test = pd.DataFrame(rng.integers(0, 4, size=(100, 2)) + 0.5, columns=['x', 'y'])
+    predicted = KNNIndex(train, labels).predict(test, k=3)
+    np.testing.assert_array_equal(predicted, _brute_force_knn(train.to_numpy(), labels, test.to_numpy(), 3))
+
+
+def test_unused_columns_are_ignored():
+    train = pd.DataFrame({'x': [0.0, 1.0, 10.0, 11.0]})
+    test = pd.DataFrame({'id': [7, 8], 'x': [0.5, 10.5]})
+    np.testing.assert_array_equal(KNNIndex(train, ['a', 'a', 'b', 'b']).predict(test, k=2), ['a', 'b'])
@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+
+from numeric_methods import MiniBatchKMeans
+
+
+def _blobs(rows=6000, seed=0):
+    rng = np.random.default_rng(seed)
+    means = np.array([[0.0, 0.0], [6.0, 0.0], [0.0, 6.0], [6.0, 6.0]])
+    labels = rng.integers(len(means), size=rows)
+    return pd.DataFrame(means[labels] + rng.normal(size=(rows, 2)), columns=['x', 'y'])
+
+
+def _chunks(data, size):
+    return [data.iloc[start:start + size] for start in range(0, len(data), size)]
+
+
+def _lloyd(points, k, seed, n_iter=100):
+    rng = np.random.default_rng(seed)
+    centers = points[rng.choice(len(points), k, replace=False)]
+    for _ in range(n_iter):
+        labels = ((points[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2).argmin(axis=1)
+        centers = np.array([points[labels == c].mean(axis=0) if (labels == c).any() else centers[c]
+                            for c in range(k)])
+    distances = ((points[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2)
+    return distances.min(axis=1).sum()
+
+
+def test_inertia_is_close_to_lloyd():
+    data = _blobs()
+    model = MiniBatchKMeans(4, batch_size=256, max_iter=200, seed=0).fit(data)
+    best_lloyd = min(_lloyd(data.to_numpy(), 4, seed) for seed in range(5))
+    assert model.tot_withinss <= 1.05 * best_lloyd
+    assert np.isclose(model.inertia(data), model.tot_withinss)
+    assert np.isclose(model.inertia(_chunks(data, 900)), model.tot_withinss)
+
+
+def test_labels_are_numbered_from_one_and_match_predict():
+    data = _blobs(rows=2000)
+    model = MiniBatchKMeans(4, batch_size=256, seed=1).fit(data)
+    assert set(model.cluster) == {1, 2, 3, 4}
+    np.testing.assert_array_equal(model.predict(data, chunksize=300), model.cluster)
+
+
+def test_predict_picks_the_nearest_center():
+    data = _blobs(rows=2000)
+    model = MiniBatchKMeans(4, seed=2).fit(data)
+    points = data.to_numpy()
+    nearest = ((points[:, None, :] - model.centers[None, :, :]) ** 2).sum(axis=2).argmin(axis=1) + 1
+    # Columns are selected by name, in the order seen when fitting
+    np.testing.assert_array_equal(model.predict(data[['y', 'x']]), nearest)
+
+
+def test_streaming_chunks_match_partial_fit():
+    data = _blobs()
+    chunks = _chunks(data, 500)
+    streamed = MiniBatchKMeans(4, batch_size=128, seed=3).fit(iter(chunks))
+    incremental = MiniBatchKMeans(4, batch_size=128, seed=3)
+    for chunk in chunks:
+        incremental.partial_fit(chunk)
+    np.testing.assert_allclose(streamed.centers, incremental.centers)
+    assert streamed.counts.sum() == len(data)
+    assert streamed.cluster is None
+    best_lloyd = min(_lloyd(data.to_numpy(), 4, seed) for seed in range(5))
+    assert streamed.inertia(iter(chunks)) <= 1.1 * best_lloyd
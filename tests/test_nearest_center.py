@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+from scipy.spatial.distance import cdist
+
+from numeric_methods import nearest_center
+
+
+@pytest.mark.parametrize('chunksize', [1, 7, 100000])
+def test_matches_brute_force(chunksize):
+    rng = np.random.default_rng(chunksize)
+    points = rng.normal(size=(500, 4))
+    medoids = points[rng.choice(500, 6, replace=False)]
+    labels, distances = nearest_center(points, medoids, chunksize)
+    full = cdist(points, medoids)
+    np.testing.assert_array_equal(labels, full.argmin(axis=1))
+    np.testing.assert_allclose(distances, full.min(axis=1), atol=1e-6)
+
+
+def test_medoids_are_assigned_to_themselves():
+    rng = np.random.default_rng(0)
+    points = rng.normal(size=(200, 3))
+    id_med = np.array([5, 80, 150])
+    labels, distances = nearest_center(points, points[id_med], chunksize=64)
+    np.testing.assert_array_equal(labels[id_med], [0, 1, 2])
+    np.testing.assert_allclose(distances[id_med], 0, atol=1e-6)
+
+
+def test_sampled_pam_cost_is_the_total_distance_to_the_medoids():
+    # SampledPAM scores every subsample's medoids by this total on the full data
+    # and reports the mean as its objective, as cluster::clara does
+    rng = np.random.default_rng(1)
+    points = np.concatenate([rng.normal(size=(100, 2)), rng.normal(10, 1, size=(100, 2))])
+    good, bad = points[[0, 150]], points[[0, 1]]
+    good_cost = nearest_center(points, good, 50)[1].sum()
+    assert good_cost < nearest_center(points, bad, 50)[1].sum()
+    assert np.isclose(good_cost, cdist(points, good).min(axis=1).sum())
@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from numeric_methods import pairwise_summaries
+
+
+def _data(rows=2000, seed=0):
+    rng = np.random.default_rng(seed)
+    a = rng.normal(size=rows)
+    data = pd.DataFrame({'a': a, 'b': 2 * a + rng.normal(size=rows), 'c': rng.uniform(-1, 1, size=rows)})
+    data.loc[::97, 'c'] = np.nan
+    return data
+
+
+def test_bin_counts_match_histogram2d():
+    data = _data()
+    tiles, _, _ = pairwise_summaries(data, bins=10)
+    complete = data.dropna()
+    for row, col in [('b', 'a'), ('c', 'a'), ('c', 'b')]:
+        expected, _, _ = np.histogram2d(complete[row], complete[col], bins=10)
+        panel = tiles[(tiles['row'] == row) & (tiles['col'] == col)]
+        assert panel['count'].sum() == len(complete)
+        np.testing.assert_array_equal(np.sort(panel['count'].to_numpy()), np.sort(expected[expected > 0]))
+
+
+def test_histograms_and_correlations():
+    data = _data()
+    _, histograms, correlations = pairwise_summaries(data, bins=10)
+    complete = data.dropna()
+    assert len(histograms) == 3 * 10
+    for column in data.columns:
+        bars = histograms[histograms['col'] == column]
+        # The tallest bar spans the range of the column
+        assert bars['ymax'].max() == pytest.approx(complete[column].max())
+        assert bars['xmin'].min() == pytest.approx(complete[column].min())
+    expected = complete.corr()
+    for _, entry in correlations.iterrows():
+        assert entry['label'] == f"Corr: {expected.loc[entry['row'], entry['col']]:.3f}"
+
+
+def test_threads_give_the_same_summaries():
+    data = _data()
+    for serial, threaded in zip(pairwise_summaries(data, 8), pairwise_summaries(data, 8, n_jobs=3)):
+        pd.testing.assert_frame_equal(serial, threaded)
+
+
+def test_needs_two_columns_and_complete_rows():
+    with pytest.raises(ValueError, match='two numeric columns'):
+        pairwise_summaries(pd.DataFrame({'a': [1.0, 2.0]}), 5)
+    with pytest.raises(ValueError, match='missing values'):
+        pairwise_summaries(pd.DataFrame({'a': [1.0, np.nan], 'b': [np.nan, 2.0]}), 5)
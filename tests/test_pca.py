@@ -0,0 +1,75 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from numeric_methods import IncrementalPCA, pca_scores, randomized_pca, row_chunks
+
+
+def _data(rows=400, seed=0):
+    rng = np.random.default_rng(seed)
+    # Decaying spectrum and large means, as in real measurements
+    latent = rng.normal(size=(rows, 6)) * np.array([10, 6, 3, 1, 0.5, 0.1])
+    return latent @ rng.normal(size=(6, 8)) + rng.normal(scale=0.01, size=(rows, 8)) + 1000
+
+
+def _reference(points, scale):
+    # prcomp: SVD of the centered (and scaled) matrix
+    center = points.mean(axis=0)
+    scales = points.std(axis=0, ddof=1) if scale else np.ones(points.shape[1])
+    _, singular_values, components = np.linalg.svd((points - center) / scales, full_matrices=False)
+    return singular_values / np.sqrt(len(points) - 1), components.T, center, scales
+
+
+def _assert_same_components(rotation, expected):
+    # Components are defined up to their sign
+    signs = np.sign((rotation * expected[:, :rotation.shape[1]]).sum(axis=0))
+    np.testing.assert_allclose(rotation * signs, expected[:, :rotation.shape[1]], atol=1e-8)
+
+
+@pytest.mark.parametrize('scale', [True, False])
+def test_randomized_matches_svd(scale):
+    points = _data()
+    sdev, rotation, center, scales = randomized_pca(points, scale, 3, oversamples=10, n_iter=4, seed=0)
+    expected = _reference(points, scale)
+    np.testing.assert_allclose(sdev, expected[0][:3], rtol=1e-8)
+    _assert_same_components(rotation, expected[1])
+    np.testing.assert_allclose(center, expected[2])
+    np.testing.assert_allclose(scales, expected[3])
+
+
+@pytest.mark.parametrize('scale', [True, False])
+def test_incremental_matches_svd(scale):
+    points = _data()
+    model = IncrementalPCA(scale=scale)
+    for chunk in row_chunks(pd.DataFrame(points), 64):
+        model.partial_fit(chunk)
+    model.decompose()
+    expected = _reference(points, scale)
+    np.testing.assert_allclose(model.sdev, expected[0], rtol=1e-6, atol=1e-9)
+    _assert_same_components(model.rotation, expected[1])
+    np.testing.assert_allclose(model.center, expected[2])
+    np.testing.assert_allclose(model.scale, expected[3])
+
+
+def test_scores_match_projection():
+    points = _data()
+    sdev, rotation, center, scales = _reference(points, True)
+    scores = pca_scores(row_chunks(points, 37), rotation, center, scales)
+    np.testing.assert_allclose(scores, (points - center) / scales @ rotation)
+    np.testing.assert_allclose(scores.std(axis=0, ddof=1), sdev)
+
+
+def test_incremental_rank_and_columns():
+    data = pd.DataFrame(_data(), columns=list('abcdefgh'))
+    model = IncrementalPCA(rank=2).partial_fit(data.iloc[:100]).partial_fit(data.iloc[100:])
+    assert model.transform(data.iloc[:5]).shape == (5, 2)
+    assert list(model.columns) == list('abcdefgh')
+
+
+def test_constant_column_cannot_be_scaled():
+    points = _data()
+    points[:, 2] = 1.0
+    with pytest.raises(ValueError, match='constant'):
+        randomized_pca(points, True, 2, oversamples=5, n_iter=2, seed=0)
+    with pytest.raises(ValueError, match='constant'):
+        IncrementalPCA().partial_fit(points).decompose()
@@ -0,0 +1,94 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import r_async
+from r_async import AsyncRunner
+
+
+def _sleep(seconds, value=None):
+    time.sleep(seconds)
+    return value
+
+
+class _Tracker:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.running = 0
+        self.peak = 0
+        self.started = []
+
+    def work(self, name, seconds):
+        with self.lock:
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+            self.started.append(name)
+        time.sleep(seconds)
+        with self.lock:
+            self.running -= 1
+        return name
+
+
+def test_concurrency_limit(monkeypatch):
+    # Several executor threads, so that only the runner limits the calls in flight
+    executor = ThreadPoolExecutor(max_workers=8)
+    monkeypatch.setattr(r_async, 'r_executor', lambda: executor)
+    tracker = _Tracker()
+
+    async def main():
+        runner = AsyncRunner(max_concurrency=3)
+        return await asyncio.gather(*(runner.call(tracker.work, i, 0.05) for i in range(10)))
+
+    assert asyncio.run(main()) == list(range(10))
+    assert tracker.peak == 3
+    executor.shutdown()
+
+
+def test_timeout():
+    async def main():
+        runner = AsyncRunner(timeout=0.05)
+        with pytest.raises(asyncio.TimeoutError):
+            await runner.call(_sleep, 0.3)
+        # A per-call timeout overrides the runner default
+        return await runner.call(_sleep, 0.01, 'done', timeout=5)
+
+    assert asyncio.run(main()) == 'done'
+
+
+def test_cancelling_a_waiting_call_withdraws_it():
+    tracker = _Tracker()
+
+    async def main():
+        runner = AsyncRunner()
+        first = asyncio.ensure_future(runner.call(tracker.work, 'first', 0.2))
+        second = asyncio.ensure_future(runner.call(tracker.work, 'second', 0))
+        await asyncio.sleep(0.05)
+        second.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await second
+        return await first
+
+    assert asyncio.run(main()) == 'first'
+    assert tracker.started == ['first']
+
+
+def test_abandoned_r_call_keeps_its_slot_until_it_returns():
+    tracker = _Tracker()
+
+    async def main():
+        runner = AsyncRunner(max_concurrency=1)
+        with pytest.raises(asyncio.TimeoutError):
+            await runner.call(tracker.work, 'slow', 0.3, timeout=0.05)
+        # The slow call still occupies the R thread: the next one waits for the slot, not in the
+        # R thread queue, so its timeout only starts once the slow call has returned
+        start = time.perf_counter()
+        result = await runner.call(tracker.work, 'next', 0, timeout=0.2)
+        return result, time.perf_counter() - start
+
+    result, waited = asyncio.run(main())
+    assert result == 'next'
+    assert waited >= 0.2
+    assert tracker.started == ['slow', 'next']
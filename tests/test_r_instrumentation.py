@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('rpy2')
+import r_instrumentation
+
+
+class _RList:
+    # Just enough of an R list for _nbytes: its SEXP type and its elements
+    typeof = r_instrumentation._VECSXP
+
+    def __init__(self, elements):
+        self.elements = elements
+
+    def __len__(self):
+        return len(self.elements)
+
+    def __iter__(self):
+        return iter(self.elements)
+
+
+class _RDoubles:
+    typeof = 14
+
+    def __init__(self, length):
+        self.length = length
+
+    def __len__(self):
+        return self.length
+
+
+@pytest.fixture(autouse=True)
+def _restore():
+    yield
+    r_instrumentation.disable()
+    assert not r_instrumentation.enabled()
+
+
+def test_overlapping_profiles_keep_the_instrumentation_until_the_last_exits():
+    first, second = r_instrumentation.profile(), r_instrumentation.profile()
+    first.__enter__()
+    second.__enter__()
+    # Exited out of order, as blocks running in different threads can be
+    first.__exit__(None, None, None)
+    assert r_instrumentation.enabled()
+    second.__exit__(None, None, None)
+    assert not r_instrumentation.enabled()
+
+
+def test_profile_leaves_an_enabled_instrumentation_on():
+    r_instrumentation.enable()
+    with r_instrumentation.profile():
+        pass
+    assert r_instrumentation.enabled()
+
+
+def test_disable_waits_for_open_profiles():
+    r_instrumentation.enable()
+    with r_instrumentation.profile():
+        r_instrumentation.disable()
+        assert r_instrumentation.enabled()
+    assert not r_instrumentation.enabled()
+
+
+def test_lists_are_walked_only_when_asked():
+    frame = _RList([_RDoubles(1000), _RDoubles(500)])
+    assert r_instrumentation._nbytes(frame) == 2 * 8
+    assert r_instrumentation._nbytes(frame, depth=1) == 1500 * 8
+    assert r_instrumentation._nbytes(np.zeros(10)) == 80
@@ -0,0 +1,32 @@
+import numpy as np
+
+import r_parallel
+
+
+def _inner_job(value):
+    return r_parallel.worker_state()['offset'] + value
+
+
+def _outer_job(value):
+    # A job starting an in-process pool of its own, as nested helpers do
+    with r_parallel.WorkerPool(1, {'offset': 100}) as pool:
+        inner = pool.map(_inner_job, [value])[0]
+    return r_parallel.worker_state()['scale'] * value, inner
+
+
+def test_in_process_pool_runs_jobs_with_its_state():
+    with r_parallel.WorkerPool(1, {'offset': 10}) as pool:
+        assert pool.map(_inner_job, range(3)) == [10, 11, 12]
+    assert r_parallel.worker_state() == {}
+
+
+def test_nested_in_process_pool_restores_outer_state():
+    with r_parallel.WorkerPool(1, {'scale': 2}) as pool:
+        assert pool.map(_outer_job, [1, 2]) == [(2, 101), (4, 102)]
+        assert r_parallel.worker_state() == {'scale': 2}
+    assert r_parallel.worker_state() == {}
+
+
+def test_imap_keeps_job_order():
+    with r_parallel.WorkerPool(1, {'offset': 0}) as pool:
+        assert list(pool.imap(_inner_job, iter(np.arange(5)))) == list(range(5))
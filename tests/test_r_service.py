@@ -0,0 +1,49 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# The workers import rpy2 at start
+pytest.importorskip('rpy2')
+import r_service
+
+# Number of objects built in the current worker
+_built = []
+
+
+class Summary:
+    def __init__(self, data):
+        _built.append(len(data))
+        self.data = data
+
+    def total(self, column):
+        return float(self.data[column].sum()), len(_built), os.getpid()
+
+
+@pytest.fixture(scope='module')
+def pool():
+    with r_service.RWorkerPool(n_workers=1, modules=['test_r_service']) as pool:
+        yield pool
+
+
+def test_proxy_builds_its_object_once_per_worker(pool):
+    data = pd.DataFrame({'x': np.arange(1000.0)})
+    summary = pool.proxy('test_r_service.Summary', data)
+    results = [summary.total('x') for _ in range(3)]
+    assert [result[0] for result in results] == [data['x'].sum()] * 3
+    built = [result[1] for result in results]
+    assert built[1] == built[2] == built[0]
+
+
+def test_dropped_objects_are_built_again(pool):
+    first = pool.proxy('test_r_service.Summary', pd.DataFrame({'x': [1.0, 2.0]}))
+    total, before, _ = first.total('x')
+    assert total == 3.0
+    for i in range(r_service._CACHED_OBJECTS):
+        assert pool.proxy('test_r_service.Summary', pd.DataFrame({'x': [float(i)]})).total('x')[0] == i
+    # The worker dropped the first object and asks for its arguments again
+    total, built, _ = first.total('x')
+    assert total == 3.0
+    assert built == before + r_service._CACHED_OBJECTS + 1
+    assert pool.stats['errors'] == 0
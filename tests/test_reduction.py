@@ -0,0 +1,94 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from numeric_methods import bin_2d, histogram, kde, lttb
+
+
+def test_bin_2d_counts_and_drops_missing():
+    rng = np.random.default_rng(0)
+    x = pd.Series(rng.uniform(size=500), name='x')
+    y = pd.Series(rng.uniform(size=500), name='y')
+    y[::50] = np.nan
+    binned = bin_2d(x, y, 5)
+    assert list(binned.columns) == ['x', 'y', 'count']
+    assert binned['count'].sum() == y.notna().sum()
+    expected, _, _ = np.histogram2d(x[y.notna()], y.dropna(), bins=5)
+    assert sorted(binned['count']) == sorted(expected[expected > 0].astype(int))
+
+
+def test_lttb_keeps_endpoints_with_increasing_indices():
+    rng = np.random.default_rng(1)
+    x = pd.Series(np.arange(10000.0))
+    y = pd.Series(np.cumsum(rng.normal(size=10000)))
+    kept = lttb(x, y, 200)
+    assert len(kept) == 200
+    assert kept[0] == 0 and kept[-1] == 9999
+    assert np.all(np.diff(kept) > 0)
+
+
+def test_lttb_keeps_a_spike():
+    y = np.zeros(1000)
+    y[437] = 50.0
+    kept = lttb(pd.Series(np.arange(1000.0)), pd.Series(y), 20)
+    assert 437 in kept
+
+
+def test_lttb_small_series_are_kept_whole():
+    x = pd.Series(np.arange(10.0))
+    assert np.array_equal(lttb(x, x, 50), np.arange(10))
+
+
+def test_lttb_accepts_time_zone_aware_datetimes():
+    times = pd.Series(pd.date_range('2024-01-01', periods=1000, freq='h', tz='Europe/Paris'))
+    y = pd.Series(np.sin(np.arange(1000) / 20.0))
+    naive = lttb(pd.Series(times.dt.tz_convert('UTC').dt.tz_localize(None)), y, 50)
+    assert np.array_equal(lttb(times, y, 50), naive)
+
+
+def test_histogram_default_bins_are_centered_on_the_range():
+    x = pd.Series(np.linspace(0.0, 29.0, 300), name='v')
+    counts = histogram(x)
+    assert len(counts) == 30
+    assert np.allclose(counts['v'], np.arange(30.0))
+    assert np.allclose(counts['xmax'] - counts['xmin'], 1.0)
+    assert counts['count'].sum() == 300
+
+
+def test_histogram_binwidth_and_boundary():
+    x = pd.Series(np.arange(11.0), name='v')
+    counts = histogram(x, binwidth=1)
+    assert np.allclose(counts['xmin'], np.arange(11.0) - 0.5)
+    assert list(counts['count']) == [1] * 11
+    # Right-closed bins (0, 2], (2, 4], ... with the lowest value included in the first one
+    counts = histogram(x, binwidth=2, boundary=0)
+    assert np.allclose(counts['xmin'], [0, 2, 4, 6, 8])
+    assert list(counts['count']) == [3, 2, 2, 2, 2]
+    counts = histogram(x, binwidth=2, boundary=0, closed='left')
+    assert list(counts['count']) == [2, 2, 2, 2, 3]
+
+
+def test_histogram_breaks_drop_values_outside():
+    x = pd.Series([0.5, 1.5, 1.5, 2.5, 9.0, np.nan], name='v')
+    counts = histogram(x, breaks=[0, 1, 2, 3])
+    assert list(counts['count']) == [1, 2, 1]
+    assert np.allclose(counts['v'], [0.5, 1.5, 2.5])
+
+
+def test_histogram_rejects_unknown_closed():
+    with pytest.raises(ValueError):
+        histogram(pd.Series([1.0, 2.0]), closed='both')
+
+
+def test_kde_matches_the_exact_gaussian_sum():
+    rng = np.random.default_rng(2)
+    values = np.concatenate([rng.normal(size=3000), rng.normal(4, 0.5, size=1000)])
+    estimate = kde(pd.Series(values, name='v'))
+    sd = values.std(ddof=1)
+    iqr = np.subtract(*np.percentile(values, [75, 25]))
+    bandwidth = 0.9 * min(sd, iqr / 1.34) * len(values) ** -0.2
+    points = np.linspace(values.min() - 3 * bandwidth, values.max() + 3 * bandwidth, 512)
+    assert np.allclose(estimate['v'], points)
+    exact = (np.exp(-0.5 * ((points[:, None] - values[None, :]) / bandwidth) ** 2).sum(axis=1)
+             / (len(values) * bandwidth * np.sqrt(2 * np.pi)))
+    assert np.abs(estimate['density'] - exact).max() < 1e-2 * exact.max()
@@ -0,0 +1,100 @@
+import pickle
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from result_cache import DiskCache, fingerprint
+
+
+def _series():
+    index = pd.date_range('2020-01-01', periods=48, freq='MS')
+    return pd.Series(np.sin(np.arange(48.0)), index=index, name='sales')
+
+
+def test_hit_returns_the_same_frame(tmp_path):
+    cache = DiskCache(str(tmp_path))
+    frame = pd.DataFrame({'trend': np.arange(5.0), 'label': list('abcde')},
+                         index=pd.date_range('2021-01-01', periods=5, freq='D'))
+    key = fingerprint(frame, 'seasonal_decompose')
+    assert cache.get(key) is None
+    cache.put(key, pickle.dumps(frame))
+    pd.testing.assert_frame_equal(pickle.loads(cache.get(key)), frame)
+
+
+def test_key_changes_with_values_index_frequency_and_method():
+    series = _series()
+    key = fingerprint(series, 12, 'seasonal_decompose')
+    assert fingerprint(series.copy(), 12, 'seasonal_decompose') == key
+    changed = series.copy()
+    changed.iloc[3] += 1e-9
+    assert fingerprint(changed, 12, 'seasonal_decompose') != key
+    shifted = series.copy()
+    shifted.index = pd.date_range('2020-02-01', periods=48, freq='MS')
+    assert fingerprint(shifted, 12, 'seasonal_decompose') != key
+    # Same timestamps, without a declared index frequency
+    unset = series.copy()
+    unset.index = pd.DatetimeIndex(list(series.index))
+    assert fingerprint(unset, 12, 'seasonal_decompose') != key
+    assert fingerprint(series, 4, 'seasonal_decompose') != key
+    assert fingerprint(series, 12, 'census_x13_arima') != key
+    assert fingerprint(series.rename('revenue'), 12, 'seasonal_decompose') != key
+
+
+def test_parts_are_length_prefixed():
+    assert fingerprint(b'ab', b'c') != fingerprint(b'a', b'bc')
+    assert fingerprint(np.arange(4.0)) != fingerprint(np.arange(4.0).reshape(2, 2))
+
+
+def test_least_recently_used_entry_is_evicted_after_a_get(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=300)
+    for key in ('a', 'b', 'c'):
+        cache.put(key, bytes(100))
+        time.sleep(0.01)
+    assert cache.get('a') is not None
+    time.sleep(0.01)
+    cache.put('d', bytes(100))
+    assert cache.get('b') is None
+    assert all(cache.get(key) is not None for key in ('a', 'c', 'd'))
+    assert cache.evictions == 1
+
+
+def test_stats(tmp_path):
+    cache = DiskCache(str(tmp_path))
+    assert cache.stats() == {'hits': 0, 'misses': 0, 'hit_rate': 0.0, 'evictions': 0, 'size_bytes': 0}
+    cache.put('a', bytes(10))
+    cache.put('a', bytes(30))
+    cache.get('a')
+    cache.get('a')
+    cache.get('b')
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['size_bytes']) == (2, 1, 30)
+    assert stats['hit_rate'] == pytest.approx(2 / 3)
+    # Entries and their size survive reopening the directory, the counters do not
+    assert DiskCache(str(tmp_path)).stats()['size_bytes'] == 30
+    cache.clear()
+    assert cache.stats()['size_bytes'] == 0 and cache.get('a') is None
+
+
+def test_seasonal_adjustment_results_are_cached(tmp_path):
+    SeasonalAdjutment = pytest.importorskip('SeasonalAdjutment')
+    calls = []
+
+    class Adjustment:
+        def __init__(self, data, frequency):
+            self.data, self.frequency, self.cache = data, frequency, DiskCache(str(tmp_path))
+
+        @SeasonalAdjutment._cached
+        def decompose(self, robust=False):
+            calls.append(robust)
+            return self.data * 2
+
+    series = _series()
+    adjustment = Adjustment(series, 12)
+    pd.testing.assert_series_equal(adjustment.decompose(), series * 2)
+    pd.testing.assert_series_equal(adjustment.decompose(robust=False), series * 2)
+    assert calls == [False]
+    adjustment.decompose(robust=True)
+    Adjustment(series, 4).decompose()
+    assert calls == [False, True, False]
@@ -0,0 +1,63 @@
+import gc
+import pickle
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import shared_frames
+
+
+def _frame(rows=1000):
+    rng = np.random.default_rng(0)
+    return pd.DataFrame({'x': rng.normal(size=rows),
+                         'n': np.arange(rows),
+                         'label': pd.Categorical(rng.choice(['a', 'b'], size=rows)),
+                         'name': [f'row{i}' for i in range(rows)]},
+                        index=np.arange(rows) * 2)
+
+
+def test_attach_round_trip():
+    data = _frame()
+    with shared_frames.SharedFrame(data) as shared:
+        pd.testing.assert_frame_equal(pickle.loads(pickle.dumps(shared.handle)).attach(), data)
+
+
+def test_attach_round_trip_memory_mapped(tmp_path):
+    data = _frame()
+    with shared_frames.SharedFrame(data, path=str(tmp_path)) as shared:
+        pd.testing.assert_frame_equal(pickle.loads(pickle.dumps(shared.handle)).attach(), data)
+
+
+def test_views_outlive_the_handle():
+    data = _frame()
+    state, owners = shared_frames.share_state({'data': data, 'points': data[['x']].to_numpy()}, min_bytes=1)
+    attached = shared_frames.attach_state(pickle.loads(pickle.dumps(state)))
+    # Nothing but the rebuilt objects refers to the mapping anymore
+    del state
+    gc.collect()
+    assert attached['data']['x'].sum() == data['x'].sum()
+    assert attached['points'].sum() == data['x'].sum()
+    pd.testing.assert_frame_equal(attached['data'], data)
+    for owner in owners:
+        owner.close()
+
+
+def test_views_are_read_only():
+    with shared_frames.SharedFrame(np.arange(10.0)) as shared:
+        values = shared.handle.attach()
+        assert not values.flags.writeable
+
+
+def test_detach_unmaps_once_views_are_gone():
+    with shared_frames.SharedFrame(np.arange(10.0)) as shared:
+        handle = pickle.loads(pickle.dumps(shared.handle))
+        values = handle.attach()
+        assert shared.name in shared_frames._attached_blocks
+        with pytest.raises(BufferError):
+            handle.detach()
+        assert values.sum() == 45.0
+        del values
+        gc.collect()
+        handle.detach()
+        assert shared.name not in shared_frames._attached_blocks
@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+from numeric_methods import silhouette
+
+
+def _brute_force_silhouette(points, labels):
+    # cluster::silhouette: s(i) = (b - a) / max(a, b), 0 for points alone in their cluster
+    widths = []
+    for i, point in enumerate(points):
+        distances = np.sqrt(((points - point) ** 2).sum(axis=1))
+        own = labels == labels[i]
+        if own.sum() == 1:
+            widths.append(0.0)
+            continue
+        a = distances[own].sum() / (own.sum() - 1)
+        b = min(distances[labels == other].mean() for other in np.unique(labels) if other != labels[i])
+        widths.append((b - a) / max(a, b))
+    return np.mean(widths)
+
+
+@pytest.mark.parametrize('k', [2, 3, 5])
+def test_matches_brute_force(k):
+    rng = np.random.default_rng(k)
+    points = rng.normal(size=(300, 3))
+    labels = rng.integers(1, k + 1, size=300)
+    assert np.isclose(silhouette(points, labels), _brute_force_silhouette(points, labels))
+
+
+def test_singletons_count_as_zero():
+    points = np.array([[0.0, 0.0], [0.1, 0.0], [5.0, 5.0]])
+    labels = np.array([1, 1, 2])
+    assert np.isclose(silhouette(points, labels), _brute_force_silhouette(points, labels))
+    assert 0 < silhouette(points, labels) < 1
+
+
+def test_well_separated_clusters_score_close_to_one():
+    rng = np.random.default_rng(0)
+    points = np.concatenate([rng.normal(size=(100, 2)), rng.normal(100, 1, size=(100, 2))])
+    labels = np.repeat(['a', 'b'], 100)
+    assert silhouette(points, labels) > 0.95
+
+
+def test_single_cluster_scores_zero():
+    assert silhouette(np.random.default_rng(0).normal(size=(10, 2)), np.ones(10)) == 0.0